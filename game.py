@@ -1,33 +1,202 @@
-from src.db import DBHandler
-from src.menu import MainMenu
-from src.robots import RobotManager
-from src.users import PwdManager, UserManager
-from src.utils import theme
+import argparse
+import asyncio
+import importlib
+import sys
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Awaitable, Dict, Optional
 
+from src import metrics
+from src.config import DB_FILE
+from src.server import DEFAULT_HOST, GameServer
+from src.utils import USERNAME_PROMPT, PacingClock, SessionClosed, ask, set_clock, theme
+
+# Services set up by Game on first use, in this order.
+SERVICES = ('db_handler', 'fight_archive', 'pwd_manager', 'robot_manager', 'matchmaker',
+            'user_manager')
+
+
+class StartupProfile:
+    """
+    Time of the startup phases, in seconds since the profile was created.
+
+    Interpreter start and imports of the game script come before,
+    the startup benchmark measures them from process start.
+    """
 
-class Game:
     def __init__(self) -> None:
-        self.db_handler = DBHandler()
-        self.pwd_manager = PwdManager()
-        self.robot_manager = RobotManager()
-        self.user_manager = UserManager(self.db_handler,
-                                self.pwd_manager,
-                                self.robot_manager)
-        self.user = self.user_manager.read_username()
-        self.main_menu = MainMenu(self.user, self.robot_manager)
-        theme()
-
-    def run(self):
-        """Game flow sequence."""
-        self.main_menu.present_menu()
+        self.start = time.perf_counter()
+        self.phases: Dict[str, float] = {}
+        self.lock = threading.Lock()
+
+    def mark(self, phase: str) -> None:
+        """Record the phase reached now, only its first time."""
+        with self.lock:
+            self.phases.setdefault(phase, time.perf_counter() - self.start)
+
+    def report(self) -> str:
+        """Return the phases in order of time."""
+        with self.lock:
+            return ''.join(f'  {phase:<24}{seconds * 1000:>9.1f} ms\n'
+                           for phase, seconds in sorted(self.phases.items(),
+                                                        key=lambda item: item[1]))
+
+
+class Game:
+    """
+    Services shared by all the sessions of the game.
+
+    Nothing is set up on start, so the first prompt shows right away.
+    warm_up loads the services (DB, password hashing, build catalog)
+    in a background thread while the player reads it, sessions await
+    ready before using them. Otherwise they are loaded on first access.
+    """
+
+    def __init__(self, db_file: str = DB_FILE) -> None:
+        self.db_file = db_file
+        self.profile = StartupProfile()
+        self._lock = threading.Lock()
+        self._loaded: Future = Future()
+        self._warm_up: Optional[threading.Thread] = None
+
+    def __getattr__(self, name: str) -> Any:
+        if name in SERVICES:
+            self.load()
+            return self.__dict__[name]
+        raise AttributeError(name)
+
+    def load(self) -> None:
+        """Set up the services, once, importing their modules only now."""
+        with self._lock:
+            if self._loaded.done():
+                return
+            try:
+                from src.archive import FightArchive
+                from src.db import DBHandler
+                from src.matchmaking import Matchmaker
+                from src.robots import RobotManager
+                from src.users import PwdManager, UserManager
+
+                self.profile.mark('services imported')
+                self.db_handler = DBHandler(self.db_file)
+                self.fight_archive = FightArchive(self.db_handler)
+                self.pwd_manager = PwdManager()
+                self.robot_manager = RobotManager()
+                self.matchmaker = Matchmaker(self.db_handler.conn, self.robot_manager)
+                self.user_manager = UserManager(self.db_handler,
+                                        self.pwd_manager,
+                                        self.robot_manager)
+            except BaseException as error:
+                self._loaded.set_exception(error)
+                raise
+            self.profile.mark('services ready')
+            self._loaded.set_result(None)
+
+    def warm_up(self) -> None:
+        """Start loading the services and warming the build catalog in background."""
+        if self._warm_up is None:
+            self._warm_up = threading.Thread(target=self._warm, name='warm-up', daemon=True)
+            self._warm_up.start()
+
+    async def ready(self) -> None:
+        """Wait until the services are loaded, without blocking other sessions."""
+        self.warm_up()
+        await asyncio.wrap_future(self._loaded)
+
+    def _warm(self) -> None:
+        """Load the services and the game flow, then calibrate hashing and solve the shop odds."""
+        try:
+            self.load()
+        except BaseException:
+            return
+        importlib.import_module('src.menu')
+        self.pwd_manager.cost  # calibrated on first use
+        self.robot_manager.warm_up()
+        self.profile.mark('catalog warm')
+
+    async def play(self) -> None:
+        """Game flow sequence on the console of the session, until the player quits."""
+        try:
+            self.warm_up()
+            self.profile.mark('first prompt')
+            username = await ask(USERNAME_PROMPT)
+            await self.ready()
+            from src.menu import MainMenu
+
+            user = await self.user_manager.read_username(username)
+            main_menu = MainMenu(user, self.robot_manager, self.fight_archive, self.matchmaker)
+            await theme()
+            await main_menu.present_menu()
+        except SessionClosed:
+            pass
+
+    def close(self) -> None:
+        """Write the archived fights still queued, if the services were loaded at all."""
+        if self._loaded.done() and not self._loaded.exception():
+            self.fight_archive.close()
+
+
+async def exporting(session: Awaitable[None], metrics_file: Optional[str],
+                    host: str, metrics_port: Optional[int]) -> None:
+    """Run the game, exporting the metrics alongside when instrumented."""
+    if not metrics.enabled():
+        await session
+        return
+    exporter = asyncio.create_task(metrics.export(metrics_file, host, metrics_port))
+    try:
+        await session
+    finally:
+        exporter.cancel()
+
 
 def main():
     """Main function running the game."""
+    parser = argparse.ArgumentParser(description='CyberPit - text-based robot fights.')
+    parser.add_argument('--pace', type=float, default=1.0,
+                        help='pacing of the game, 1 real time, 0.5 twice as fast, 0 no pauses')
+    parser.add_argument('--db', default=DB_FILE,
+                        help=f'path to the game database, ":memory:" for a throwaway one '
+                             f'(default {DB_FILE})')
+    parser.add_argument('--serve', type=int, metavar='PORT',
+                        help='host the game for telnet clients on the port')
+    parser.add_argument('--host', default=DEFAULT_HOST,
+                        help=f'interface to serve on (default {DEFAULT_HOST})')
+    parser.add_argument('--metrics', metavar='FILE',
+                        help='time the hot paths, metrics written to FILE in Prometheus format')
+    parser.add_argument('--metrics-port', type=int, metavar='PORT',
+                        help='time the hot paths, metrics served for scraping on the port')
+    parser.add_argument('--profile', metavar='FILE',
+                        help='let sessions turn on sampling profiler by the "profile" action, '
+                             'folded stacks written to FILE')
+    parser.add_argument('--startup-profile', action='store_true',
+                        help='print time of the startup phases on exit')
+    args = parser.parse_args()
+    set_clock(PacingClock(args.pace))
+    if args.metrics or args.metrics_port:
+        metrics.enable()
+    metrics.profiler.output = args.profile
+    game = Game(args.db)
+    game.warm_up()
     try:
-        game = Game()
-        game.run()
+        session = (GameServer(game.play, args.host, args.serve).serve() if args.serve
+                   else game.play())
+        asyncio.run(exporting(session, args.metrics, args.host, args.metrics_port))
     except KeyboardInterrupt:
         print('\nYou pressed a magic combination of keys (ctrl + c), quitting the game...')
+    except Exception as error:
+        from src.db import DBError  # loaded with the services by now
+        if not isinstance(error, DBError):
+            raise
+        print(f'ERROR: {error}', error.__cause__ or '', sep='\n')
+        exit(5)
+    finally:
+        game.close()
+        if args.metrics:
+            metrics.registry.write(args.metrics)
+        metrics.profiler.write()
+        if args.startup_profile:
+            print('Startup profile:', game.profile.report(), sep='\n', end='', file=sys.stderr)
 
 if __name__ == '__main__':
     main()
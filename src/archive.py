@@ -0,0 +1,127 @@
+import atexit
+import threading
+import time
+import zlib
+from dataclasses import dataclass
+from typing import List, Optional, Tuple
+
+from src.db import DBHandler
+from src.events import FightLog
+
+FIGHT_TABLE = 'fights'
+# Seconds a saved fight waits for the batch to fill before it is written anyway.
+FLUSH_INTERVAL = 5.0
+
+
+@dataclass
+class FightRecord:
+    """Archived fight without its events."""
+    fight_id: int
+    user: str
+    player_build: str
+    opponent_build: str
+    played: float
+    outcome: str
+
+    def __str__(self) -> str:
+        played = time.strftime('%Y-%m-%d %H:%M', time.localtime(self.played))
+        return (f'#{self.fight_id:<6} {played}  {self.player_build:>8} vs '
+                f'{self.opponent_build:<8} {self.outcome}')
+
+
+class FightArchive:
+    """
+    Fights saved for replay in their own table, events zlib compressed.
+
+    Fights are indexed by user and by build pair, both with the time
+    of the fight. Saved fights are buffered and written in batches,
+    when full or after the flush interval. Pending ones are flushed
+    before any read, on close and on exit of the process.
+    """
+
+    def __init__(self, db_handler: DBHandler, batch_size: int = 20,
+                 flush_interval: float = FLUSH_INTERVAL, table: str = FIGHT_TABLE) -> None:
+        self.db_handler = db_handler
+        self.conn = db_handler.conn
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.table = table
+        self.pending: List[Tuple[str, str, str, float, str, bytes]] = []
+        self._timer: Optional[threading.Timer] = None
+        self.db_handler._write('creating fights db table', self._create_table)
+        atexit.register(self.close)
+
+    def _create_table(self) -> None:
+        """Create the fights table with its indexes, if not there yet."""
+        with self.conn:
+            self.conn.execute(f'CREATE TABLE IF NOT EXISTS {self.table} '
+                              '(id INTEGER PRIMARY KEY, user TEXT NOT NULL, '
+                              'player_build TEXT NOT NULL, opponent_build TEXT NOT NULL, '
+                              'played REAL NOT NULL, outcome TEXT NOT NULL, '
+                              'events BLOB NOT NULL);')
+            self.conn.execute(f'CREATE INDEX IF NOT EXISTS {self.table}_user '
+                              f'ON {self.table} (user, played);')
+            self.conn.execute(f'CREATE INDEX IF NOT EXISTS {self.table}_builds '
+                              f'ON {self.table} (player_build, opponent_build, played);')
+
+    def save(self, user: str, player_build: str, opponent_build: str,
+             outcome: str, log: FightLog, played: Optional[float] = None) -> None:
+        """Queue the fight, write the batch when full or after the flush interval."""
+        self.pending.append((user, player_build, opponent_build,
+                             time.time() if played is None else played,
+                             outcome, zlib.compress(log.to_bytes())))
+        if len(self.pending) >= self.batch_size:
+            self.flush()
+        elif self._timer is None:
+            # Flushed in the DB thread, as all the other calls.
+            self._timer = threading.Timer(self.flush_interval, self.db_handler.submit,
+                                          (self.flush,))
+            self._timer.daemon = True
+            self._timer.start()
+
+    def flush(self) -> None:
+        """Write all queued fights in one transaction."""
+        if self._timer:
+            self._timer.cancel()
+            self._timer = None
+        if not self.pending:
+            return
+        def write() -> None:
+            with self.conn:
+                self.conn.executemany(f'INSERT INTO {self.table} (user, player_build, '
+                                      'opponent_build, played, outcome, events) '
+                                      'VALUES (?, ?, ?, ?, ?, ?)', self.pending)
+        self.db_handler._write('archiving fights', write)
+        self.pending.clear()
+
+    def recent(self, user: str, limit: int = 10) -> List[FightRecord]:
+        """Return last fights of the user, newest first."""
+        self.flush()
+        cursor = self.conn.execute(f'SELECT id, user, player_build, opponent_build, '
+                                   f'played, outcome FROM {self.table} '
+                                   'WHERE user = ? ORDER BY played DESC LIMIT ?',
+                                   (user, limit))
+        return [FightRecord(*row) for row in cursor]
+
+    def by_builds(self, player_build: str, opponent_build: str,
+                  limit: int = 10) -> List[FightRecord]:
+        """Return last fights of the build pair, newest first."""
+        self.flush()
+        cursor = self.conn.execute(f'SELECT id, user, player_build, opponent_build, '
+                                   f'played, outcome FROM {self.table} '
+                                   'WHERE player_build = ? AND opponent_build = ? '
+                                   'ORDER BY played DESC LIMIT ?',
+                                   (player_build, opponent_build, limit))
+        return [FightRecord(*row) for row in cursor]
+
+    def load(self, fight_id: int) -> Optional[FightLog]:
+        """Return event log of the fight, None if there is no such fight."""
+        self.flush()
+        row = self.conn.execute(f'SELECT events FROM {self.table} WHERE id = ?',
+                                (fight_id,)).fetchone()
+        return FightLog.from_bytes(zlib.decompress(row[0])) if row else None
+
+    def close(self) -> None:
+        """Write the fights still queued, also called on exit of the process."""
+        self.flush()
+        atexit.unregister(self.close)
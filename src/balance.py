@@ -0,0 +1,298 @@
+import argparse
+import hashlib
+import json
+import math
+import os
+import random
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple, Union
+
+from src import pit, policies
+from src.robots import PATH_TO_BUILDS, Robot
+
+BuildData = Dict[str, Union[str, int, List[str]]]
+Builds = Dict[str, BuildData]
+
+PATH_TO_BALANCE_CACHE = 'data/cache/balance.json'
+PATH_TO_PROPOSAL = 'data/builds.proposed.json'
+OUTCOMES = (pit.Outcome.WIN, pit.Outcome.DRAW, pit.Outcome.LOSS)
+
+# Tuned attributes with their (lowest, highest, largest mutation step).
+PARAMETERS = {
+    'health': (5, 50, 3),
+    'energy': (10, 50, 3),
+    'dodge_chance': (0, 50, 5),
+    'miss_chance': (0, 50, 5),
+}
+# Target score (win + half of draws) of the cheapest and the dearest build,
+# linear in cost in between.
+TARGET_LOW = 0.4
+TARGET_HIGH = 0.6
+# Weight of a score dropping while the cost grows.
+MONOTONIC_WEIGHT = 10.0
+# Confidence (z) of the early stopping bounds.
+Z_SCORE = 3.0
+
+
+def target_scores(builds: Builds) -> Dict[str, float]:
+    """Return target score of every build, by its cost."""
+    costs = {name: int(data['cost']) for name, data in builds.items()}  # type: ignore
+    low, high = min(costs.values()), max(costs.values())
+    if low == high:
+        return {name: (TARGET_LOW + TARGET_HIGH) / 2 for name in builds}
+    return {name: TARGET_LOW + (TARGET_HIGH - TARGET_LOW) * (cost - low) / (high - low)
+            for name, cost in costs.items()}
+
+
+@dataclass
+class Evaluation:
+    """
+    Simulated results of the candidate, [wins, draws, losses] per build.
+
+    Stopped is set when the evaluation was cut short, the candidate
+    being significantly worse than the best loss at the time, the bound.
+    """
+    counts: Dict[str, List[int]]
+    stopped: bool = False
+    bound: float = math.inf
+
+    def scores(self) -> Dict[str, Tuple[float, float]]:
+        """Return (score, standard error) of every build."""
+        scores = {}
+        for name, (wins, draws, losses) in self.counts.items():
+            fights = max(wins + draws + losses, 1)
+            score = (wins + draws / 2) / fights
+            scores[name] = (score, math.sqrt(max(score * (1 - score), 1 / fights) / fights))
+        return scores
+
+    def loss(self, builds: Builds, margin: float = 0.0) -> float:
+        """
+        Return distance of the scores from the target curve.
+
+        With margin (z-score) the scores are moved by that many standard
+        errors towards the target, returning the lowest plausible loss.
+        """
+        targets = target_scores(builds)
+        scores = self.scores()
+        loss = 0.0
+        for name, (score, error) in scores.items():
+            loss += max(0.0, abs(score - targets[name]) - margin * error) ** 2
+        by_cost = sorted(scores, key=lambda name: (int(builds[name]['cost']),  # type: ignore
+                                                   targets[name]))
+        for cheaper, dearer in zip(by_cost, by_cost[1:]):
+            if builds[cheaper]['cost'] == builds[dearer]['cost']:
+                continue
+            drop = ((scores[cheaper][0] - margin * scores[cheaper][1])
+                    - (scores[dearer][0] + margin * scores[dearer][1]))
+            loss += MONOTONIC_WEIGHT * max(0.0, drop) ** 2
+        return loss / len(scores)
+
+    def monotonic(self, builds: Builds) -> bool:
+        """Return True if the score never drops as the cost grows."""
+        scores = self.scores()
+        by_cost = sorted(scores, key=lambda name: int(builds[name]['cost']))  # type: ignore
+        return all(scores[cheaper][0] <= scores[dearer][0]
+                   or builds[cheaper]['cost'] == builds[dearer]['cost']
+                   for cheaper, dearer in zip(by_cost, by_cost[1:]))
+
+
+def evaluate(builds: Builds, fights: int, step: int, best: float = math.inf,
+             seed: int = 0, policy: str = 'random') -> Evaluation:
+    """
+    Play the candidate builds round-robin, step fights per pair at a time.
+
+    Stops when even the lowest plausible loss is above the best one,
+    or once every ordered pair played the fights.
+    """
+    rng = random.Random(f'{seed}:{candidate_key(builds, fights, policy)}')
+    robots = {name: Robot(name, data, rng) for name, data in builds.items()}
+    counts = {name: [0, 0, 0] for name in builds}
+    evaluation = Evaluation(counts)
+    for played in range(0, fights, step):
+        for player in builds:
+            for opponent in builds:
+                if player == opponent:
+                    continue
+                outcomes = pit.simulate(robots[player], robots[opponent],
+                                        min(step, fights - played),
+                                        policies.POLICIES[policy](),
+                                        policies.POLICIES[policy]())
+                for idx, outcome in enumerate(OUTCOMES):
+                    counts[player][idx] += outcomes[outcome]
+                    counts[opponent][2 - idx] += outcomes[outcome]
+        if evaluation.loss(builds, Z_SCORE) > best:
+            evaluation.stopped = True
+            evaluation.bound = best
+            break
+    return evaluation
+
+
+def candidate_key(builds: Builds, fights: int, policy: str) -> str:
+    """Return cache key of the candidate evaluated with the settings."""
+    return hashlib.sha1(json.dumps([builds, fights, policy], sort_keys=True)
+                        .encode('utf-8')).hexdigest()
+
+
+def mutate(builds: Builds, rng: random.Random, changes: int = 2) -> Builds:
+    """Return copy of the builds with few attributes changed at random."""
+    candidate = {name: dict(data) for name, data in builds.items()}
+    for _ in range(changes):
+        data = candidate[rng.choice(sorted(candidate))]
+        attribute = rng.choice(sorted(PARAMETERS))
+        low, high, step = PARAMETERS[attribute]
+        change = rng.choice([-1, 1]) * rng.randint(1, step)
+        data[attribute] = min(high, max(low, int(data[attribute]) + change))  # type: ignore
+    return candidate
+
+
+class BalanceOptimizer:
+    """
+    Search of build attributes meeting the target score curve.
+
+    Each generation, candidates mutated from the best builds so far
+    are evaluated in parallel by simulated round-robin fights, ones
+    clearly worse than the best are stopped early. Evaluations are
+    cached on disk per candidate, so a rerun only plays new ones.
+    """
+
+    def __init__(self, builds: Builds, fights: int = 2000, step: int = 250,
+                 seed: int = 0, policy: str = 'random',
+                 cache_file: Optional[str] = PATH_TO_BALANCE_CACHE) -> None:
+        self.builds = builds
+        self.fights = fights
+        self.step = step
+        self.seed = seed
+        self.policy = policy
+        self.cache_file = cache_file
+        self.rng = random.Random(seed)
+        self.cache: Dict[str, Dict] = self._load_cache()
+        self.evaluated = 0
+
+    def optimize(self, generations: int = 20, population: int = 8,
+                 workers: Optional[int] = None) -> Tuple[Builds, Evaluation]:
+        """Return the best builds found and their evaluation."""
+        best_builds = self.builds
+        best = self.evaluate([best_builds], workers)[0]
+        with ProcessPoolExecutor(workers) as executor:
+            for generation in range(generations):
+                candidates = [mutate(best_builds, self.rng) for _ in range(population)]
+                evaluations = self.evaluate(candidates, workers, best.loss(best_builds),
+                                            executor)
+                for candidate, evaluation in zip(candidates, evaluations):
+                    if (not evaluation.stopped
+                            and evaluation.loss(candidate) < best.loss(best_builds)):
+                        best_builds, best = candidate, evaluation
+                print(f'Generation {generation + 1:>3}: loss {best.loss(best_builds):.5f}')
+        return best_builds, best
+
+    def evaluate(self, candidates: List[Builds], workers: Optional[int] = None,
+                 best: float = math.inf,
+                 executor: Optional[ProcessPoolExecutor] = None) -> List[Evaluation]:
+        """Return evaluations of the candidates, from cache or played in parallel."""
+        keys = [candidate_key(candidate, self.fights, self.policy) for candidate in candidates]
+        missing = {key: candidate for key, candidate in zip(keys, candidates)
+                   if not self._cached(key, best)}
+        if missing:
+            own_executor = executor is None
+            executor = executor or ProcessPoolExecutor(workers)
+            try:
+                futures = {key: executor.submit(evaluate, candidate, self.fights, self.step,
+                                                best, self.seed, self.policy)
+                           for key, candidate in missing.items()}
+                for key, future in futures.items():
+                    evaluation = future.result()
+                    self.cache[key] = vars(evaluation)
+            finally:
+                if own_executor:
+                    executor.shutdown()
+            self.evaluated += len(missing)
+            self._save_cache()
+        return [Evaluation(**self.cache[key]) for key in keys]
+
+    def _cached(self, key: str, best: float) -> bool:
+        """Return True if the cached evaluation is good for comparing to the best."""
+        entry = self.cache.get(key)
+        # Stopped one is still worse than any best loss below its bound.
+        return entry is not None and (not entry['stopped'] or best <= entry['bound'])
+
+    def _load_cache(self) -> Dict[str, Dict]:
+        """Return evaluations cached on disk."""
+        if not self.cache_file:
+            return {}
+        try:
+            with open(self.cache_file, 'r') as cache_file:
+                return json.load(cache_file)
+        except (OSError, ValueError):
+            return {}
+
+    def _save_cache(self) -> None:
+        """Atomically write the cache to disk, failing silently when not writable."""
+        if not self.cache_file:
+            return
+        try:
+            os.makedirs(os.path.dirname(self.cache_file), exist_ok=True)
+            tmp_file = self.cache_file + '.tmp'
+            with open(tmp_file, 'w') as cache_file:
+                json.dump(self.cache, cache_file)
+            os.replace(tmp_file, self.cache_file)
+        except OSError:
+            pass
+
+
+def report(builds: Builds, evaluation: Evaluation, proposed: Builds,
+           proposed_evaluation: Evaluation) -> str:
+    """Return table of build scores before and after, with the targets."""
+    targets = target_scores(builds)
+    scores, proposed_scores = evaluation.scores(), proposed_evaluation.scores()
+    output = f'{"BUILD":<12}{"COST":>6}{"TARGET":>8}{"NOW":>8}{"PROPOSED":>10}  CHANGES\n'
+    for name in sorted(builds, key=lambda name: int(builds[name]['cost'])):  # type: ignore
+        changes = ', '.join(f'{attribute} {builds[name][attribute]}->{proposed[name][attribute]}'
+                            for attribute in PARAMETERS
+                            if builds[name][attribute] != proposed[name][attribute])
+        output += (f'{name:<12}{builds[name]["cost"]:>6}{targets[name]:>8.1%}'
+                   f'{scores[name][0]:>8.1%}{proposed_scores[name][0]:>10.1%}  {changes}\n')
+    output += (f'Loss {evaluation.loss(builds):.5f} -> '
+               f'{proposed_evaluation.loss(proposed):.5f}, score monotonic in cost: '
+               f'{evaluation.monotonic(builds)} -> {proposed_evaluation.monotonic(proposed)}')
+    return output
+
+
+def main() -> None:
+    """Search for balanced builds and write them to the proposal file."""
+    parser = argparse.ArgumentParser(description='Simulation driven build balance optimizer.')
+    parser.add_argument('--fights', type=int, default=2000,
+                        help='fights per ordered build pair of a full evaluation')
+    parser.add_argument('--step', type=int, default=250,
+                        help='fights per pair between early stopping checks')
+    parser.add_argument('--generations', type=int, default=20)
+    parser.add_argument('--population', type=int, default=8,
+                        help='candidates evaluated each generation')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='number of worker processes (default all cores)')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--policy', choices=policies.POLICIES, default='random')
+    parser.add_argument('--builds', default=PATH_TO_BUILDS, help='builds file to balance')
+    parser.add_argument('--output', default=PATH_TO_PROPOSAL,
+                        help=f'proposed builds file (default {PATH_TO_PROPOSAL})')
+    args = parser.parse_args()
+
+    with open(args.builds, 'r') as builds_file:
+        builds = json.load(builds_file)
+    optimizer = BalanceOptimizer(builds, args.fights, args.step, args.seed, args.policy)
+    try:
+        proposed, evaluation = optimizer.optimize(args.generations, args.population,
+                                                  args.workers)
+    except KeyboardInterrupt:
+        print('\nOptimization interrupted, evaluations kept in cache.')
+        return
+    print(report(builds, optimizer.evaluate([builds])[0], proposed, evaluation))
+    print(f'{optimizer.evaluated} candidates played, rest read from cache.')
+    with open(args.output, 'w') as proposal_file:
+        json.dump(proposed, proposal_file, indent=4)
+        proposal_file.write('\n')
+    print(f'Proposed builds written to {args.output}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,308 @@
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import timeit
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+from src import pit
+from src.db import DBHandler
+from src.policies import random_policy
+from src.robots import Robot, RobotManager
+from src.utils import USERNAME_PROMPT, PacingClock, ScriptedConsole, with_console
+
+PATH_TO_HISTORY = 'data/bench/history.jsonl'
+DB_SIZES = (10_000, 100_000, 1_000_000)
+# Slowdown against the baseline counted as a regression.
+REGRESSION_TOLERANCE = 0.25
+# Runs of the history whose median is the baseline, smoothing out noisy runs.
+BASELINE_RUNS = 5
+# Seconds per operation no run may exceed, generous enough for slow machines.
+# Fights are held to the 100k headless fights per second target.
+BUDGETS = {
+    'fight.round_runner': 5e-4,
+    'fight.engine': 1e-5,
+    'robot.use_weapon': 5e-6,
+    'robot.take_damage': 5e-6,
+    'robot.affordable_weapons': 5e-6,
+    'robot.is_exhausted': 5e-6,
+    'robot.reset': 5e-6,
+    'db.get_user': 5e-4,
+    'db.add_to_balance': 5e-3,
+    'render.banner': 2e-4,
+    'render.showcase': 5e-3,
+    'startup.first_prompt': 0.1,
+    'startup.cold': 2.0,
+}
+
+Results = Dict[str, float]
+
+
+def measure(func: Callable[[], Any], number: int, repeat: int = 5) -> float:
+    """Return seconds per call of func, best of the repeats."""
+    return min(timeit.Timer(func).timeit(number) for _ in range(repeat)) / number
+
+
+def bench_fight(scale: float) -> Results:
+    """Fights through Fight and RoundRunner, both sides random, no pauses."""
+    robot_manager = RobotManager(random.Random(1))
+    player = Robot('player', robot_manager.get_build_spec('Heavy'), robot_manager.rng)
+    opponent = Robot('opponent', robot_manager.get_build_spec('Agile'), robot_manager.rng)
+
+    async def fights(count: int) -> None:
+        for _ in range(count):
+            player.reset()
+            opponent.reset()
+            fight = pit.Fight(player, opponent, pit.RoundRunner(random_policy, random_policy))
+            await fight.has_winner()
+
+    number = max(1, int(200 * scale))
+    console = ScriptedConsole(clock=PacingClock(0))
+    round_runner = measure(lambda: asyncio.run(with_console(console, fights(number))),
+                           1) / number
+    engine = pit.FightEngine(player, opponent)
+
+    def headless() -> None:
+        player.reset()
+        opponent.reset()
+        engine.run()
+
+    return {'fight.round_runner': round_runner,
+            'fight.engine': measure(headless, max(1, int(5000 * scale)))}
+
+
+def bench_robot(scale: float) -> Results:
+    """Robot methods called on every turn of a fight."""
+    robot = Robot('robot', RobotManager().get_build_spec('Heavy'), random.Random(1))
+    weapon = robot.weapons[0]
+    number = max(1, int(200_000 * scale))
+
+    energy, health = robot.get_init_energy(), robot.get_init_health()
+
+    def use_weapon() -> None:
+        robot.energy = energy
+        robot.use_weapon(weapon)
+
+    def take_damage() -> None:
+        robot.health = health
+        robot.take_damage(1)
+
+    results = {'robot.use_weapon': measure(use_weapon, number),
+               'robot.take_damage': measure(take_damage, number)}
+    robot.reset()
+    return {**results,
+            'robot.affordable_weapons': measure(robot.affordable_weapons, number),
+            'robot.is_exhausted': measure(robot.is_exhausted, number),
+            'robot.reset': measure(robot.reset, number)}
+
+
+def populate_users(db_handler: DBHandler, users: int) -> None:
+    """Fill the users table, balances and their opening ledger entries."""
+    rows = ((f'user{idx}', b'hash', 'Heavy', f'robot{idx}', idx % 1000)
+            for idx in range(users))
+    with db_handler.conn:
+        db_handler.conn.executemany('INSERT INTO users VALUES (?, ?, ?, ?, ?)', rows)
+        db_handler.conn.execute("INSERT INTO transactions (user, amount, reason, created) "
+                                "SELECT name, balance, 'opening balance', 0 FROM users")
+
+
+def bench_db(scale: float, sizes: Iterable[int] = DB_SIZES) -> Results:
+    """Read and write latency of DBHandler on a file db of growing user count."""
+    results = {}
+    for users in sizes:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            db_handler = DBHandler(os.path.join(tmp_dir, 'bench.db'))
+            populate_users(db_handler, users)
+            rng = random.Random(1)
+            number = max(1, int(2000 * scale))
+            results[f'db.get_user@{users}'] = measure(
+                lambda: db_handler.get_user(f'user{rng.randrange(users)}'), number)
+            results[f'db.add_to_balance@{users}'] = measure(
+                lambda: db_handler.add_to_balance(f'user{rng.randrange(users)}', 1, 'bench'),
+                max(1, number // 4))
+            db_handler.conn.close()
+    return results
+
+
+def bench_render(scale: float) -> Results:
+    """Rendering of the fight banner and of the build showcase."""
+    robot_manager = RobotManager()
+    player = Robot('player', robot_manager.get_build_spec('Heavy'))
+    opponent = Robot('opponent', robot_manager.get_build_spec('Agile'))
+    log = pit.FightLog((player.name, opponent.name), (player.weapons, opponent.weapons))
+    players_turn = pit.PlayersTurn(player, opponent, log)
+    return {'render.banner': measure(players_turn._get_banner, max(1, int(20_000 * scale))),
+            'render.showcase': measure(robot_manager.showcase, max(1, int(1000 * scale)))}
+
+
+def bench_startup(scale: float) -> Results:
+    """Cold start of game.py with no pauses, to the first prompt and until it quits on end of input."""
+    command = [sys.executable, 'game.py', '--pace', '0', '--db', ':memory:']
+    prompt = USERNAME_PROMPT.encode('utf-8')
+
+    def start() -> None:
+        subprocess.run(command, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL,
+                       stderr=subprocess.DEVNULL, check=True)
+
+    def first_prompt() -> None:
+        with subprocess.Popen(command, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                              stderr=subprocess.DEVNULL) as game:
+            output = b''
+            while prompt not in output:
+                if not (data := game.stdout.read1()):  # type: ignore[union-attr]
+                    raise RuntimeError('Game quit before the first prompt.')
+                output += data
+            game.kill()
+
+    repeat = max(1, int(5 * scale))
+    return {'startup.first_prompt': measure(first_prompt, 1, 2 * repeat),
+            'startup.cold': measure(start, 1, repeat)}
+
+
+BENCHMARKS: Dict[str, Callable[[float], Results]] = {
+    'fight': bench_fight,
+    'robot': bench_robot,
+    'db': bench_db,
+    'render': bench_render,
+    'startup': bench_startup,
+}
+
+
+@dataclass
+class BenchRun:
+    """Results of one run of the suite, seconds per operation by benchmark."""
+    results: Results
+    created: float = field(default_factory=time.time)
+    revision: str = ''
+
+    def budget(self, name: str) -> Optional[float]:
+        """Return budget of the benchmark, sizes of db ones share a budget."""
+        return BUDGETS.get(name.split('@')[0])
+
+    def failures(self, baseline: Optional['BenchRun'] = None,
+                 tolerance: float = REGRESSION_TOLERANCE) -> List[str]:
+        """Return benchmarks over budget or regressed against the baseline."""
+        failed = []
+        for name, value in self.results.items():
+            budget = self.budget(name)
+            if budget is not None and value > budget:
+                failed.append(f'{name}: {_duration(value)} over budget {_duration(budget)}')
+            if baseline and (before := baseline.results.get(name)):
+                if value > before * (1 + tolerance):
+                    failed.append(f'{name}: {value / before - 1:+.0%} slower than '
+                                  f'{_duration(before)}')
+        return failed
+
+    def report(self, baseline: Optional['BenchRun'] = None) -> str:
+        """Return table of results, compared to the baseline if given."""
+        output = f'{"BENCHMARK":<28}{"PER OP":>12}{"OPS/S":>14}'
+        output += f'{"BEFORE":>12}{"CHANGE":>9}\n' if baseline else '\n'
+        for name, value in self.results.items():
+            output += f'{name:<28}{_duration(value):>12}{1 / value:>14,.0f}'
+            if baseline and (before := baseline.results.get(name)):
+                output += f'{_duration(before):>12}{value / before - 1:>+9.1%}'
+            output += '\n'
+        return output
+
+
+def _duration(seconds: float) -> str:
+    """Return seconds in readable unit."""
+    for unit, scale in (('s', 1), ('ms', 1e-3), ('us', 1e-6)):
+        if seconds >= scale:
+            return f'{seconds / scale:.2f} {unit}'
+    return f'{seconds / 1e-9:.0f} ns'
+
+
+def load_history(path: str = PATH_TO_HISTORY) -> List[BenchRun]:
+    """Return runs stored in the history file, oldest first."""
+    try:
+        with open(path, 'r') as history_file:
+            return [BenchRun(**json.loads(line)) for line in history_file if line.strip()]
+    except OSError:
+        return []
+
+
+def baseline(history: List[BenchRun], runs: int = BASELINE_RUNS) -> Optional[BenchRun]:
+    """Return median result of every benchmark over the last runs, None without history."""
+    if not history:
+        return None
+    recent = history[-runs:]
+    names = {name for run in recent for name in run.results}
+    return BenchRun({name: statistics.median(run.results[name] for run in recent
+                                             if name in run.results)
+                     for name in sorted(names)},
+                    recent[-1].created, f'median of {len(recent)} runs')
+
+
+def save_run(run: BenchRun, path: str = PATH_TO_HISTORY) -> None:
+    """Append the run to the history file."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'a') as history_file:
+        history_file.write(json.dumps(vars(run)) + '\n')
+
+
+def git_revision() -> str:
+    """Return short hash of the checked out commit, empty outside git."""
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ''
+
+
+def run_suite(groups: Iterable[str], scale: float = 1.0,
+              sizes: Iterable[int] = DB_SIZES) -> BenchRun:
+    """Run the benchmark groups and return their results."""
+    results: Results = {}
+    for group in groups:
+        print(f'Running {group} benchmarks...', flush=True)
+        if group == 'db':
+            results.update(bench_db(scale, sizes))
+        else:
+            results.update(BENCHMARKS[group](scale))
+    return BenchRun(results, revision=git_revision())
+
+
+def main() -> None:
+    """Run the benchmarks, store them in history and compare with the baseline."""
+    parser = argparse.ArgumentParser(description='CyberPit performance benchmarks.')
+    parser.add_argument('--only', default=','.join(BENCHMARKS),
+                        help=f'comma separated groups to run (default {",".join(BENCHMARKS)})')
+    parser.add_argument('--scale', type=float, default=1.0,
+                        help='multiplier of iteration counts, lower for a quick run')
+    parser.add_argument('--users', default=','.join(str(size) for size in DB_SIZES),
+                        help='comma separated user counts of db benchmarks')
+    parser.add_argument('--history', default=PATH_TO_HISTORY,
+                        help=f'result history file (default {PATH_TO_HISTORY})')
+    parser.add_argument('--baseline-runs', type=int, default=BASELINE_RUNS, metavar='RUNS',
+                        help=f'compare with median of the last RUNS runs (default {BASELINE_RUNS})')
+    parser.add_argument('--tolerance', type=float, default=REGRESSION_TOLERANCE,
+                        help='slowdown against baseline failing the run, 0.25 is 25%%')
+    parser.add_argument('--no-save', action='store_true', help='do not add run to history')
+    args = parser.parse_args()
+
+    groups = [group for group in args.only.split(',') if group]
+    for group in groups:
+        if group not in BENCHMARKS:
+            parser.error(f'unknown benchmark group {group}')
+    reference = baseline(load_history(args.history), args.baseline_runs)
+    run = run_suite(groups, args.scale, [int(size) for size in args.users.split(',')])
+    print()
+    print(run.report(reference))
+    if not args.no_save:
+        save_run(run, args.history)
+    if failed := run.failures(reference, args.tolerance):
+        print('REGRESSIONS:', *failed, sep='\n  ')
+        exit(1)
+    print('All benchmarks within budget.')
+
+
+if __name__ == '__main__':
+    main()
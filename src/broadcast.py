@@ -0,0 +1,159 @@
+import asyncio
+import itertools
+from collections import deque
+from enum import Enum
+from typing import Deque, Dict, Iterable, List, Optional, Set
+
+from src.events import EventSink, FightLog
+
+# Events queued for a spectator before the overflow policy kicks in.
+QUEUE_SIZE = 256
+# Last skipped events still sent to a lagging spectator when the fight ends, the outcome.
+FINAL_EVENTS = 3
+
+
+class Overflow(Enum):
+    """What happens to a spectator falling behind the fight."""
+    SKIP = 'skip'              # events are skipped until the queue has room
+    DISCONNECT = 'disconnect'  # spectator is dropped
+
+
+class Subscriber:
+    """Bounded queue of wire-ready events of one spectator."""
+
+    def __init__(self, maxsize: int = QUEUE_SIZE, overflow: Overflow = Overflow.SKIP) -> None:
+        self.maxsize = maxsize
+        self.overflow = overflow
+        self.queue: Deque[bytes] = deque()
+        self.skipped = 0
+        # Latest skipped events, sent on close so the spectator sees how the fight ended.
+        self.missed: Deque[bytes] = deque(maxlen=FINAL_EVENTS)
+        self.closed = False
+        self.dropped = False
+        self._ready = asyncio.Event()
+
+    def offer(self, data: bytes) -> None:
+        """Queue the event, never waiting - apply overflow policy when full."""
+        if self.closed:
+            return
+        if len(self.queue) >= self.maxsize:
+            if self.overflow is Overflow.DISCONNECT:
+                self.queue.clear()
+                self.dropped = True
+                self.close()
+            else:
+                self.skipped += 1
+                self.missed.append(data)
+            return
+        self._flush_skipped()
+        self.queue.append(data)
+        self._ready.set()
+
+    def close(self) -> None:
+        """Let the spectator read what is queued and the final events skipped, then end."""
+        if not self.closed:
+            self._flush_skipped(self.missed)
+        self.closed = True
+        self._ready.set()
+
+    def _flush_skipped(self, final: Iterable[bytes] = ()) -> None:
+        """Queue marker of the skipped events, followed by the final ones given."""
+        final = list(final)
+        if self.skipped > len(final):
+            self.queue.append(f'  ... {self.skipped - len(final)} events skipped ...\r\n'
+                              .encode('utf-8'))
+        self.queue.extend(final)
+        self.skipped = 0
+        self.missed.clear()
+
+    async def get(self) -> Optional[bytes]:
+        """Return next event, None when the broadcast is over."""
+        while not self.queue:
+            if self.closed:
+                return None
+            self._ready.clear()
+            await self._ready.wait()
+        return self.queue.popleft()
+
+
+class FightBroadcast:
+    """
+    Live fight published to any number of spectators.
+
+    Every event is serialized once, the same bytes are queued for all
+    the subscribers, and kept so spectators joining late see it all.
+    Publishing never waits for a spectator.
+    """
+
+    def __init__(self, fight_id: int, title: str) -> None:
+        self.fight_id = fight_id
+        self.title = title
+        self.history: List[bytes] = []
+        self.subscribers: Set[Subscriber] = set()
+
+    def __str__(self) -> str:
+        return f'#{self.fight_id:<6} {self.title}  ({len(self.subscribers)} watching)'
+
+    def publish(self, data: bytes) -> None:
+        """Send serialized event to every spectator."""
+        self.history.append(data)
+        for subscriber in self.subscribers:
+            subscriber.offer(data)
+
+    def subscribe(self, maxsize: int = QUEUE_SIZE,
+                  overflow: Overflow = Overflow.SKIP) -> Subscriber:
+        """Return new spectator queue, starting with the fight so far."""
+        subscriber = Subscriber(maxsize, overflow)
+        for data in self.history[-maxsize:]:
+            subscriber.offer(data)
+        self.subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber) -> None:
+        """Stop sending events to the spectator."""
+        self.subscribers.discard(subscriber)
+
+    def close(self) -> None:
+        """End the broadcast for all the spectators."""
+        for subscriber in self.subscribers:
+            subscriber.close()
+        self.subscribers.clear()
+
+
+class BroadcastSink(EventSink):
+    """Fight events rendered to telnet lines and published to the broadcast."""
+
+    def __init__(self, broadcast: FightBroadcast) -> None:
+        self.broadcast = broadcast
+
+    def emit(self, log: FightLog, index: int) -> None:
+        self.broadcast.publish((log.render(log[index]) + '\r\n').encode('utf-8'))
+
+    def close(self) -> None:
+        self.broadcast.close()
+
+
+class LiveFights:
+    """Registry of fights broadcast in this process."""
+
+    def __init__(self) -> None:
+        self.broadcasts: Dict[int, FightBroadcast] = {}
+        self._ids = itertools.count(1)
+
+    def open(self, title: str) -> FightBroadcast:
+        """Return new broadcast listed as live."""
+        broadcast = FightBroadcast(next(self._ids), title)
+        self.broadcasts[broadcast.fight_id] = broadcast
+        return broadcast
+
+    def close(self, broadcast: FightBroadcast) -> None:
+        """End the broadcast and unlist it."""
+        broadcast.close()
+        self.broadcasts.pop(broadcast.fight_id, None)
+
+    def get(self, fight_id: int) -> Optional[FightBroadcast]:
+        """Return live broadcast by id."""
+        return self.broadcasts.get(fight_id)
+
+
+live_fights = LiveFights()
@@ -0,0 +1,298 @@
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from itertools import repeat
+from typing import Any, Collection, Dict, Iterable, Iterator, List, Optional, TextIO, Tuple
+
+import bcrypt  # type: ignore
+
+from src.db import DB_FILE, DBError, DBHandler
+from src.robots import RobotManager
+from src.users import PwdManager
+
+FIELDS = ('name', 'pwd', 'robot', 'robot_name', 'balance')
+# Column of plaintext passwords, hashed on import, used when pwd is empty.
+PASSWORD_FIELD = 'password'
+FORMATS = ('jsonl', 'csv')
+# Users written in one transaction.
+BATCH_SIZE = 20_000
+# Invalid rows reported one by one, the rest only counted.
+MAX_ERRORS = 20
+
+Row = Tuple[str, bytes, str, str, int]
+
+
+def file_format(path: str, fmt: Optional[str] = None) -> str:
+    """Return format given, or by file extension, jsonl by default."""
+    return fmt or ('csv' if path.lower().endswith('.csv') else 'jsonl')
+
+
+def read_rows(source: TextIO, fmt: str) -> Iterator[Dict[str, Any]]:
+    """Yield rows of the file one at a time, as dicts of columns."""
+    if fmt == 'csv':
+        yield from csv.DictReader(source)
+        return
+    for line in source:
+        if line.strip():
+            yield json.loads(line)
+
+
+def write_rows(target: TextIO, fmt: str, rows: Iterable[Dict[str, Any]]) -> int:
+    """Write the rows to the file, return their count."""
+    count = 0
+    if fmt == 'csv':
+        writer = csv.DictWriter(target, FIELDS)
+        writer.writeheader()
+        for count, row in enumerate(rows, 1):
+            writer.writerow(row)
+        return count
+    for count, row in enumerate(rows, 1):
+        target.write(json.dumps(row) + '\n')
+    return count
+
+
+def is_hash(pwd: str) -> bool:
+    """Return True if pwd looks like a bcrypt hash."""
+    return len(pwd) == 60 and pwd.startswith(('$2a$', '$2b$', '$2y$'))
+
+
+def parse_row(row: Dict[str, Any], builds: Collection[str]) -> Tuple[Row, Optional[str]]:
+    """
+    Return the user row to insert and plaintext password to hash, if any.
+
+    Raise ValueError describing the first invalid column.
+    """
+    name = str(row.get('name') or '').strip()
+    if not name:
+        raise ValueError('missing name')
+    pwd = str(row.get('pwd') or '')
+    password = row.get(PASSWORD_FIELD) or None
+    if pwd and not is_hash(pwd):
+        raise ValueError('pwd is not a bcrypt hash')
+    if not pwd and not password:
+        raise ValueError(f'neither pwd nor {PASSWORD_FIELD} given')
+    robot = str(row.get('robot') or '')
+    if robot and robot not in builds:
+        raise ValueError(f'unknown robot build {robot}')
+    try:
+        balance = int(row.get('balance') or 0)
+    except (TypeError, ValueError):
+        raise ValueError(f'balance {row.get("balance")!r} is not a number') from None
+    if balance < 0:
+        raise ValueError('negative balance')
+    return ((name, pwd.encode('ascii'), robot, str(row.get('robot_name') or ''), balance),
+            None if pwd else str(password))
+
+
+def hash_password(password: str, cost: int) -> bytes:
+    """Return salted hash of the password, run in the worker processes."""
+    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(cost))
+
+
+@dataclass
+class ImportStats:
+    """Counts of an import, with the errors reported."""
+    read: int = 0
+    written: int = 0
+    hashed: int = 0
+    invalid: int = 0
+    errors: List[str] = field(default_factory=list)
+
+    def __str__(self) -> str:
+        return (f'{self.read:,} rows read, {self.written:,} users written, '
+                f'{self.hashed:,} passwords hashed, {self.invalid:,} invalid rows')
+
+
+class UserImport:
+    """
+    Streaming bulk import of users.
+
+    Rows are read, validated and written in batches, so memory use does
+    not grow with the file. Each batch is one transaction. Plaintext
+    passwords are hashed in a process pool, the next batch is hashed
+    while the previous one is written.
+    """
+
+    def __init__(self, db_handler: DBHandler, builds: Collection[str], replace: bool = False,
+                 cost: Optional[int] = None, workers: Optional[int] = None,
+                 batch_size: int = BATCH_SIZE) -> None:
+        self.db_handler = db_handler
+        self.builds = builds
+        self.replace = replace
+        self._cost = cost
+        self.workers = workers
+        self.batch_size = batch_size
+        self.stats = ImportStats()
+        self._pool: Optional[ProcessPoolExecutor] = None
+
+    @property
+    def cost(self) -> int:
+        """Return bcrypt cost of the hashes, the game's one unless given."""
+        if self._cost is None:
+            self._cost = PwdManager().cost
+        return self._cost
+
+    def run(self, rows: Iterable[Dict[str, Any]], progress: bool = False) -> ImportStats:
+        """Import the rows, return the counts."""
+        pending: Optional[Tuple[List[Row], Iterator[bytes]]] = None
+        try:
+            for batch in self._batches(rows):
+                hashing = self._hash(batch)
+                if pending:
+                    written, pending = pending, None
+                    self._write(*written)
+                pending = hashing
+                if progress:
+                    print(f'{self.stats.read:,} rows read, '
+                          f'{self.stats.written:,} users written...', flush=True)
+            if pending:
+                self._write(*pending)
+        except Exception:
+            if pending:
+                self._write(*pending)
+            raise
+        finally:
+            if self._pool:
+                self._pool.shutdown(cancel_futures=True)
+        return self.stats
+
+    def _batches(self, rows: Iterable[Dict[str, Any]]
+                 ) -> Iterator[List[Tuple[Row, Optional[str]]]]:
+        """Yield batches of valid rows, counting and reporting the invalid ones."""
+        batch = []
+        try:
+            for line, row in enumerate(rows, 1):
+                self.stats.read += 1
+                try:
+                    batch.append(parse_row(row, self.builds))
+                except (ValueError, AttributeError) as error:
+                    self.stats.invalid += 1
+                    if len(self.stats.errors) < MAX_ERRORS:
+                        self.stats.errors.append(f'row {line}: {error}')
+                    continue
+                if len(batch) == self.batch_size:
+                    yield batch
+                    batch = []
+        except Exception:
+            # Malformed file, the rows read so far are still imported.
+            if batch:
+                yield batch
+            raise
+        if batch:
+            yield batch
+
+    def _hash(self, batch: List[Tuple[Row, Optional[str]]]
+              ) -> Tuple[List[Row], Iterator[bytes]]:
+        """Start hashing the plaintext passwords of the batch, return rows and the hashes."""
+        passwords = [password for _, password in batch if password is not None]
+        if not passwords:
+            return [row for row, _ in batch], iter(())
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(self.workers)
+        # Rows to hash have empty pwd, filled in from the hashes in order on write.
+        chunksize = max(1, len(passwords) // (4 * (self.workers or os.cpu_count() or 1)))
+        return ([row for row, _ in batch],
+                self._pool.map(hash_password, passwords, repeat(self.cost), chunksize=chunksize))
+
+    def _write(self, batch: List[Row], hashes: Iterator[bytes]) -> None:
+        """Fill in the hashes and write the batch in one transaction."""
+        rows = []
+        for row in batch:
+            if not row[1]:
+                row = (row[0], next(hashes), *row[2:])
+                self.stats.hashed += 1
+            rows.append(row)
+        self.stats.written += self.db_handler.import_users(rows, self.replace)
+
+
+def export_users(db_handler: DBHandler, target: TextIO, fmt: str) -> int:
+    """Stream all the users to the file, return their count."""
+    return write_rows(target, fmt, ({'name': record.name,
+                                     'pwd': bytes(record.pwd).decode('ascii'),
+                                     'robot': record.robot or '',
+                                     'robot_name': record.robot_name or '',
+                                     'balance': record.balance or 0}
+                                    for record in db_handler.iter_users()))
+
+
+def main() -> None:
+    """Import users from or export them to a JSONL or CSV file."""
+    parser = argparse.ArgumentParser(description='Bulk import and export of users.')
+    parser.add_argument('action', choices=('import', 'export'))
+    parser.add_argument('file', help="JSONL or CSV file, '-' for standard input or output")
+    parser.add_argument('--format', choices=FORMATS, default=None,
+                        help='file format (default by extension, jsonl otherwise)')
+    parser.add_argument('--db', default=DB_FILE, help=f'database file (default {DB_FILE})')
+    parser.add_argument('--replace', action='store_true',
+                        help='overwrite existing users instead of skipping them')
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE,
+                        help=f'users written per transaction (default {BATCH_SIZE})')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='processes hashing plaintext passwords (default all cores)')
+    parser.add_argument('--cost', type=int, default=None,
+                        help='bcrypt cost of plaintext passwords (default the game one)')
+    parser.add_argument('--keep-indexes', action='store_true',
+                        help='update indexes row by row instead of rebuilding them after, '
+                             'faster for small imports into a large db')
+    args = parser.parse_args()
+
+    fmt = file_format(args.file, args.format)
+    try:
+        db_handler = DBHandler(args.db)
+    except DBError as emsg:
+        print(f'ERROR: {emsg}', emsg.__cause__ or '', sep='\n')
+        exit(5)
+    start = time.perf_counter()
+    if args.action == 'export':
+        try:
+            if args.file == '-':
+                count = export_users(db_handler, sys.stdout, fmt)
+            else:
+                with open(args.file, 'w', newline='') as target:
+                    count = export_users(db_handler, target, fmt)
+        except OSError as emsg:
+            print(f'ERROR: Failed writing {args.file}.', emsg, sep='\n')
+            exit(1)
+        print(f'{count:,} users exported in {time.perf_counter() - start:.1f} s.',
+              file=sys.stderr if args.file == '-' else sys.stdout)
+        return
+
+    user_import = UserImport(db_handler, RobotManager().get_all_build_names(), args.replace,
+                             args.cost, args.workers, args.batch_size)
+    if not args.keep_indexes:
+        db_handler.drop_indexes()
+    try:
+        if args.file == '-':
+            stats = user_import.run(read_rows(sys.stdin, fmt), progress=True)
+        else:
+            with open(args.file, 'r', newline='') as source:
+                stats = user_import.run(read_rows(source, fmt), progress=True)
+    except OSError as emsg:
+        print(f'ERROR: Failed reading {args.file}.', emsg, sep='\n')
+        exit(1)
+    except (ValueError, csv.Error) as emsg:
+        print(f'ERROR: Malformed {fmt} in {args.file} after '
+              f'{user_import.stats.read:,} rows, {user_import.stats.written:,} users before it '
+              'were written.', emsg, sep='\n')
+        exit(1)
+    except DBError as emsg:
+        print(f'ERROR: {emsg}', emsg.__cause__, sep='\n')
+        exit(5)
+    finally:
+        if not args.keep_indexes:
+            print('Building indexes...', flush=True)
+            # Sort of the index build spills to disk, instead of growing with the table.
+            db_handler.conn.execute('PRAGMA temp_store = FILE')
+            db_handler.create_indexes()
+    if stats.errors:
+        print(*stats.errors, sep='\n')
+    print(f'{stats} in {time.perf_counter() - start:.1f} s.')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,28 @@
+import json
+import os
+from typing import Any, Dict
+
+PATH_TO_CONFIG = 'data/config.json'
+DB_FILE = 'data/main.db'
+
+
+def load_config() -> Dict[str, Any]:
+    """Return local config of this installation, empty if there is none yet."""
+    try:
+        with open(PATH_TO_CONFIG, 'r') as config_file:
+            return json.load(config_file)
+    except (OSError, ValueError):
+        return {}
+
+
+def update_config(**values: Any) -> None:
+    """Atomically store values to the config, failing silently when not writable."""
+    config = load_config()
+    config.update(values)
+    try:
+        tmp_file = PATH_TO_CONFIG + '.tmp'
+        with open(tmp_file, 'w') as config_file:
+            json.dump(config, config_file, indent=2)
+        os.replace(tmp_file, PATH_TO_CONFIG)
+    except OSError:
+        pass
@@ -1,83 +1,390 @@
+import asyncio
+import random
 import sqlite3
-from typing import Dict
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple, TypeVar
+
+from src.config import DB_FILE
 
-DB_FILE = "data/main.db"
 USER_TABLE = 'users'
+LEDGER_TABLE = 'transactions'
+STATS_TABLE = 'stats'
+MEMORY_DB = ':memory:'
+
+# Seconds SQLite waits for a lock held by another process before giving up,
+# then the write is retried with randomized exponential backoff.
+BUSY_TIMEOUT = 5.0
+WRITE_RETRIES = 5
+RETRY_DELAY = 0.05
+
+# Fights needed to be ranked by win rate, part of the partial index.
+RANKED_FIGHTS = 10
+
+Result = TypeVar('Result')
+
+# Tuning of file databases, WAL lets readers run alongside the writer
+# and with synchronous NORMAL a commit does not wait for fsync.
+PRAGMAS = (
+    'PRAGMA journal_mode = WAL',
+    'PRAGMA synchronous = NORMAL',
+    'PRAGMA cache_size = -8000',
+    'PRAGMA temp_store = MEMORY',
+)
+
+
+class DBError(Exception):
+    """Write to the db failed, or the tables could not be created."""
+
+
+@dataclass(frozen=True)
+class UserRecord:
+    """Row of the users table."""
+    name: str
+    pwd: bytes
+    robot: str
+    robot_name: str
+    balance: int
+
+
+@dataclass(frozen=True)
+class UserStats:
+    """Row of the stats table, streak is negative for losses in a row."""
+    user: str
+    fights: int = 0
+    wins: int = 0
+    losses: int = 0
+    draws: int = 0
+    earned: int = 0
+    streak: int = 0
+    best_streak: int = 0
+    win_rate: float = 0.0
+
+    def __str__(self) -> str:
+        return (f'{self.wins}W {self.losses}L {self.draws}D ({self.win_rate:.0%}), '
+                f'streak {self.streak}, best streak {self.best_streak}, '
+                f'{self.earned} BTC earned')
 
 
 class DBHandler:
-    def __init__(self):
-        self.conn: sqlite3.Connection = sqlite3.connect(DB_FILE)
+    """
+    Data access to the users table and the balance ledger.
+
+    All values are bound as parameters, so the SQL of each call
+    is constant and its prepared statement is reused from
+    the connection cache. Every write is committed in its own
+    transaction, retried when another process holds the lock.
+    Balance is only changed by increments recorded in the ledger,
+    users.balance is their materialized sum.
+
+    From asyncio code the calls go through run, to a single DB thread.
+    """
+
+    def __init__(self, db_file: str = DB_FILE):
+        self.db_file = db_file
+        self.conn: sqlite3.Connection = sqlite3.connect(db_file, timeout=BUSY_TIMEOUT,
+                                                        check_same_thread=False)
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._executor_lock = threading.Lock()
+        if db_file != MEMORY_DB:
+            for pragma in PRAGMAS:
+                self._write('setting up the db', lambda: self.conn.execute(pragma))
         if not self.table_exists(USER_TABLE) and not self.create_table():
-            print('ERROR: Failed creating users db table!')
-            exit(5)
+            raise DBError('Failed creating users db table!')
+        if not self.table_exists(LEDGER_TABLE) and not self.create_ledger():
+            raise DBError('Failed creating transactions db table!')
+        if not self.table_exists(STATS_TABLE) and not self.create_stats():
+            raise DBError('Failed creating stats db table!')
+        self._write('creating indexes', self.create_indexes)
+
+    def run(self, method: Callable[..., Result], *args: Any) -> 'asyncio.Future[Result]':
+        """Return future of the call run in the DB thread, not blocking the event loop."""
+        return asyncio.wrap_future(self.submit(method, *args))
+
+    def submit(self, method: Callable[..., Result], *args: Any) -> 'Future[Result]':
+        """Return future of the call run in the DB thread, from any thread."""
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='db')
+        return self._executor.submit(method, *args)
 
     def table_exists(self, table: str) -> bool:
         """Return bool if table exists in db."""
-        cursor = self.conn.execute("SELECT name FROM sqlite_master "
-                                   f"WHERE type='table' AND name='{table}';")
-        return bool(cursor.fetchall())
+        cursor = self.conn.execute("SELECT 1 FROM sqlite_master "
+                                   "WHERE type = 'table' AND name = ?", (table,))
+        return cursor.fetchone() is not None
 
     def create_table(self, table_name: str = USER_TABLE) -> bool:
         """Create table with predefined collumns in sqlite db."""
-        self.conn.execute(f'CREATE TABLE {table_name} (name TEXT PRIMARY KEY NOT NULL, '
-                          'pwd BLOB NOT NULL, robot TEXT, robot_name TEXT, balance INT);')
-        self.conn.commit()
+        with self.conn:
+            self.conn.execute(f'CREATE TABLE IF NOT EXISTS {table_name} '
+                              '(name TEXT PRIMARY KEY NOT NULL, pwd BLOB NOT NULL, '
+                              'robot TEXT, robot_name TEXT, balance INT);')
+        return self.table_exists(table_name)
+
+    def create_ledger(self, table_name: str = LEDGER_TABLE) -> bool:
+        """
+        Create append-only ledger of balance changes.
+
+        Balances of existing users are carried over as opening entries.
+        """
+        def create() -> None:
+            with self.conn:
+                self.conn.execute(f'CREATE TABLE IF NOT EXISTS {table_name} '
+                                  '(id INTEGER PRIMARY KEY, user TEXT NOT NULL, '
+                                  'amount INT NOT NULL, reason TEXT NOT NULL, '
+                                  'created REAL NOT NULL);')
+                self.conn.execute(f"INSERT INTO {table_name} (user, amount, reason, created) "
+                                  f"SELECT name, balance, 'opening balance', ? FROM {USER_TABLE} "
+                                  "WHERE balance != 0", (time.time(),))
+        self._write('creating transactions table', create)
+        return self.table_exists(table_name)
+
+    def create_stats(self, table_name: str = STATS_TABLE) -> bool:
+        """Create table of fight statistics per user."""
+        with self.conn:
+            self.conn.execute(f'CREATE TABLE IF NOT EXISTS {table_name} '
+                              '(user TEXT PRIMARY KEY NOT NULL, fights INT NOT NULL, '
+                              'wins INT NOT NULL, losses INT NOT NULL, draws INT NOT NULL, '
+                              'earned INT NOT NULL, streak INT NOT NULL, '
+                              'best_streak INT NOT NULL, win_rate REAL NOT NULL) WITHOUT ROWID;')
         return self.table_exists(table_name)
 
+    def create_indexes(self) -> None:
+        """
+        Create index of the ledger by user and covering indexes of the leaderboards.
+
+        Leaderboard indexes hold all the columns listed, so a page is read
+        from the index alone, in order, starting right at the cursor.
+        """
+        with self.conn:
+            self.conn.execute(f'CREATE INDEX IF NOT EXISTS {LEDGER_TABLE}_user '
+                              f'ON {LEDGER_TABLE} (user, id);')
+            self.conn.execute(f'CREATE INDEX IF NOT EXISTS {USER_TABLE}_balance '
+                              f'ON {USER_TABLE} (balance, name);')
+            self.conn.execute(f'CREATE INDEX IF NOT EXISTS {STATS_TABLE}_win_rate '
+                              f'ON {STATS_TABLE} (win_rate, user, fights, wins, losses, draws, '
+                              f'earned, streak, best_streak) WHERE fights >= {RANKED_FIGHTS};')
+
+    def drop_indexes(self) -> None:
+        """
+        Drop the indexes maintained on user import, see create_indexes.
+
+        Building an index once after a bulk load is much faster than
+        updating it row by row during the load.
+        """
+        def drop() -> None:
+            with self.conn:
+                self.conn.execute(f'DROP INDEX IF EXISTS {USER_TABLE}_balance;')
+                self.conn.execute(f'DROP INDEX IF EXISTS {LEDGER_TABLE}_user;')
+        self._write('dropping indexes', drop)
+
+    def import_users(self, rows: List[Tuple[str, bytes, str, str, int]],
+                     replace: bool = False) -> int:
+        """
+        Insert the batch of user rows in one transaction, return count of users written.
+
+        Rows go to a temporary staging table by executemany first, then
+        to users in one statement, the first row of a duplicate name wins.
+        Existing users are kept, or overwritten if replace. Balance
+        changes are recorded in the ledger as import entries.
+        """
+        def insert() -> int:
+            with self.conn:
+                self.conn.execute('CREATE TEMP TABLE IF NOT EXISTS import_batch '
+                                  '(name TEXT PRIMARY KEY NOT NULL, pwd BLOB NOT NULL, '
+                                  'robot TEXT, robot_name TEXT, balance INT);')
+                self.conn.executemany('INSERT OR IGNORE INTO import_batch VALUES (?, ?, ?, ?, ?)',
+                                      rows)
+                self.conn.execute(f"INSERT INTO {LEDGER_TABLE} (user, amount, reason, created) "
+                                  "SELECT batch.name, batch.balance - IFNULL(users.balance, 0), "
+                                  "'import', ? FROM import_batch AS batch "
+                                  f"LEFT JOIN {USER_TABLE} AS users ON users.name = batch.name "
+                                  "WHERE batch.balance != IFNULL(users.balance, 0) "
+                                  + ('' if replace else 'AND users.name IS NULL'),
+                                  (time.time(),))
+                written = self.conn.execute(f"INSERT OR {'REPLACE' if replace else 'IGNORE'} "
+                                            f"INTO {USER_TABLE} SELECT * FROM import_batch"
+                                            ).rowcount
+                self.conn.execute('DELETE FROM import_batch;')
+            return written
+        return self._write('importing users', insert)
+
+    def iter_users(self, table: str = USER_TABLE) -> Iterator[UserRecord]:
+        """Yield all the users by name, streamed from the db."""
+        cursor = self.conn.execute(f"SELECT name, pwd, robot, robot_name, balance FROM {table} "
+                                   "ORDER BY name")
+        for row in cursor:
+            yield UserRecord(*row)
+
     def create_user(self, name: str, passwd: str,
                     table: str = USER_TABLE) -> None:
         """Create user row with provided values."""
-        try:
-            self.conn.execute(f"INSERT INTO {table} VALUES ((?),(?),(?),(?),(?))",
-                              (name, passwd, '', '', 0))
-            self.conn.commit()
-        except (sqlite3.IntegrityError, sqlite3.OperationalError) as emsg:
-            print('ERROR: Crashed while creating user entry.')
-            print(emsg)
-            exit(5)
+        def create() -> None:
+            with self.conn:
+                self.conn.execute(f"INSERT INTO {table} VALUES (?, ?, ?, ?, ?)",
+                                  (name, passwd, '', '', 0))
+        self._write('creating user entry', create)
 
     def update_robot(self, user: str, robot: str, robot_name: str, table: str = USER_TABLE) -> None:
-        """Update the robot value for specific user."""
-        try:
-            self.conn.execute(f"UPDATE {table} SET robot = "
-                              f"'{robot}' WHERE name = '{user}'")
-            self.conn.execute(f"UPDATE {table} SET robot_name = "
-                              f"'{robot_name}' WHERE name = '{user}'")
-            self.conn.commit()
-        except (sqlite3.IntegrityError, sqlite3.OperationalError) as emsg:
-            print('ERROR: Crashed while updating user entry.')
-            print(emsg)
-            exit(5)
-
-    def update_balance(self, user: str, balance: int, table: str = USER_TABLE) -> None:
-        """Update the balance value for specific user."""
-        try:
-            self.conn.execute(f"UPDATE {table} SET balance = '{balance}' WHERE name = '{user}'")
-            self.conn.commit()
-        except (sqlite3.IntegrityError, sqlite3.OperationalError) as emsg:
-            print('ERROR: Crashed while updating user entry.')
-            print(emsg)
-            exit(5)
+        """Update the robot and its name for specific user."""
+        def update() -> None:
+            with self.conn:
+                self.conn.execute(f"UPDATE {table} SET robot = ?, robot_name = ? "
+                                  "WHERE name = ?", (robot, robot_name, user))
+        self._write('updating user entry', update)
+
+    def update_pwd(self, user: str, pwd: bytes, table: str = USER_TABLE) -> None:
+        """Update the pwd hash for specific user."""
+        def update() -> None:
+            with self.conn:
+                self.conn.execute(f"UPDATE {table} SET pwd = ? WHERE name = ?", (pwd, user))
+        self._write('updating user entry', update)
+
+    def add_to_balance(self, user: str, amount: int, reason: str,
+                       table: str = USER_TABLE) -> Optional[int]:
+        """
+        Atomically change the balance of user by amount, record it in ledger.
+
+        Return the new balance, None if it would drop below zero
+        (nothing is changed then).
+        """
+        def add() -> Optional[int]:
+            with self.conn:
+                row = self.conn.execute(f"UPDATE {table} SET balance = balance + ? "
+                                        "WHERE name = ? AND balance + ? >= 0 "
+                                        "RETURNING balance", (amount, user, amount)).fetchone()
+                if row is None:
+                    return None
+                self.conn.execute(f"INSERT INTO {LEDGER_TABLE} (user, amount, reason, created) "
+                                  "VALUES (?, ?, ?, ?)", (user, amount, reason, time.time()))
+                return row[0]
+        return self._write('updating user balance', add)
+
+    def record_fight(self, user: str, outcome: str, reward: int = 0,
+                     table: str = STATS_TABLE) -> Optional[int]:
+        """
+        Add the fight outcome ('win', 'loss' or 'draw') to stats of user.
+
+        The reward is paid in the same transaction. Return the new
+        balance, None if there was no reward or no such user to pay it.
+        """
+        won, lost, drew = outcome == 'win', outcome == 'loss', outcome == 'draw'
+        def record() -> Optional[int]:
+            balance, earned = None, 0
+            with self.conn:
+                row = self.conn.execute(f"UPDATE {USER_TABLE} "
+                                        "SET balance = balance + ? WHERE name = ? "
+                                        "RETURNING balance",
+                                        (reward, user)).fetchone() if reward else None
+                if row is not None:
+                    balance, earned = row[0], reward
+                    self.conn.execute(f"INSERT INTO {LEDGER_TABLE} "
+                                      "(user, amount, reason, created) VALUES (?, ?, ?, ?)",
+                                      (user, reward, 'fight reward', time.time()))
+                self.conn.execute(f"INSERT INTO {table} VALUES (?, 1, ?, ?, ?, ?, ?, ?, ?) "
+                                  "ON CONFLICT (user) DO UPDATE SET "
+                                  "fights = fights + 1, wins = wins + excluded.wins, "
+                                  "losses = losses + excluded.losses, "
+                                  "draws = draws + excluded.draws, "
+                                  "earned = earned + excluded.earned, "
+                                  "streak = CASE WHEN excluded.wins THEN MAX(streak, 0) + 1 "
+                                  "WHEN excluded.losses THEN MIN(streak, 0) - 1 ELSE 0 END, "
+                                  "best_streak = MAX(best_streak, CASE WHEN excluded.wins "
+                                  "THEN MAX(streak, 0) + 1 ELSE 0 END), "
+                                  "win_rate = (wins + excluded.wins) * 1.0 / (fights + 1)",
+                                  (user, won, lost, drew, earned, won - lost, int(won),
+                                   float(won)))
+            return balance
+        return self._write('recording fight', record)
+
+    def get_stats(self, user: str, table: str = STATS_TABLE) -> UserStats:
+        """Return fight statistics of user, all zero before the first fight."""
+        row = self.conn.execute(f"SELECT * FROM {table} WHERE user = ?", (user,)).fetchone()
+        return UserStats(*row) if row else UserStats(user)
+
+    def top_by_balance(self, limit: int = 10,
+                       after: Optional[Tuple[int, str]] = None) -> List[Tuple[str, int]]:
+        """
+        Return page of (name, balance) of the richest users.
+
+        Pass (balance, name) of the last row to get the next page.
+        """
+        if after is None:
+            cursor = self.conn.execute(f"SELECT name, balance FROM {USER_TABLE} "
+                                       "ORDER BY balance DESC, name DESC LIMIT ?", (limit,))
+        else:
+            cursor = self.conn.execute(f"SELECT name, balance FROM {USER_TABLE} "
+                                       "WHERE (balance, name) < (?, ?) "
+                                       "ORDER BY balance DESC, name DESC LIMIT ?", (*after, limit))
+        return cursor.fetchall()
+
+    def top_by_win_rate(self, limit: int = 10,
+                        after: Optional[Tuple[float, str]] = None) -> List[UserStats]:
+        """
+        Return page of stats of the ranked users with best win rate.
+
+        Pass (win_rate, user) of the last row to get the next page.
+        """
+        columns = 'user, fights, wins, losses, draws, earned, streak, best_streak, win_rate'
+        if after is None:
+            cursor = self.conn.execute(f"SELECT {columns} FROM {STATS_TABLE} "
+                                       f"WHERE fights >= {RANKED_FIGHTS} "
+                                       "ORDER BY win_rate DESC, user DESC LIMIT ?", (limit,))
+        else:
+            cursor = self.conn.execute(f"SELECT {columns} FROM {STATS_TABLE} "
+                                       f"WHERE fights >= {RANKED_FIGHTS} "
+                                       "AND (win_rate, user) < (?, ?) "
+                                       "ORDER BY win_rate DESC, user DESC LIMIT ?",
+                                       (*after, limit))
+        return [UserStats(*row) for row in cursor]
+
+    def get_ledger_balance(self, user: str) -> int:
+        """Return balance of the user summed from the ledger."""
+        cursor = self.conn.execute(f"SELECT TOTAL(amount) FROM {LEDGER_TABLE} WHERE user = ?",
+                                   (user,))
+        return int(cursor.fetchone()[0])
+
+    def _write(self, action: str, write: Callable[[], Result]) -> Result:
+        """
+        Run the write, retrying while the db is locked by another process.
+
+        Raise DBError if it fails otherwise, or stays locked.
+        """
+        attempt = 0
+        while True:
+            try:
+                return write()
+            except sqlite3.OperationalError as emsg:
+                attempt += 1
+                if 'locked' not in str(emsg) or attempt == WRITE_RETRIES:
+                    raise DBError(f'Crashed while {action}.') from emsg
+            except sqlite3.IntegrityError as emsg:
+                raise DBError(f'Crashed while {action}.') from emsg
+            time.sleep(RETRY_DELAY * 2 ** attempt * random.random())
+
+    def get_user(self, username: str, table: str = USER_TABLE) -> Optional[UserRecord]:
+        """Return the whole user row in one query, None if there is no such user."""
+        cursor = self.conn.execute(f"SELECT name, pwd, robot, robot_name, balance FROM {table} "
+                                   "WHERE name = ?", (username,))
+        row = cursor.fetchone()
+        return UserRecord(*row) if row else None
 
     def get_user_data(self, username: str, table: str = USER_TABLE) -> Dict[str,str]:
         """Return dict of user data from users table."""
-        columns = ['name', 'robot', 'robot_name', 'balance']
-        cursor = self.conn.execute(f"SELECT {', '.join(columns)} from "
-                                   f"{table} where name='{username}'")
-        row = cursor.fetchall()
-        data = {}
-        for index, column in enumerate(columns):
-            data[column] = row[0][index]
-        return data
+        columns = ('name', 'robot', 'robot_name', 'balance')
+        cursor = self.conn.execute(f"SELECT name, robot, robot_name, balance FROM {table} "
+                                   "WHERE name = ?", (username,))
+        return dict(zip(columns, cursor.fetchone()))
 
     def user_exists(self, name: str, table: str = USER_TABLE) -> bool:
         """Return True if user exists in users table."""
-        cursor = self.conn.execute(f"SELECT name from {table} where name='{name}'")
-        return bool(cursor.fetchall())
+        cursor = self.conn.execute(f"SELECT 1 FROM {table} WHERE name = ?", (name,))
+        return cursor.fetchone() is not None
 
     def get_pwdhash(self, name: str, table: str = USER_TABLE) -> bytes:
         """Return pwd hash for specific user from specific table."""
-        cursor = self.conn.execute(f"SELECT pwd from {table} where name='{name}'")
-        stored_pwd = cursor.fetchall()[0][0]
-        return stored_pwd
+        cursor = self.conn.execute(f"SELECT pwd FROM {table} WHERE name = ?", (name,))
+        return cursor.fetchone()[0]
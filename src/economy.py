@@ -0,0 +1,250 @@
+import argparse
+import json
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+
+from src import pit, policies
+from src.robots import PATH_TO_BUILDS, BuildSpec, RobotManager
+from src.simulation import MatchupSimulator
+from src.strategy import Difficulty
+from src.users import STARTING_GRANT
+
+# Wealth is reported at this many points of the career.
+CHECKPOINTS = 10
+PERCENTILES = (10, 50, 90)
+
+
+@dataclass
+class Economy:
+    """
+    Payout model and fight odds of the builds, as arrays by build index.
+
+    Win probability of every build pair comes from fights simulated
+    with the policies of both sides, payouts from pit.fight_reward.
+    """
+    builds: List[str]
+    costs: np.ndarray
+    rewards: np.ndarray
+    win_rates: np.ndarray
+    grant: int = STARTING_GRANT
+
+    @classmethod
+    def simulated(cls, robot_manager: RobotManager, fights: int = 20_000,
+                  player_policy: policies.Policy = policies.random_policy,
+                  difficulty: Difficulty = Difficulty.EASY,
+                  seed: Optional[int] = None, grant: int = STARTING_GRANT) -> 'Economy':
+        """Return economy of the builds, odds from fights against opponents of difficulty."""
+        opponent_policy = (policies.TablePolicy(difficulty) if difficulty.value
+                           else policies.random_policy)
+        simulator = MatchupSimulator(robot_manager, np.random.default_rng(seed),
+                                     player_policy, opponent_policy)
+        matrix = simulator.outcome_matrix(fights)
+        costs = np.array([robot_manager.get_build_data(build)['cost']
+                          for build in matrix.builds], dtype=np.int64)
+        rewards = np.array([pit.fight_reward(int(cost)) for cost in costs], dtype=np.int64)
+        return cls(list(matrix.builds), costs, rewards, matrix.rates()[:, :, 0], grant)
+
+    def expected_reward(self) -> np.ndarray:
+        """Return BTC a build earns per fight on average, against random opponent builds."""
+        return (self.win_rates * self.rewards[None, :]).mean(axis=1)
+
+
+# Shop policy: (economy, balance, current build or -1) -> build to own, -1 for none.
+ShopPolicy = Callable[[Economy, np.ndarray, np.ndarray], np.ndarray]
+
+
+def _affordable(economy: Economy, balance: np.ndarray) -> np.ndarray:
+    """Return mask of builds affordable by each career."""
+    return economy.costs[None, :] <= balance[:, None]
+
+
+def _best_affordable(economy: Economy, balance: np.ndarray, current: np.ndarray,
+                     score: np.ndarray) -> np.ndarray:
+    """Return affordable build of the highest score if better than current, else current."""
+    affordable = _affordable(economy, balance)
+    candidate = np.argmax(np.where(affordable, score[None, :], -np.inf), axis=1)
+    current_score = np.where(current >= 0, score[np.maximum(current, 0)], -np.inf)
+    better = affordable.any(axis=1) & (score[candidate] > current_score)
+    return np.where(better, candidate, current)
+
+
+def frugal_shop(economy: Economy, balance: np.ndarray, current: np.ndarray) -> np.ndarray:
+    """Buy the cheapest build once, never upgrade."""
+    cheapest = -economy.costs.astype(float)
+    return np.where(current >= 0, current, _best_affordable(economy, balance, current, cheapest))
+
+
+def upgrading_shop(economy: Economy, balance: np.ndarray, current: np.ndarray) -> np.ndarray:
+    """Buy the dearest affordable build whenever it is dearer than the own one."""
+    return _best_affordable(economy, balance, current, economy.costs.astype(float))
+
+
+def saving_shop(economy: Economy, balance: np.ndarray, current: np.ndarray) -> np.ndarray:
+    """Start with the cheapest build, then save up for the dearest one."""
+    top = int(np.argmax(economy.costs))
+    buy_top = (current != top) & (balance >= economy.costs[top])
+    return np.where(buy_top, top, frugal_shop(economy, balance, current))
+
+
+def value_shop(economy: Economy, balance: np.ndarray, current: np.ndarray) -> np.ndarray:
+    """Buy the affordable build earning the most per fight, when better than the own one."""
+    return _best_affordable(economy, balance, current, economy.expected_reward())
+
+
+SHOPS: Dict[str, ShopPolicy] = {
+    'frugal': frugal_shop,
+    'upgrade': upgrading_shop,
+    'saver': saving_shop,
+    'value': value_shop,
+}
+
+
+@dataclass
+class Careers:
+    """
+    Outcome of simulated careers, arrays with one item per career.
+
+    Upgrade times are the fight count of the first purchase of a dearer
+    build, and of reaching the dearest build, -1 if it never happened.
+    Wealth holds balance at the checkpoints, one row per checkpoint.
+    """
+    first_upgrade: np.ndarray
+    top_build: np.ndarray
+    final_build: np.ndarray
+    wealth: np.ndarray
+
+    @classmethod
+    def merged(cls, parts: List['Careers']) -> 'Careers':
+        """Return careers of all the parts together."""
+        return cls(np.concatenate([part.first_upgrade for part in parts]),
+                   np.concatenate([part.top_build for part in parts]),
+                   np.concatenate([part.final_build for part in parts]),
+                   np.concatenate([part.wealth for part in parts], axis=1))
+
+
+def simulate_careers(economy: Economy, careers: int, fights: int, shop: str,
+                     seed: int = 0, shard: int = 0) -> Careers:
+    """
+    Play the careers side by side, one array lane per career.
+
+    Every step each career visits the shop, then fights a random
+    opponent build, the outcome drawn from the economy odds.
+    """
+    rng = np.random.default_rng([seed, shard])
+    shop_policy = SHOPS[shop]
+    top = int(np.argmax(economy.costs))
+    balance = np.full(careers, economy.grant, dtype=np.int64)
+    build = np.full(careers, -1, dtype=np.int64)
+    first_upgrade = np.full(careers, -1, dtype=np.int64)
+    top_build = np.full(careers, -1, dtype=np.int64)
+    checkpoints = np.linspace(0, fights, CHECKPOINTS + 1).astype(int)
+    wealth = np.zeros((len(checkpoints), careers), dtype=np.int64)
+    for fight in range(fights + 1):
+        if fight in checkpoints:
+            wealth[np.searchsorted(checkpoints, fight)] = balance
+        if fight == fights:
+            break
+        new_build = shop_policy(economy, balance, build)
+        bought = new_build != build
+        balance[bought] -= economy.costs[new_build[bought]]
+        upgraded = bought & (build >= 0) & (first_upgrade < 0)
+        first_upgrade[upgraded] = fight
+        top_build[bought & (new_build == top) & (top_build < 0)] = fight
+        build = new_build
+        fighting = np.flatnonzero(build >= 0)
+        opponents = rng.integers(len(economy.builds), size=fighting.size)
+        won = rng.random(fighting.size) < economy.win_rates[build[fighting], opponents]
+        balance[fighting[won]] += economy.rewards[opponents[won]]
+    return Careers(first_upgrade, top_build, build, wealth)
+
+
+def run_careers(economy: Economy, careers: int, fights: int, shop: str, seed: int = 0,
+                shards: int = 1, workers: Optional[int] = None) -> Careers:
+    """Simulate the careers split to shards on a process pool."""
+    sizes = [careers // shards + (idx < careers % shards) for idx in range(shards)]
+    if shards == 1:
+        return simulate_careers(economy, careers, fights, shop, seed)
+    with ProcessPoolExecutor(workers) as executor:
+        futures = [executor.submit(simulate_careers, economy, size, fights, shop, seed, shard)
+                   for shard, size in enumerate(sizes) if size]
+        return Careers.merged([future.result() for future in futures])
+
+
+def _distribution(times: np.ndarray) -> str:
+    """Return percentiles of the times reached, with share never reached."""
+    reached = times[times >= 0]
+    never = 1 - reached.size / max(times.size, 1)
+    if not reached.size:
+        return f'{"-":>8}' * len(PERCENTILES) + f'{never:>10.1%}'
+    return (''.join(f'{value:>8.0f}' for value in np.percentile(reached, PERCENTILES))
+            + f'{never:>10.1%}')
+
+
+def report(economy: Economy, careers: Careers, fights: int) -> str:
+    """Return tables of the build economy, upgrade times and wealth curves."""
+    output = f'{"BUILD":<12}{"COST":>6}{"REWARD":>8}{"WIN %":>8}{"BTC/FIGHT":>11}{"FINAL %":>9}\n'
+    expected = economy.expected_reward()
+    final = np.bincount(careers.final_build[careers.final_build >= 0],
+                        minlength=len(economy.builds)) / careers.final_build.size
+    for idx in np.argsort(economy.costs, kind='stable'):
+        output += (f'{economy.builds[idx]:<12}{economy.costs[idx]:>6}{economy.rewards[idx]:>8}'
+                   f'{economy.win_rates[idx].mean():>8.1%}{expected[idx]:>11.2f}'
+                   f'{final[idx]:>9.1%}\n')
+    header = ''.join(f'{f"p{percentile}":>8}' for percentile in PERCENTILES)
+    output += f'\nFIGHTS TO          {header}{"NEVER":>10}\n'
+    output += f'{"first upgrade":<19}{_distribution(careers.first_upgrade)}\n'
+    top = economy.builds[int(np.argmax(economy.costs))]
+    output += f'{f"{top} (top build)":<19}{_distribution(careers.top_build)}\n'
+    output += f'\n{"AFTER FIGHTS":<19}{header}{"MEAN":>10}\n'
+    checkpoints = np.linspace(0, fights, CHECKPOINTS + 1).astype(int)
+    for checkpoint, balances in zip(checkpoints, careers.wealth):
+        output += (f'{checkpoint:<19}'
+                   + ''.join(f'{value:>8.0f}' for value in np.percentile(balances, PERCENTILES))
+                   + f'{balances.mean():>10.1f}\n')
+    return output
+
+
+def main() -> None:
+    """Simulate player careers under the payout model and print the economy report."""
+    parser = argparse.ArgumentParser(description='Player economy career simulator.')
+    parser.add_argument('--careers', type=int, default=50_000)
+    parser.add_argument('--fights', type=int, default=300, help='fights in each career')
+    parser.add_argument('--shop', choices=SHOPS, default='upgrade',
+                        help='when and what the players buy')
+    parser.add_argument('--player-policy', choices=policies.POLICIES, default='random')
+    parser.add_argument('--difficulty', choices=[level.name.lower() for level in Difficulty],
+                        default='easy', help='difficulty of the opponents')
+    parser.add_argument('--builds', default=PATH_TO_BUILDS,
+                        help='builds file with the costs, e.g. a balance proposal')
+    parser.add_argument('--grant', type=int, default=STARTING_GRANT,
+                        help=f'starting grant of new players (default {STARTING_GRANT})')
+    parser.add_argument('--odds-fights', type=int, default=20_000,
+                        help='simulated fights per build pair estimating the odds')
+    parser.add_argument('--shards', type=int, default=1,
+                        help='split the careers to shards run on worker processes')
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    robot_manager = RobotManager()
+    if args.builds != PATH_TO_BUILDS:
+        with open(args.builds, 'r') as builds_file:
+            robot_manager.builds = json.load(builds_file)
+        robot_manager.specs = {name: BuildSpec.compile(data)
+                               for name, data in robot_manager.builds.items()}
+    economy = Economy.simulated(robot_manager, args.odds_fights,
+                                policies.POLICIES[args.player_policy](),
+                                Difficulty[args.difficulty.upper()], args.seed, args.grant)
+    careers = run_careers(economy, args.careers, args.fights, args.shop, args.seed,
+                          args.shards, args.workers)
+    print(f'{args.careers} careers of {args.fights} fights, {args.shop} shop, '
+          f'{args.player_policy} weapons, {args.difficulty} opponents, '
+          f'{economy.grant} BTC grant.\n')
+    print(report(economy, careers, args.fights))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,196 @@
+import json
+import struct
+import sys
+from array import array
+from collections import deque
+from enum import IntEnum
+from typing import (Deque, Iterable, Iterator, List, NamedTuple, Optional, Sequence, TextIO,
+                    Tuple)
+
+from src.utils import drama_print, pace
+
+# Fields of a single event in the flat buffer: kind, side, value.
+EVENT_FIELDS = 3
+# Serialized log: header length, JSON header, little endian int32 events.
+HEADER_LENGTH = struct.Struct('<I')
+PLAYER, OPPONENT = 0, 1
+
+
+class EventKind(IntEnum):
+    """Type of the fight event, value meaning is in the comment."""
+    ROUND_STARTED = 0  # round count
+    WEAPON_FIRED = 1   # weapon slot of the side
+    MISSED = 2         # unused
+    DODGED = 3         # unused
+    DAMAGED = 4        # damage taken
+    OUT_OF_ENERGY = 5  # unused
+
+
+TEMPLATES = {
+    EventKind.ROUND_STARTED: '-------- ROUND {value} --------',
+    EventKind.WEAPON_FIRED: ' -> {name} loading {weapon} ...',
+    EventKind.MISSED: '  -> {name} missed !!!',
+    EventKind.DODGED: '  -> {name} dodged !!!',
+    EventKind.DAMAGED: '  -> {name} took {value} points of damage !!!',
+    EventKind.OUT_OF_ENERGY: ' -> {name} is out of energy.',
+}
+
+
+class Event(NamedTuple):
+    kind: EventKind
+    side: int
+    value: int
+
+
+class FightLog:
+    """
+    Append-only log of typed fight events.
+
+    Events are stored as ints in a flat array, text is rendered
+    only when asked for, so recording a fight builds no strings.
+    Every appended event is streamed to the sinks.
+    """
+
+    def __init__(self, names: Tuple[str, str],
+                 weapons: Tuple[Sequence[str], Sequence[str]],
+                 sinks: Iterable['EventSink'] = ()) -> None:
+        self.names = names
+        self.weapons = weapons
+        self.sinks = list(sinks)
+        self.buffer = array('i')
+
+    def __len__(self) -> int:
+        return len(self.buffer) // EVENT_FIELDS
+
+    def __iter__(self) -> Iterator[Event]:
+        buffer = self.buffer
+        for idx in range(0, len(buffer), EVENT_FIELDS):
+            yield Event(EventKind(buffer[idx]), buffer[idx + 1], buffer[idx + 2])
+
+    def __getitem__(self, index: int) -> Event:
+        idx = index * EVENT_FIELDS
+        return Event(EventKind(self.buffer[idx]), self.buffer[idx + 1], self.buffer[idx + 2])
+
+    def append(self, kind: EventKind, side: int = PLAYER, value: int = 0) -> None:
+        """Record the event and stream it to the sinks."""
+        self.buffer.extend((kind, side, value))
+        for sink in self.sinks:
+            sink.emit(self, len(self.buffer) // EVENT_FIELDS - 1)
+
+    def render(self, event: Event) -> str:
+        """Return text of the event."""
+        weapons = self.weapons[event.side]
+        weapon = weapons[event.value] if event.kind is EventKind.WEAPON_FIRED else ''
+        return TEMPLATES[event.kind].format(name=self.names[event.side],
+                                            weapon=weapon, value=event.value)
+
+    def lines(self) -> Iterator[str]:
+        """Render the events one by one."""
+        return (self.render(event) for event in self)
+
+    def text(self) -> str:
+        """Return the whole log as text."""
+        return ''.join(line + '\n' for line in self.lines())
+
+    def close(self) -> None:
+        """Close all the sinks."""
+        for sink in self.sinks:
+            sink.close()
+
+    def to_bytes(self) -> bytes:
+        """Return compact binary form of the log, without sinks."""
+        header = json.dumps([self.names, [list(weapons) for weapons in self.weapons]],
+                            separators=(',', ':')).encode('utf-8')
+        buffer = array('i', self.buffer)
+        if sys.byteorder == 'big':
+            buffer.byteswap()
+        return HEADER_LENGTH.pack(len(header)) + header + buffer.tobytes()
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> 'FightLog':
+        """Return log restored from its binary form."""
+        start = HEADER_LENGTH.size
+        end = start + HEADER_LENGTH.unpack_from(data)[0]
+        names, weapons = json.loads(data[start:end])
+        log = cls(tuple(names), tuple(weapons))  # type: ignore
+        log.buffer.frombytes(data[end:])
+        if sys.byteorder == 'big':
+            log.buffer.byteswap()
+        return log
+
+
+class EventSink:
+    """
+    Receiver of events streamed from the FightLog.
+
+    Hooks do nothing by default, subclass and override them.
+    """
+
+    def emit(self, log: FightLog, index: int) -> None:
+        """Receive event appended to the log at index."""
+
+    def close(self) -> None:
+        """Flush and release resources at the end of the fight."""
+
+
+class TerminalSink(EventSink):
+    """
+    Dramatic typing of the events to the console of the session.
+
+    Events are queued as they are emitted and typed out when shown,
+    with a pause after each weapon fired to build up the suspense.
+    """
+
+    def __init__(self, delay: float = 0.05, pause: float = 1.0) -> None:
+        self.delay = delay
+        self.pause = pause
+        self.pending: List[Tuple[FightLog, int]] = []
+
+    def emit(self, log: FightLog, index: int) -> None:
+        self.pending.append((log, index))
+
+    async def show(self) -> None:
+        """Type out the queued events."""
+        pending, self.pending = self.pending, []
+        for log, index in pending:
+            event = log[index]
+            await drama_print(log.render(event),
+                              0 if event.kind is EventKind.ROUND_STARTED else self.delay)
+            if event.kind is EventKind.WEAPON_FIRED:
+                await pace(self.pause)
+
+
+class FileSink(EventSink):
+    """Rendered events written to a text file."""
+
+    def __init__(self, out: TextIO) -> None:
+        self.out = out
+
+    def emit(self, log: FightLog, index: int) -> None:
+        self.out.write(log.render(log[index]) + '\n')
+
+    def close(self) -> None:
+        self.out.flush()
+
+
+class RingBufferSink(EventSink):
+    """Last events kept in memory, across fights, rendered on demand."""
+
+    def __init__(self, size: int = 1000) -> None:
+        self.events: Deque[Tuple[FightLog, int]] = deque(maxlen=size)
+
+    def emit(self, log: FightLog, index: int) -> None:
+        self.events.append((log, index))
+
+    def lines(self, last: Optional[int] = None) -> Iterator[str]:
+        """Render the kept events, or only the last few."""
+        events = list(self.events)[-last:] if last else self.events
+        return (log.render(log[index]) for log, index in events)
+
+
+async def replay(log: FightLog, speed: float = 1.0) -> None:
+    """Stream recorded fight to the console with pauses divided by speed."""
+    sink = TerminalSink(0.05 / speed, 1 / speed)
+    for index in range(len(log)):
+        sink.emit(log, index)
+    await sink.show()
@@ -0,0 +1,277 @@
+import itertools
+import math
+import random
+import sqlite3
+from bisect import bisect_left, insort
+from dataclasses import dataclass
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+from src.db import DBError
+from src.robots import Robot, RobotManager
+
+RATING_TABLE = 'ratings'
+GHOST_TABLE = 'ghosts'
+USER, BUILD = 'user', 'build'
+
+INITIAL_RATING = 1500.0
+# Rating points won by beating an equal opponent, shrinking from K_MAX
+# as the rating gets settled by fights, down to K_MIN.
+K_MAX = 64.0
+K_MIN = 16.0
+PROVISIONAL_FIGHTS = 10
+# Opponent is picked within the window around player rating,
+# the window is doubled until there is someone in it.
+RATING_WINDOW = 100.0
+# Ghosts seeded into empty table, with ratings spread around the initial one.
+GHOSTS = 1000
+GHOST_SPREAD = 200.0
+# Entries in a block of the rating index, split at twice as many.
+BLOCK_SIZE = 1000
+
+
+def expected_score(rating: float, other: float) -> float:
+    """Return expected score (1 win, 0.5 draw, 0 loss) against the other rating."""
+    return 1 / (1 + 10 ** ((other - rating) / 400))
+
+
+def k_factor(fights: int) -> float:
+    """Return K factor, uncertain ratings of few fights move faster."""
+    return max(K_MIN, K_MAX / math.sqrt(1 + fights / PROVISIONAL_FIGHTS))
+
+
+def rate(rating: float, other: float, score: float, fights: int) -> float:
+    """Return rating updated by the fight score against the other rating."""
+    return rating + k_factor(fights) * (score - expected_score(rating, other))
+
+
+@dataclass(frozen=True)
+class Ghost:
+    """Stored opponent robot with its own rating."""
+    ghost_id: int
+    name: str
+    build: str
+    rating: float
+    fights: int
+
+    def robot(self, robot_manager: RobotManager) -> Robot:
+        """Return fresh robot of the ghost."""
+        return Robot(self.name, robot_manager.get_build_spec(self.build), robot_manager.rng)
+
+
+class RatingIndex:
+    """
+    Ghosts ordered by (rating, id), in sorted blocks of limited size.
+
+    Block sizes are summed in a Fenwick tree, so the position of any
+    entry and the entry at any position are found in O(log n), and
+    so is the random pick within a rating window. An update touches
+    a single block, the blocks are split when they grow too long.
+    """
+
+    def __init__(self, entries: Iterable[Tuple[float, int]] = ()) -> None:
+        ordered = sorted(entries)
+        self.blocks: List[List[Tuple[float, int]]] = [
+            ordered[idx:idx + BLOCK_SIZE] for idx in range(0, len(ordered), BLOCK_SIZE)]
+        self._reindex()
+
+    def __len__(self) -> int:
+        return self.size
+
+    def __iter__(self) -> Iterator[Tuple[float, int]]:
+        return itertools.chain.from_iterable(self.blocks)
+
+    def add(self, rating: float, ghost_id: int) -> None:
+        """Insert the ghost at its rating."""
+        entry = (rating, ghost_id)
+        if not self.blocks:
+            self.blocks.append([entry])
+            self._reindex()
+            return
+        block_idx = min(bisect_left(self.maxes, entry), len(self.blocks) - 1)
+        block = self.blocks[block_idx]
+        insort(block, entry)
+        self.maxes[block_idx] = block[-1]
+        if len(block) > 2 * BLOCK_SIZE:
+            self.blocks[block_idx:block_idx + 1] = [block[:BLOCK_SIZE], block[BLOCK_SIZE:]]
+            self._reindex()
+        else:
+            self._grow(block_idx, 1)
+
+    def remove(self, rating: float, ghost_id: int) -> bool:
+        """Remove the ghost listed at the rating, return False if it is not listed there."""
+        entry = (rating, ghost_id)
+        block_idx = bisect_left(self.maxes, entry)
+        if block_idx == len(self.blocks):
+            return False
+        block = self.blocks[block_idx]
+        offset = bisect_left(block, entry)
+        if block[offset] != entry:
+            return False
+        del block[offset]
+        if block:
+            self.maxes[block_idx] = block[-1]
+            self._grow(block_idx, -1)
+        else:
+            del self.blocks[block_idx]
+            self._reindex()
+        return True
+
+    def move(self, rating: float, new_rating: float, ghost_id: int) -> bool:
+        """Move the ghost listed at the rating to the new one, return False if not listed."""
+        if not self.remove(rating, ghost_id):
+            return False
+        self.add(new_rating, ghost_id)
+        return True
+
+    def pick(self, rating: float, rng: random.Random,
+             window: float = RATING_WINDOW) -> Optional[int]:
+        """Return random ghost id within the window around rating, widened if empty."""
+        if not self.size:
+            return None
+        while True:
+            low = self._bisect((rating - window,))
+            high = self._bisect((rating + window, math.inf))
+            if high > low:
+                block_idx, offset = self._locate(rng.randrange(low, high))
+                return self.blocks[block_idx][offset][1]
+            window *= 2
+
+    def _bisect(self, key: Tuple[float, ...]) -> int:
+        """Return position of the first entry not less than key."""
+        block_idx = bisect_left(self.maxes, key)
+        if block_idx == len(self.blocks):
+            return self.size
+        position = bisect_left(self.blocks[block_idx], key)
+        while block_idx:
+            position += self.tree[block_idx]
+            block_idx -= block_idx & -block_idx
+        return position
+
+    def _locate(self, position: int) -> Tuple[int, int]:
+        """Return (block, offset) of the entry at position."""
+        block_idx, step = 0, 1 << len(self.blocks).bit_length()
+        while step:
+            if block_idx + step <= len(self.blocks) and self.tree[block_idx + step] <= position:
+                block_idx += step
+                position -= self.tree[block_idx]
+            step >>= 1
+        return block_idx, position
+
+    def _grow(self, block_idx: int, delta: int) -> None:
+        """Add delta to the size of the block."""
+        self.size += delta
+        idx = block_idx + 1
+        while idx < len(self.tree):
+            self.tree[idx] += delta
+            idx += idx & -idx
+
+    def _reindex(self) -> None:
+        """Rebuild the block maxima and the Fenwick tree of block sizes."""
+        self.maxes = [block[-1] for block in self.blocks]
+        self.tree = [0] * (len(self.blocks) + 1)
+        for idx, block in enumerate(self.blocks, 1):
+            self.tree[idx] += len(block)
+            if (parent := idx + (idx & -idx)) <= len(self.blocks):
+                self.tree[parent] += self.tree[idx]
+        self.size = sum(map(len, self.blocks))
+
+
+class Matchmaker:
+    """
+    Opponents matched by rating, from the ghosts stored in db.
+
+    Users, builds and ghosts are rated Elo style and updated after
+    every fight. The ghosts are indexed by rating in memory, loaded
+    on the first match. All calls go to the DB thread, so the index
+    changes in step with the ghosts table.
+    """
+
+    def __init__(self, conn: sqlite3.Connection, robot_manager: RobotManager,
+                 ghosts: int = GHOSTS) -> None:
+        self.conn = conn
+        self.robot_manager = robot_manager
+        self.ghosts = ghosts
+        self.index: Optional[RatingIndex] = None
+        try:
+            self.conn.execute(f'CREATE TABLE IF NOT EXISTS {RATING_TABLE} '
+                              '(kind TEXT NOT NULL, name TEXT NOT NULL, rating REAL NOT NULL, '
+                              'fights INT NOT NULL, PRIMARY KEY (kind, name)) WITHOUT ROWID;')
+            self.conn.execute(f'CREATE TABLE IF NOT EXISTS {GHOST_TABLE} '
+                              '(id INTEGER PRIMARY KEY, name TEXT NOT NULL, build TEXT NOT NULL, '
+                              'rating REAL NOT NULL, fights INT NOT NULL);')
+            self.conn.commit()
+        except sqlite3.OperationalError as emsg:
+            raise DBError('Failed creating ratings db tables!') from emsg
+
+    def load(self) -> RatingIndex:
+        """Return the ghost index, read from db, seeding the ghosts if there are none."""
+        if self.index is None:
+            if not self.conn.execute(f'SELECT 1 FROM {GHOST_TABLE} LIMIT 1').fetchone():
+                self.populate(self.ghosts)
+            self.index = RatingIndex(self.conn.execute(f'SELECT rating, id FROM {GHOST_TABLE}'))
+        return self.index
+
+    def populate(self, count: int) -> None:
+        """Add count ghosts of random builds and ratings, the index is read again."""
+        rng = self.robot_manager.rng
+        builds = self.robot_manager.get_all_build_names()
+        ghosts = [(self.robot_manager.generate_robot_name(), rng.choice(builds),
+                   rng.gauss(INITIAL_RATING, GHOST_SPREAD)) for _ in range(count)]
+        try:
+            with self.conn:
+                self.conn.executemany(f'INSERT INTO {GHOST_TABLE} (name, build, rating, fights) '
+                                      'VALUES (?, ?, ?, 0)', ghosts)
+        except (sqlite3.IntegrityError, sqlite3.OperationalError) as emsg:
+            raise DBError('Crashed while adding ghosts.') from emsg
+        self.index = None
+
+    def rating(self, kind: str, name: str) -> Tuple[float, int]:
+        """Return (rating, fights) of the user or build, initial one if not rated yet."""
+        row = self.conn.execute(f'SELECT rating, fights FROM {RATING_TABLE} '
+                                'WHERE kind = ? AND name = ?', (kind, name)).fetchone()
+        return (row[0], row[1]) if row else (INITIAL_RATING, 0)
+
+    def ghost(self, ghost_id: int) -> Ghost:
+        """Return the ghost by id."""
+        row = self.conn.execute(f'SELECT id, name, build, rating, fights FROM {GHOST_TABLE} '
+                                'WHERE id = ?', (ghost_id,)).fetchone()
+        return Ghost(*row)
+
+    def find_opponent(self, user: str) -> Ghost:
+        """Return ghost rated close to the user."""
+        ghost_id = self.load().pick(self.rating(USER, user)[0], self.robot_manager.rng)
+        assert ghost_id is not None, 'No ghosts to match.'
+        return self.ghost(ghost_id)
+
+    def record(self, user: str, build: str, ghost: Ghost, score: float) -> float:
+        """
+        Update ratings by the fight score of the user (1 win, 0.5 draw, 0 loss).
+
+        Both the user and the ghost ratings move, and so do ratings
+        of their builds. Return the new rating of the user.
+        """
+        ghost = self.ghost(ghost.ghost_id)
+        user_rating, user_fights = self.rating(USER, user)
+        build_rating, build_fights = self.rating(BUILD, build)
+        ghost_build_rating, ghost_build_fights = self.rating(BUILD, ghost.build)
+        ratings = [(USER, user, rate(user_rating, ghost.rating, score, user_fights)),
+                   (BUILD, build, rate(build_rating, ghost_build_rating, score, build_fights))]
+        if ghost.build != build:
+            ratings.append((BUILD, ghost.build, rate(ghost_build_rating, build_rating,
+                                                     1 - score, ghost_build_fights)))
+        ghost_rating = rate(ghost.rating, user_rating, 1 - score, ghost.fights)
+        try:
+            with self.conn:
+                self.conn.executemany(f'INSERT INTO {RATING_TABLE} VALUES (?, ?, ?, 1) '
+                                      'ON CONFLICT (kind, name) DO UPDATE SET '
+                                      'rating = excluded.rating, fights = fights + 1', ratings)
+                self.conn.execute(f'UPDATE {GHOST_TABLE} SET rating = ?, fights = fights + 1 '
+                                  'WHERE id = ?', (ghost_rating, ghost.ghost_id))
+        except (sqlite3.IntegrityError, sqlite3.OperationalError) as emsg:
+            raise DBError('Crashed while updating ratings.') from emsg
+        # The ghost may have been rated by another process sharing the db since the
+        # index was loaded, then the index is stale and read again on the next match.
+        if self.index is not None and not self.index.move(ghost.rating, ghost_rating,
+                                                          ghost.ghost_id):
+            self.index = None
+        return ratings[0][2]
@@ -1,22 +1,39 @@
-from typing import Dict
+from typing import Any, Dict, List, Optional, Tuple
 
-from src import pit
+from src import metrics, pit
+from src.archive import FightArchive
+from src.broadcast import live_fights
+from src.events import replay
+from src.matchmaking import Matchmaker
 from src.robots import RobotManager, RobotShop
+from src.strategy import Difficulty
 from src.users import User
-from src.utils import clear_console
+from src.utils import SessionClosed, ask, clear_console, echo, get_console, pace
+
+LEADERBOARDS = ('balance', 'winrate')
+LEADERBOARD_PAGE = 10
 
 
 class MainMenu:
 
-    def __init__(self, user: User, robot_manager: RobotManager) -> None:
+    def __init__(self, user: User, robot_manager: RobotManager,
+                 fight_archive: Optional[FightArchive] = None,
+                 matchmaker: Optional[Matchmaker] = None) -> None:
         self.user = user
         self.robot_manager = robot_manager
+        self.fight_archive = fight_archive
+        self.matchmaker = matchmaker
+        self.difficulty = Difficulty.EASY
 
     def get_menu_options(self) -> Dict[str, str]:
         """Return main menu options list."""
         return {'battle': 'Enter the PIT and fight!',
                 'robot': 'Shows your robot details.',
                 'shop': 'Enter the robot shop.',
+                'difficulty': 'Change the opponent difficulty.',
+                'replay': 'Watch one of your past fights.',
+                'watch': 'Watch a fight live in the PIT.',
+                'leaders': 'Show the leaderboard.',
                 'quit': 'Exit the game.'}
 
     def get_menu(self) -> str:
@@ -28,37 +45,165 @@ class MainMenu:
         menu += f'\n{"":#^20}'
         return menu
 
-    def present_menu(self) -> None:
-        """Present the main menu."""
+    async def present_menu(self) -> None:
+        """Present the main menu, until the player quits."""
         details = False
         while True:
             clear_console()
-            print('----------------------------')
-            print(self.user.name.upper())
+            echo('----------------------------')
+            echo(self.user.name.upper())
             if self.user.robot and details:
-                print(self.user.robot)
+                echo(self.user.robot)
             elif self.user.robot:
-                print(f'Your current robot: {self.user.robot.name}')
+                echo(f'Your current robot: {self.user.robot.name}')
             else:
-                print('You don\'t have any robot yet.')
-            print('Your balance: ' + self.user.get_balance(full=False))
+                echo('You don\'t have any robot yet.')
+            echo('Your balance: ' + self.user.get_balance(full=False))
+            echo(f'Opponent difficulty: {self.difficulty.name.lower()}')
 
-            print(self.get_menu())
+            echo(self.get_menu())
             details = False
-            if self.execute_option() == 'robot':
+            if await self.execute_option() == 'robot':
                 details = True
 
-    def execute_option(self) -> str:    # TODO refactor
+    async def execute_option(self) -> str:    # TODO refactor
         """Read user input and execute option."""
-        print('\nPick your action.')
-        print(tuple(self.get_menu_options().keys()))
-        action = input('').lower()
+        echo('\nPick your action.')
+        echo(tuple(self.get_menu_options().keys()))
+        action = (await ask('')).lower()
         if action == 'quit':
-            exit(0)
+            raise SessionClosed()
         if action == 'shop':
             clear_console()
-            self.user.buy_robot(RobotShop(self.robot_manager, self.user.get_balance_int()))
+            await self.user.buy_robot(RobotShop(self.robot_manager, self.user.get_balance_int()))
         if action == 'battle':
             clear_console()
-            pit.run(self.user, self.robot_manager.generate_robot())
+            await self.battle()
+        if action == 'difficulty':
+            await self.select_difficulty()
+        if action == 'replay':
+            clear_console()
+            await self.replay_fight()
+        if action == 'watch':
+            clear_console()
+            await self.watch_fight()
+        if action == 'leaders':
+            clear_console()
+            await self.show_leaderboard()
+        if action == 'profile' and metrics.profiler.output:
+            echo(f'Profiling of this session {"on" if metrics.profiler.toggle() else "off"}.')
+            await pace(1)
         return action
+
+    async def battle(self) -> None:
+        """Fight opponent matched by rating, random one without matchmaker."""
+        if not self.matchmaker:
+            await pit.run(self.user, self.robot_manager.generate_robot(), self.difficulty,
+                          self.fight_archive)
+            return
+        db_handle = self.user.db_handle
+        ghost = await db_handle.run(self.matchmaker.find_opponent, self.user.name)
+        result = await pit.run(self.user, ghost.robot(self.robot_manager), self.difficulty,
+                               self.fight_archive)
+        if result:
+            score = {pit.Outcome.WIN: 1.0, pit.Outcome.DRAW: 0.5}.get(result.outcome, 0.0)
+            await db_handle.run(self.matchmaker.record, self.user.name, self.user.robot.build,
+                                ghost, score)
+
+    async def select_difficulty(self) -> None:
+        """Prompt for opponent difficulty until valid one is selected."""
+        levels = tuple(level.name.lower() for level in Difficulty)
+        while ((level := (await ask(f'Choose difficulty {levels}: ')).upper())
+               not in Difficulty.__members__):
+            echo(f'"{level.lower()}" is not valid difficulty.')
+        self.difficulty = Difficulty[level]
+
+    async def replay_fight(self) -> None:
+        """List recent fights of the user and replay the selected one."""
+        db_handle = self.user.db_handle
+        if not self.fight_archive or not (
+                fights := await db_handle.run(self.fight_archive.recent, self.user.name)):
+            echo('No fights recorded yet.')
+            await pace(2)
+            return
+        echo('Your recent fights:', *fights, sep='\n')
+        ids = {str(fight.fight_id) for fight in fights}
+        while ((fight_id := (await ask('\nFight to replay (Enter to return): ')).lstrip('#'))
+               not in ids):
+            if not fight_id:
+                return
+            echo(f'"{fight_id}" is not one of your recent fights.')
+        while True:
+            try:
+                speed = float(await ask('Replay speed (1 normal, 2 double, ...): ') or 1)
+            except ValueError:
+                continue
+            if speed > 0:
+                break
+        log = await db_handle.run(self.fight_archive.load, int(fight_id))
+        assert log, 'Listed fight missing in the archive.'
+        clear_console()
+        await replay(log, speed)
+        await ask('\nPress any key to continue to main menu...')
+
+    async def watch_fight(self) -> None:
+        """List live fights and stream the selected one until it ends."""
+        if not (broadcasts := list(live_fights.broadcasts.values())):
+            echo('Nobody is fighting in the PIT right now.')
+            await pace(2)
+            return
+        echo('Live fights:', *broadcasts, sep='\n')
+        while True:
+            fight_id = (await ask('\nFight to watch (Enter to return): ')).lstrip('#')
+            if not fight_id:
+                return
+            if fight_id.isdigit() and (broadcast := live_fights.get(int(fight_id))):
+                break
+            echo(f'"{fight_id}" is not a live fight.')
+        clear_console()
+        console = get_console()
+        subscriber = broadcast.subscribe()
+        try:
+            while (data := await subscriber.get()) is not None:
+                console.write_wire(data)
+                await console.drain()
+        finally:
+            broadcast.unsubscribe(subscriber)
+        echo('\nYou fell behind the fight, the stream was cut.' if subscriber.dropped
+             else '\nThe fight is over.')
+        await ask('\nPress any key to continue to main menu...')
+
+    async def show_leaderboard(self) -> None:
+        """Page through the leaderboard ranked by balance or by win rate."""
+        db_handle = self.user.db_handle
+        echo(f'Your record: {await db_handle.run(db_handle.get_stats, self.user.name)}')
+        while (board := (await ask(f'Rank by {LEADERBOARDS} (Enter to return): ')).lower()
+               ) not in LEADERBOARDS:
+            if not board:
+                return
+            echo(f'"{board}" is not a leaderboard.')
+        rank, after = 0, None
+        while True:
+            rows, after = await self._leaderboard_page(board, after)
+            for row in rows:
+                rank += 1
+                echo(f'{rank:>6}. {row}')
+            if len(rows) < LEADERBOARD_PAGE:
+                break
+            if (await ask('\nEnter for next page, q to return: ')).lower() == 'q':
+                return
+        if not rank:
+            echo('Nobody is ranked yet.')
+        await ask('\nPress any key to continue to main menu...')
+
+    async def _leaderboard_page(self, board: str,
+                                after: Optional[Tuple[Any, str]]) -> Tuple[List[str], Any]:
+        """Return rows of the leaderboard page after the cursor, and the next cursor."""
+        db_handle = self.user.db_handle
+        if board == 'balance':
+            users = await db_handle.run(db_handle.top_by_balance, LEADERBOARD_PAGE, after)
+            rows = [f'{name:<20} {balance:>10} BTC' for name, balance in users]
+            return rows, (users[-1][1], users[-1][0]) if users else None
+        stats = await db_handle.run(db_handle.top_by_win_rate, LEADERBOARD_PAGE, after)
+        rows = [f'{entry.user:<20} {entry}' for entry in stats]
+        return rows, (stats[-1].win_rate, stats[-1].user) if stats else None
@@ -0,0 +1,267 @@
+import asyncio
+import functools
+import os
+import sys
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+PREFIX = 'cyberpit'
+# Upper bounds of the latency histogram buckets, in seconds.
+BUCKETS = (1e-5, 5e-5, 1e-4, 5e-4, 1e-3, 5e-3, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0)
+# Seconds between stack samples of the profiler.
+SAMPLE_INTERVAL = 0.005
+# Seconds between writes of the metrics file.
+EXPORT_INTERVAL = 10.0
+
+
+class Histogram:
+    """Latency distribution in cumulative buckets, Prometheus style."""
+
+    def __init__(self, buckets: Tuple[float, ...] = BUCKETS) -> None:
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.total = 0.0
+
+    @property
+    def count(self) -> int:
+        return sum(self.counts)
+
+    def observe(self, value: float) -> None:
+        """Count the value in its bucket."""
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.total += value
+
+
+class MetricsRegistry:
+    """
+    Counters and latency histograms of the whole process.
+
+    All the sessions of the server record to the same registry,
+    so the metrics are aggregated across them. Recording may come
+    from the DB thread and the hashing pool too, hence the lock.
+    """
+
+    def __init__(self) -> None:
+        self.histograms: Dict[Tuple[str, str], Histogram] = {}
+        self.counters: Counter = Counter()
+        self.lock = threading.Lock()
+
+    def observe(self, metric: str, operation: str, seconds: float) -> None:
+        """Record duration of the operation."""
+        with self.lock:
+            if (histogram := self.histograms.get((metric, operation))) is None:
+                histogram = self.histograms[metric, operation] = Histogram()
+            histogram.observe(seconds)
+
+    def inc(self, metric: str, operation: str, amount: int = 1) -> None:
+        """Add amount to the counter of the operation."""
+        with self.lock:
+            self.counters[metric, operation] += amount
+
+    def to_prometheus(self) -> str:
+        """Return all the metrics in Prometheus text exposition format."""
+        lines = []
+        with self.lock:
+            for metric in sorted({metric for metric, _ in self.histograms}):
+                name = f'{PREFIX}_{metric}_seconds'
+                lines += [f'# HELP {name} Duration of {metric} operations.',
+                          f'# TYPE {name} histogram']
+                for (hist_metric, operation), histogram in sorted(self.histograms.items()):
+                    if hist_metric != metric:
+                        continue
+                    cumulative = 0
+                    for bound, count in zip((*histogram.buckets, '+Inf'), histogram.counts):
+                        cumulative += count
+                        lines.append(f'{name}_bucket{{op="{operation}",le="{bound}"}} '
+                                     f'{cumulative}')
+                    lines.append(f'{name}_sum{{op="{operation}"}} {histogram.total:.9f}')
+                    lines.append(f'{name}_count{{op="{operation}"}} {cumulative}')
+            for metric in sorted({metric for metric, _ in self.counters}):
+                name = f'{PREFIX}_{metric}_total'
+                lines += [f'# HELP {name} Count of {metric}.', f'# TYPE {name} counter']
+                lines += [f'{name}{{op="{operation}"}} {count}'
+                          for (counter_metric, operation), count in sorted(self.counters.items())
+                          if counter_metric == metric]
+        return ''.join(line + '\n' for line in lines)
+
+    def write(self, path: str) -> None:
+        """Atomically write the metrics to the file, for the textfile collector."""
+        tmp_file = path + '.tmp'
+        with open(tmp_file, 'w') as metrics_file:
+            metrics_file.write(self.to_prometheus())
+        os.replace(tmp_file, path)
+
+
+registry = MetricsRegistry()
+# Original methods replaced by the timed ones, to restore on disable.
+_originals: Dict[Tuple[type, str], Any] = {}
+
+
+def timed(func: Callable, metric: str, operation: str) -> Callable:
+    """
+    Return func recording its duration and errors to the registry.
+
+    Awaitable futures returned (bcrypt in the pool) are timed until done.
+    """
+    @functools.wraps(func)
+    def wrapper(*args: Any, **kwargs: Any) -> Any:
+        start = time.perf_counter()
+        try:
+            result = func(*args, **kwargs)
+        except BaseException:
+            registry.inc('errors', operation)
+            raise
+        if isinstance(result, asyncio.Future):
+            result.add_done_callback(
+                lambda _: registry.observe(metric, operation, time.perf_counter() - start))
+        else:
+            registry.observe(metric, operation, time.perf_counter() - start)
+        return result
+    return wrapper
+
+
+def hot_paths() -> List[Tuple[type, str, str]]:
+    """
+    Return methods timed while instrumentation is on: (owner, method, metric).
+
+    Owners are imported only now, so loading metrics does not load the game.
+    """
+    from src.db import DBHandler
+    from src.pit import FightEngine, PlayersTurn
+    from src.robots import RobotManager, RobotShop
+    from src.users import PwdManager
+    from src.utils import FightScreen
+    return [
+        *((DBHandler, name, 'db') for name, method in vars(DBHandler).items()
+          if callable(method) and not name.startswith('_') and name != 'run'),
+        (PwdManager, 'check_password', 'bcrypt'),
+        (PwdManager, 'hash_password', 'bcrypt'),
+        (FightEngine, 'play_turn', 'turn'),
+        (PlayersTurn, '_get_banner', 'render'),
+        (FightScreen, 'draw', 'render'),
+        (RobotManager, 'showcase', 'render'),
+        (RobotShop, '_print_shop_display', 'shop'),
+    ]
+
+
+def enable() -> None:
+    """
+    Time the hot paths.
+
+    Methods are swapped for timed ones only now, so with instrumentation
+    off the game runs the original code, at no cost at all.
+    """
+    for owner, name, metric in hot_paths():
+        if (owner, name) not in _originals:
+            _originals[owner, name] = original = vars(owner)[name]
+            setattr(owner, name, timed(original, metric, f'{owner.__name__}.{name}'))
+
+
+def disable() -> None:
+    """Restore the original hot path methods."""
+    for (owner, name), original in _originals.items():
+        setattr(owner, name, original)
+    _originals.clear()
+
+
+def enabled() -> bool:
+    """Return True if the hot paths are timed."""
+    return bool(_originals)
+
+
+async def serve_metrics(host: str, port: int) -> asyncio.AbstractServer:
+    """Start HTTP endpoint returning the metrics to any request, for scraping."""
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            await reader.readuntil(b'\r\n\r\n')
+            body = registry.to_prometheus().encode('utf-8')
+            writer.write(b'HTTP/1.0 200 OK\r\n'
+                         b'Content-Type: text/plain; version=0.0.4\r\n'
+                         b'Content-Length: ' + str(len(body)).encode() + b'\r\n\r\n' + body)
+            await writer.drain()
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    return await asyncio.start_server(handle, host, port)
+
+
+async def export(path: Optional[str], host: str, port: Optional[int],
+                 interval: float = EXPORT_INTERVAL) -> None:
+    """Serve the metrics for scraping and write them to file every interval, until cancelled."""
+    server = await serve_metrics(host, port) if port else None
+    try:
+        while True:
+            await asyncio.sleep(interval)
+            if path:
+                registry.write(path)
+    finally:
+        if server:
+            server.close()
+
+
+class SamplingProfiler:
+    """
+    Statistical profiler of the sessions which turned it on.
+
+    A background thread takes the stack of the event loop thread every
+    interval, keeping it only while a profiled session task is running.
+    Stacks are counted in the folded format of flame graph tools.
+    """
+
+    def __init__(self, interval: float = SAMPLE_INTERVAL) -> None:
+        self.interval = interval
+        # File the samples are written to, sessions can profile only if set.
+        self.output: Optional[str] = None
+        self.samples: Counter = Counter()
+        self.tasks: Set[asyncio.Task] = set()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread_id = 0
+        self._sampler: Optional[threading.Thread] = None
+
+    def toggle(self) -> bool:
+        """Turn profiling of the current session on or off, return True if on."""
+        task = asyncio.current_task()
+        assert task, 'Profiler toggled outside of a session.'
+        if task in self.tasks:
+            self.tasks.discard(task)
+            return False
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+        if self._sampler is None:
+            self._loop = asyncio.get_running_loop()
+            self._thread_id = threading.get_ident()
+            self._sampler = threading.Thread(target=self._sample, name='profiler', daemon=True)
+            self._sampler.start()
+        return True
+
+    def folded(self) -> str:
+        """Return sampled stacks, one 'outer;...;inner count' line each."""
+        return ''.join(f'{stack} {count}\n' for stack, count in self.samples.most_common())
+
+    def write(self) -> None:
+        """Write the folded stacks to the output file, if any were sampled."""
+        if self.output and self.samples:
+            with open(self.output, 'w') as profile_file:
+                profile_file.write(self.folded())
+
+    def _sample(self) -> None:
+        """Take the stacks of the loop thread while any profiled task is running."""
+        while True:
+            time.sleep(self.interval)
+            if not self.tasks or asyncio.current_task(self._loop) not in self.tasks:
+                continue
+            frame = sys._current_frames().get(self._thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f'{os.path.basename(code.co_filename)}:{code.co_name}')
+                frame = frame.f_back
+            self.samples[';'.join(reversed(stack))] += 1
+
+
+profiler = SamplingProfiler()
@@ -0,0 +1,180 @@
+import hashlib
+import json
+import os
+import threading
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple, Union
+
+from src import robots
+
+PATH_TO_ODDS_CACHE = 'data/cache/odds.json'
+
+BuildData = Dict[str, Union[str, int, List[str]]]
+# (probability, energy left, damage dealt) of one turn
+TurnOutcome = Tuple[float, int, int]
+Odds = Tuple[float, float, float, float]
+
+# In-memory copy of the disk cache, loaded on first use.
+_odds_cache: Optional[Dict[str, List[float]]] = None
+# Odds are solved by the catalog warm-up thread too, a pair is solved once.
+_cache_lock = threading.Lock()
+
+
+@dataclass
+class MatchupOdds:
+    """Exact outcome probabilities of the fight for the player."""
+    win: float
+    draw: float
+    loss: float
+    rounds: float
+
+    def __str__(self) -> str:
+        return (f'win {self.win:.1%} | draw {self.draw:.1%} | '
+                f'loss {self.loss:.1%} | ~{self.rounds:.1f} rounds')
+
+
+class FightSide:
+    """Solver view of one build."""
+
+    def __init__(self, build_data: BuildData) -> None:
+        spec = robots.BuildSpec.compile(build_data)
+        self.health = spec.health
+        self.energy = spec.energy
+        # Robot rolls 1..100 and succeeds when the roll is below the chance.
+        self.dodge = min(max(spec.dodge_chance - 1, 0), 100) / 100
+        self.miss = min(max(spec.miss_chance - 1, 0), 100) / 100
+        self.costs = list(spec.weapon_energy)
+        self.energy_needed = spec.energy_needed
+
+
+class MatchupSolver:
+    """
+    Exact win/draw/loss odds of two builds as a finite Markov chain.
+
+    State is (player health, player energy, opponent health, opponent energy)
+    at the start of a round. Both sides pick uniformly among affordable
+    weapons, as the opponent in the pit does. Every round spends energy,
+    so the chain is acyclic and memoized recursion over it terminates.
+    """
+
+    def __init__(self, player: BuildData, opponent: BuildData) -> None:
+        self.player = FightSide(player)
+        self.opponent = FightSide(opponent)
+        self._memo: Dict[Tuple[int, int, int, int], Odds] = {}
+        self._shots: Dict[Tuple[int, int], List[TurnOutcome]] = {}
+
+    def solve(self) -> MatchupOdds:
+        """Return odds of the fight from full health and energy."""
+        return MatchupOdds(*self._state_odds(self.player.health, self.player.energy,
+                                             self.opponent.health, self.opponent.energy))
+
+    def _turn(self, side: int, energy: int) -> List[TurnOutcome]:
+        """Return outcomes of a turn with given energy (side 0 player, 1 opponent)."""
+        if (side, energy) in self._shots:
+            return self._shots[side, energy]
+        attacking, attacked = ((self.player, self.opponent) if side == 0
+                               else (self.opponent, self.player))
+        affordable = [cost for cost in attacking.costs if cost <= energy]
+        hit = (1 - attacking.miss) * (1 - attacked.dodge)
+        outcomes: List[TurnOutcome] = []
+        for cost in affordable:
+            pick = 1 / len(affordable)
+            if hit:
+                outcomes.append((pick * hit, energy - cost, cost))
+            if hit < 1:
+                outcomes.append((pick * (1 - hit), energy - cost, 0))
+        self._shots[side, energy] = outcomes
+        return outcomes
+
+    def _state_odds(self, p_health: int, p_energy: int,
+                    o_health: int, o_energy: int) -> Odds:
+        """Return (win, draw, loss, expected rounds) from the round start state."""
+        if p_health <= 0:
+            return 0.0, 0.0, 1.0, 0.0
+        if o_health <= 0:
+            return 1.0, 0.0, 0.0, 0.0
+        p_exhausted = p_energy < self.player.energy_needed
+        o_exhausted = o_energy < self.opponent.energy_needed
+        if p_exhausted and o_exhausted:
+            return 0.0, 1.0, 0.0, 0.0
+        state = (p_health, p_energy, o_health, o_energy)
+        if state in self._memo:
+            return self._memo[state]
+
+        win = draw = loss = rounds = 0.0
+        players_turn = [(1.0, p_energy, 0)] if p_exhausted else self._turn(0, p_energy)
+        for p_prob, p_energy_left, p_damage in players_turn:
+            o_health_left = o_health - p_damage
+            if o_exhausted or o_health_left <= 0:
+                opponents_turn = [(1.0, o_energy, 0)]
+            else:
+                opponents_turn = self._turn(1, o_energy)
+            for o_prob, o_energy_left, o_damage in opponents_turn:
+                prob = p_prob * o_prob
+                next_odds = self._state_odds(max(p_health - o_damage, 0), p_energy_left,
+                                             max(o_health_left, 0), o_energy_left)
+                win += prob * next_odds[0]
+                draw += prob * next_odds[1]
+                loss += prob * next_odds[2]
+                rounds += prob * next_odds[3]
+        self._memo[state] = odds = (win, draw, loss, rounds + 1)
+        return odds
+
+
+def cache_key(player: BuildData, opponent: BuildData) -> str:
+    """Return cache key changing whenever any of the builds changes."""
+    return hashlib.sha1(json.dumps([player, opponent], sort_keys=True)
+                        .encode('utf-8')).hexdigest()
+
+
+def _load_cache() -> Dict[str, List[float]]:
+    """Return the disk cache, reading it on first use."""
+    global _odds_cache
+    if _odds_cache is None:
+        try:
+            with open(PATH_TO_ODDS_CACHE, 'r') as cache_file:
+                _odds_cache = json.load(cache_file)
+        except (OSError, ValueError):
+            _odds_cache = {}
+    return _odds_cache  # type: ignore
+
+
+def _save_cache(cache: Dict[str, List[float]]) -> None:
+    """Atomically write the cache to disk, failing silently when not writable."""
+    try:
+        os.makedirs(os.path.dirname(PATH_TO_ODDS_CACHE), exist_ok=True)
+        tmp_file = PATH_TO_ODDS_CACHE + '.tmp'
+        with open(tmp_file, 'w') as cache_file:
+            json.dump(cache, cache_file)
+        os.replace(tmp_file, PATH_TO_ODDS_CACHE)
+    except OSError:
+        pass
+
+
+def get_odds(player: BuildData, opponent: BuildData) -> MatchupOdds:
+    """Return odds of player build against opponent build, cached on disk."""
+    key = cache_key(player, opponent)
+    with _cache_lock:
+        cache = _load_cache()
+        if key not in cache:
+            odds = MatchupSolver(player, opponent).solve()
+            cache[key] = [odds.win, odds.draw, odds.loss, odds.rounds]
+            _save_cache(cache)
+        return MatchupOdds(*cache[key])
+
+
+def robot_odds(player: 'robots.Robot', opponent: 'robots.Robot') -> MatchupOdds:
+    """Return odds of the fight between two robots."""
+    return get_odds(player.get_init_data(), opponent.get_init_data())
+
+
+def field_odds(robot_manager: 'robots.RobotManager', build_name: str) -> MatchupOdds:
+    """Return odds of the build against opponent generated in the pit (any build)."""
+    player = robot_manager.get_build_data(build_name)
+    opponents = [get_odds(player, robot_manager.get_build_data(opponent))
+                 for opponent in robot_manager.get_all_build_names()]
+    count = len(opponents)
+    return MatchupOdds(sum(odds.win for odds in opponents) / count,
+                       sum(odds.draw for odds in opponents) / count,
+                       sum(odds.loss for odds in opponents) / count,
+                       sum(odds.rounds for odds in opponents) / count)
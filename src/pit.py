@@ -1,10 +1,196 @@
-import random
+import asyncio
+import inspect
 from abc import ABC, abstractmethod
-from time import sleep
-
+from collections import Counter
+from dataclasses import dataclass
+from enum import Enum
+from typing import Any, Iterable, Optional
+
+from src import odds
+from src.archive import FightArchive
+from src.broadcast import BroadcastSink, live_fights
+from src.events import OPPONENT, PLAYER, EventKind, EventSink, FightLog, TerminalSink
+from src.policies import HumanPolicy, Policy, TablePolicy, random_policy
 from src.robots import Robot, Weapons
+from src.strategy import Difficulty
 from src.users import User
-from src.utils import FightRecorder, clear_console, drama_print, safe_get
+from src.utils import FightScreen, ask, clear_console, drama_print, echo, pace, safe_get
+
+
+class Outcome(Enum):
+    """Outcome of the fight from the player's point of view."""
+    WIN = 'win'
+    LOSS = 'loss'
+    DRAW = 'draw'
+
+
+@dataclass
+class FightResult:
+    outcome: Outcome
+    rounds: int
+    player_health: int
+    player_energy: int
+    opponent_health: int
+    opponent_energy: int
+
+
+class FightObserver:
+    """
+    Receiver of the fight events emitted by FightEngine.
+
+    All the hooks do nothing by default, subclass and override
+    the ones needed for presentation.
+    """
+
+    def round_started(self, count: int) -> None:
+        """New round is starting."""
+
+    def out_of_energy(self, robot: Robot) -> None:
+        """Robot cannot afford any weapon and skips the turn."""
+
+    def weapon_loaded(self, robot: Robot, weapon: str) -> None:
+        """Robot used the weapon, energy was spent."""
+
+    def missed(self, robot: Robot) -> None:
+        """Robot missed the shot."""
+
+    def dodged(self, robot: Robot) -> None:
+        """Robot dodged the shot."""
+
+    def damaged(self, robot: Robot, damage: int) -> None:
+        """Robot took the damage."""
+
+
+class EventRecorder(FightObserver):
+    """Observer recording the fight events to the FightLog, no text built."""
+
+    def __init__(self, player: Robot, opponent: Robot, log: FightLog) -> None:
+        self.player = player
+        self.opponent = opponent
+        self.log = log
+
+    def side(self, robot: Robot) -> int:
+        """Return side of the robot in the log."""
+        return PLAYER if robot is self.player else OPPONENT
+
+    def round_started(self, count: int) -> None:
+        self.log.append(EventKind.ROUND_STARTED, PLAYER, count)
+
+    def out_of_energy(self, robot: Robot) -> None:
+        self.log.append(EventKind.OUT_OF_ENERGY, self.side(robot))
+
+    def weapon_loaded(self, robot: Robot, weapon: str) -> None:
+        self.log.append(EventKind.WEAPON_FIRED, self.side(robot), robot.weapons.index(weapon))
+
+    def missed(self, robot: Robot) -> None:
+        self.log.append(EventKind.MISSED, self.side(robot))
+
+    def dodged(self, robot: Robot) -> None:
+        self.log.append(EventKind.DODGED, self.side(robot))
+
+    def damaged(self, robot: Robot, damage: int) -> None:
+        self.log.append(EventKind.DAMAGED, self.side(robot), damage)
+
+
+class FightEngine:
+    """
+    Headless fight between two robots, no terminal I/O.
+
+    Both sides are driven by policies - callables getting the robot
+    on turn and its enemy, returning the weapon to use.
+    Events are reported to the observer, if any.
+    """
+
+    def __init__(self,
+                 player: Robot,
+                 opponent: Robot,
+                 player_policy: Policy = random_policy,
+                 opponent_policy: Policy = random_policy,
+                 observer: Optional[FightObserver] = None) -> None:
+        self.player = player
+        self.opponent = opponent
+        # Bound choose method of Policy objects saves a call per turn.
+        self.player_policy = getattr(player_policy, 'choose', player_policy)
+        self.opponent_policy = getattr(opponent_policy, 'choose', opponent_policy)
+        self.observer = observer
+
+    def run(self) -> FightResult:
+        """Play rounds until one robot is down or both are exhausted."""
+        player, opponent = self.player, self.opponent
+        rounds = 0
+        while not self.over():
+            rounds += 1
+            if self.observer:
+                self.observer.round_started(rounds)
+            self.play_turn(player, opponent, self.player_policy)
+            self.play_turn(opponent, player, self.opponent_policy)
+        return self.result(rounds)
+
+    def over(self) -> bool:
+        """Return True if one robot is down or both are exhausted."""
+        return (self.player.health <= 0 or self.opponent.health <= 0
+                or (self.player.is_exhausted() and self.opponent.is_exhausted()))
+
+    def can_attack(self, robot: Robot) -> bool:
+        """Return True if the robot will use a weapon on its turn."""
+        return robot.health > 0 and not robot.is_exhausted()
+
+    def play_turn(self, attacking: Robot, attacked: Robot, policy: Policy) -> None:
+        """
+        Let the attacking robot use a weapon chosen by policy.
+
+        Turn is skipped if robot is exhausted or down.
+        """
+        observer = self.observer
+        if attacking.is_exhausted():
+            if observer:
+                observer.out_of_energy(attacking)
+            return
+        if attacking.health <= 0:
+            return
+        weapon = policy(attacking, attacked)
+        damage = attacking.use_weapon(weapon)
+        if damage == -1:
+            raise ValueError(f'Policy picked "{weapon}" without enough energy.')
+        if observer:
+            observer.weapon_loaded(attacking, weapon)
+        if not damage:
+            if observer:
+                observer.missed(attacking)
+        elif not attacked.take_damage(damage):
+            if observer:
+                observer.dodged(attacked)
+        elif observer:
+            observer.damaged(attacked, damage)
+
+    def result(self, rounds: int) -> FightResult:
+        """Return structured result of the fight after given rounds."""
+        return FightResult(self.outcome(), rounds,
+                           self.player.health, self.player.energy,
+                           self.opponent.health, self.opponent.energy)
+
+    def outcome(self) -> Outcome:
+        """Return outcome of the fight for the player."""
+        if self.player.health > 0 and self.opponent.health > 0:
+            return Outcome.DRAW
+        if self.opponent.health > self.player.health:
+            return Outcome.LOSS
+        return Outcome.WIN
+
+
+def simulate(player: Robot, opponent: Robot, fights: int,
+             player_policy: Policy = random_policy,
+             opponent_policy: Policy = random_policy) -> Counter:
+    """Run number of headless fights and return Counter of outcomes."""
+    outcomes: Counter = Counter()
+    engine = FightEngine(player, opponent, player_policy, opponent_policy)
+    for _ in range(fights):
+        player.reset()
+        opponent.reset()
+        outcomes[engine.run().outcome] += 1
+    player.reset()
+    opponent.reset()
+    return outcomes
 
 
 class Fight:
@@ -19,149 +205,137 @@ class Fight:
         self.player = player
         self.opponent = opponent
         self.round_runner = round_runner
+        self.result: Optional[FightResult] = None
 
-    def accepted(self) -> bool:
+    async def accepted(self) -> bool:
         """
         Return True if challenge is accepted.
 
         Presents the opponent and ask the user if
         he/she wants to fight or flight.
         """
-        print('Ready for the fight?\n')
-        sleep(.5)
-        print(f'You stand against {self.opponent.name}.')
-        print(self.opponent)
-        print('Last chance to give up.',
-              'Type "flee" to go back to main menu.',
-              'or "fight" to continue to the pit.',
-              sep='\n')
+        echo('Ready for the fight?\n')
+        await pace(.5)
+        echo(f'You stand against {self.opponent.name}.')
+        echo(self.opponent)
+        # Solved in a worker thread on a cache miss, not to stall other sessions.
+        fight_odds = await asyncio.get_running_loop().run_in_executor(
+            None, odds.robot_odds, self.player, self.opponent)
+        echo(f'Odds (random weapon picks): {fight_odds}\n')
+        echo('Last chance to give up.',
+             'Type "flee" to go back to main menu.',
+             'or "fight" to continue to the pit.',
+             sep='\n')
         while True:
-            f_or_f = input('Flight or fight? ').lower()
+            f_or_f = (await ask('Flight or fight? ')).lower()
             if f_or_f in ['flee', 'flight']:
                 return False
             if f_or_f == 'fight':
                 return True
 
-    def has_winner(self, recorder: FightRecorder) -> bool:
+    async def has_winner(self) -> bool:
         """
-        Loop round_runner until the end of fight.
+        Run the fight until the end.
 
         Return True if there is a winner.
         """
-        self._welcome_sequence()
-        round_count = 1
-        while True:
-            if self.player.health <= 0 or self.opponent.health <= 0:
-                return True
-            if self.player.is_exhausted() and self.opponent.is_exhausted():
-                return False
-            self.round_runner.start_round(round_count,
-                                          recorder,
-                                          self.player,
-                                          self.opponent)
-            round_count += 1
+        await self._welcome_sequence()
+        self.result = await self.round_runner.run(self.player, self.opponent)
+        return self.result.outcome is not Outcome.DRAW
 
-    def _welcome_sequence(self) -> None:
+    async def _welcome_sequence(self) -> None:
         """Print welcome sequence before the fight."""
         clear_console()
-        try:
-            drama_print('LAAAAADIEEEES AND GENTLEMEEEEEN...')
-            sleep(0.5)
-            drama_print('Welcome, to THE CYBER PIT!\n')
-            sleep(0.2)
-            drama_print('A place where metal meets metal in '
-                        'THE MOST SPECTACULAR ROOBOOOT FIIIGTHS!')
-            sleep(0.5)
-            drama_print(f'Tonight, {self.player.name} will confront '
-                        f'{self.opponent.name} in unprecedented cyber dance.\n')
-            sleep(1)
-            drama_print('LET THE SHOOOOOOOW BEGIIIIIIIINNN !!!!', 0.08)
-            sleep(2)
-        except KeyboardInterrupt:
-            pass
+        await drama_print('LAAAAADIEEEES AND GENTLEMEEEEEN...')
+        await pace(0.5)
+        await drama_print('Welcome, to THE CYBER PIT!\n')
+        await pace(0.2)
+        await drama_print('A place where metal meets metal in '
+                          'THE MOST SPECTACULAR ROOBOOOT FIIIGTHS!')
+        await pace(0.5)
+        await drama_print(f'Tonight, {self.player.name} will confront '
+                          f'{self.opponent.name} in unprecedented cyber dance.\n')
+        await pace(1)
+        await drama_print('LET THE SHOOOOOOOW BEGIIIIIIIINNN !!!!', 0.08)
+        await pace(2)
         clear_console()
 
 
-class RoundRunner:
-    """Helper class to call correct turn (player vs opponent)."""
-
-    def start_turn(self, turn: 'Turn') -> None:
-        """Execute turn based on Turn instance passed as argument."""
-        turn.execute()
-
-    def start_round(self, count: int, recorder: FightRecorder, player: Robot, opponent: Robot) -> None:
-        """Execute Players and Opponents turn within one round."""
-        recorder.record_event(f'-------- ROUND {count} --------', 0)
-        self.start_turn(PlayersTurn(player, opponent, recorder))
-        self.start_turn(OpponentsTurn(player, opponent, recorder))
+class RoundRunner(EventRecorder):
+    """
+    Presentation of the FightEngine rounds and turns in the console.
+
+    Drives the engine turn by turn, so the player's weapon
+    can be awaited without blocking other sessions.
+    """
+
+    def __init__(self, opponent_policy: Policy = random_policy,
+                 player_policy: Optional[Policy] = None,
+                 screen: Optional[FightScreen] = None,
+                 sinks: Iterable[EventSink] = ()) -> None:
+        self.opponent_policy = opponent_policy
+        self.player_policy = player_policy or HumanPolicy()
+        self.screen = screen or FightScreen()
+        self.terminal = TerminalSink()
+        self.sinks = [self.terminal, *sinks]
+
+    async def run(self, player: Robot, opponent: Robot) -> FightResult:
+        """Run the fight with player and opponent turns, streaming the log."""
+        super().__init__(player, opponent,
+                         FightLog((player.name, opponent.name),
+                                  (player.weapons, opponent.weapons), self.sinks))
+        players_turn = PlayersTurn(player, opponent, self.log,
+                                   self.player_policy, self.screen)
+        opponents_turn = OpponentsTurn(player, opponent, self.log, self.opponent_policy)
+        engine = FightEngine(player, opponent, observer=self)
+        rounds = 0
+        try:
+            while not engine.over():
+                rounds += 1
+                self.round_started(rounds)
+                await self.terminal.show()
+                weapon = ''
+                if engine.can_attack(player):
+                    weapon = await players_turn.choose_weapon(player, opponent)
+                engine.play_turn(player, opponent, lambda robot, enemy: weapon)
+                await self.terminal.show()
+                engine.play_turn(opponent, player, opponents_turn.choose_weapon)
+                await self.terminal.show()
+            return engine.result(rounds)
+        finally:
+            self.screen.close()
+            self.log.close()
 
 
 class Turn(ABC):
-    """Abstract class for turn."""
+    """Abstract class for turn, choosing the weapon by the policy of the side."""
 
-    def __init__(self, player: Robot, opponent: Robot, recorder: FightRecorder) -> None:
+    def __init__(self, player: Robot, opponent: Robot, log: FightLog,
+                 policy: Policy = random_policy) -> None:
         self.player = player
         self.opponent = opponent
-        self.recorder = recorder
+        self.log = log
+        self.policy = policy
 
     @abstractmethod
-    def execute(self) -> None:
-        """Abstract method for turn execution."""
-
-    def status_check(self, robot: Robot) -> bool:
-        """
-        Evaluate if robot can make a turn.
-
-        Return False if robot energy is below
-        or equal to lowest weapon energy (exhausted).
-        Also return False if health is below or equal to 0.
-        """
-        if robot.is_exhausted():
-            self.recorder.record_event(f' -> {robot.name} is out of energy.')
-            return False
-        if robot.health <= 0:
-            return False
-        return True
-
-    def attack(self, weapon: str, attacking: Robot, attacked: Robot) -> bool:
-        """
-        Attack execution and evaluation.
-
-        Return True if attack was performed.
-        Return False if there is not enough energy to use the weapon.
-        """
-        weapon_energy = attacking.use_weapon(weapon)
-        if weapon_energy == -1:
-            drama_print('  -> not enough energy...')
-            return False
-        self.recorder.record_event(f' -> {attacking.name} loading {weapon} ...')
-        sleep(1)
-        if not weapon_energy:
-            self.recorder.record_event(f'  -> {attacking.name} missed !!!')
-            return True
-        hit = attacked.take_damage(weapon_energy)
-        if not hit:
-            self.recorder.record_event(f'  -> {attacked.name} dodged !!!')
-            return True
-        self.recorder.record_event(f'  -> {attacked.name} took {weapon_energy} '
-                       'points of damage !!!')
-        return True
+    def choose_weapon(self, attacking: Robot, attacked: Robot) -> Any:
+        """Abstract method returning the weapon for the turn."""
 
 
 class PlayersTurn(Turn):
-    def execute(self) -> None:
-        """Display options for players turn and evaluates input."""
-        if not self.status_check(self.player):
-            return
-        clear_console()
-        print(self._get_banner(),
-              self.recorder.get_records(),
-              sep='\n')
-        while True:
-            action = input('Choose your weapon: ').lower()
-            if action in self.player.weapons:
-                if self.attack(action, self.player, self.opponent):
-                    break
+    def __init__(self, player: Robot, opponent: Robot, log: FightLog,
+                 policy: Policy = random_policy,
+                 screen: Optional[FightScreen] = None) -> None:
+        super().__init__(player, opponent, log, policy)
+        self.screen = screen or FightScreen()
+
+    async def choose_weapon(self, attacking: Robot, attacked: Robot) -> str:
+        """Update the fight screen and ask player's policy for the weapon."""
+        self.screen.draw(self._get_banner(), self.log.lines())
+        weapon = self.policy(attacking, attacked)
+        if inspect.isawaitable(weapon):
+            weapon = await weapon
+        return weapon
 
     def _get_banner(self) -> str:
         """Return a banner with names, energy and health bars, weapons."""
@@ -205,15 +379,14 @@ class PlayersTurn(Turn):
 
 
 class OpponentsTurn(Turn):
-    def execute(self) -> None:
-        """Pick a random weapon from arsenal and execute attack."""
-        if not self.status_check(self.opponent):
-            return
-        weapons_available = [weapon for weapon in self.opponent.weapons
-                             if self.opponent.energy
-                             >= Weapons.get_energy(weapon)]
-        weapon = random.choice(weapons_available)
-        self.attack(weapon, self.opponent, self.player)
+    def choose_weapon(self, attacking: Robot, attacked: Robot) -> str:
+        """Pick a weapon from arsenal by opponent's policy."""
+        return self.policy(attacking, attacked)
+
+
+def fight_reward(opponent_cost: int) -> int:
+    """Return BTC paid for beating opponent of the cost."""
+    return int((opponent_cost / 10) * 2)
 
 
 class OutcomeEval:
@@ -222,25 +395,27 @@ class OutcomeEval:
         self.player = player
         self.opponent = opponent
 
-    def announce_winner(self, user: User) -> None:
+    async def announce_winner(self, user: User) -> None:
         """Evaluate, announce the winner and pays the player if won. """
-        print('--------------------------------')
-        drama_print('Aaaand the winner iiiiiiis.....')
-        sleep(.5)
+        echo('--------------------------------')
+        await drama_print('Aaaand the winner iiiiiiis.....')
+        await pace(.5)
         if self.player_won():
-            drama_print(f'\n  === {self.player.name.upper()} ===\n')
-            user.get_btc(int((self.opponent.cost / 10) * 2))
+            await drama_print(f'\n  === {self.player.name.upper()} ===\n')
+            await user.record_fight(Outcome.WIN.value, fight_reward(self.opponent.cost))
         else:
-            drama_print(f'\n  === {self.opponent.name.upper()} ===')
-        sleep(1)
-
-    def exhausted_outcome(self) -> None:
-        """Sequence when both bots are out of energy."""
-        drama_print('Oh no! Both bots are out of energy '
-                       'and are unable to continue.')
-        sleep(1)
-        drama_print('We have to call it a draw... '
-                       'Next time, keep an eye on that battery folks!')
+            await drama_print(f'\n  === {self.opponent.name.upper()} ===')
+            await user.record_fight(Outcome.LOSS.value)
+        await pace(1)
+
+    async def exhausted_outcome(self, user: User) -> None:
+        """Sequence when both bots are out of energy, recorded as a draw."""
+        await drama_print('Oh no! Both bots are out of energy '
+                          'and are unable to continue.')
+        await pace(1)
+        await drama_print('We have to call it a draw... '
+                          'Next time, keep an eye on that battery folks!')
+        await user.record_fight(Outcome.DRAW.value)
 
     def player_won(self) -> bool:
         """Return True if player won."""
@@ -249,13 +424,34 @@ class OutcomeEval:
         return True
 
 
-def run(user: User, opponent_robot: Robot) -> None:
-    """Main function to run the pit."""
-    fight = Fight(user.robot, opponent_robot, RoundRunner())
+async def run(user: User, opponent_robot: Robot, difficulty: Difficulty = Difficulty.EASY,
+              archive: Optional[FightArchive] = None) -> Optional[FightResult]:
+    """
+    Main function to run the pit, the fight is saved to archive if given.
+
+    The fight is broadcast live to spectators while it runs.
+    Return result of the fight, None if it was not accepted.
+    """
+    opponent_policy = TablePolicy(difficulty) if difficulty.value else random_policy
+    if isinstance(opponent_policy, TablePolicy):
+        # Solved on a cache miss, which takes a while.
+        await opponent_policy.prepare(opponent_robot, user.robot)
+    broadcast = live_fights.open(f'{user.name}: {user.robot.name} ({user.robot.build}) vs '
+                                 f'{opponent_robot.name} ({opponent_robot.build})')
+    round_runner = RoundRunner(opponent_policy, sinks=[BroadcastSink(broadcast)])
+    fight = Fight(user.robot, opponent_robot, round_runner)
     outcome = OutcomeEval(user.robot, opponent_robot)
-    if (accepted := fight.accepted()) and fight.has_winner(FightRecorder()):
-        outcome.announce_winner(user)
-    elif accepted:
-        outcome.exhausted_outcome()
+    try:
+        if (accepted := await fight.accepted()) and await fight.has_winner():
+            await outcome.announce_winner(user)
+        elif accepted:
+            await outcome.exhausted_outcome(user)
+    finally:
+        live_fights.close(broadcast)
+    if archive and fight.result:
+        await user.db_handle.run(archive.save, user.name, user.robot.build,
+                                 opponent_robot.build, fight.result.outcome.value,
+                                 round_runner.log)
     user.robot.reset()
-    input('\nPress any key to continue to main menu...')
+    await ask('\nPress any key to continue to main menu...')
+    return fight.result
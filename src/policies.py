@@ -0,0 +1,126 @@
+import asyncio
+from abc import ABC, abstractmethod
+from typing import Dict, Tuple
+
+from src.robots import BuildSpec, Robot
+from src.strategy import Difficulty, StrategyTable, get_table
+from src.utils import ask, drama_print
+
+
+class Policy(ABC):
+    """
+    Weapon choice of one side of the fight.
+
+    Given the fight state - the robot on turn and its enemy - return
+    the weapon to use. The robot is never exhausted when asked and the
+    returned weapon must be affordable. Policies are callables, so plain
+    functions with the same signature work as well.
+    """
+
+    @abstractmethod
+    def choose(self, robot: Robot, enemy: Robot) -> str:
+        """Return weapon for the robot on turn against the enemy."""
+
+    def __call__(self, robot: Robot, enemy: Robot) -> str:
+        return self.choose(robot, enemy)
+
+
+class HumanPolicy(Policy):
+    """
+    Weapon typed by the player to the session console.
+
+    Asynchronous - choose returns a coroutine to await.
+    """
+
+    def __init__(self, prompt: str = 'Choose your weapon: ') -> None:
+        self.prompt = prompt
+
+    async def choose(self, robot: Robot, enemy: Robot) -> str:  # type: ignore[override]
+        """Prompt until a weapon from arsenal with enough energy is typed."""
+        while True:
+            action = (await ask(self.prompt)).lower()
+            if action not in robot.weapons:
+                continue
+            if action not in robot.affordable_weapons():
+                await drama_print('  -> not enough energy...')
+                continue
+            return action
+
+
+class RandomPolicy(Policy):
+    """Uniformly random affordable weapon, drawn from the robot's RNG."""
+
+    def choose(self, robot: Robot, enemy: Robot) -> str:
+        weapons = robot.affordable_weapons()
+        return weapons[int(robot.rng.random() * len(weapons))]
+
+
+class GreedyPolicy(Policy):
+    """Most damaging affordable weapon (damage equals weapon energy)."""
+
+    def choose(self, robot: Robot, enemy: Robot) -> str:
+        energy_of = robot.spec.energy_of
+        return max(robot.affordable_weapons(), key=energy_of.__getitem__)
+
+
+class EnergyConservingPolicy(Policy):
+    """
+    Cheapest affordable weapon, to get the most shots out of the battery.
+
+    Switches to the cheapest weapon able to finish the enemy when there is one.
+    """
+
+    def choose(self, robot: Robot, enemy: Robot) -> str:
+        energy_of = robot.spec.energy_of
+        weapons = sorted(robot.affordable_weapons(), key=energy_of.__getitem__)
+        for weapon in weapons:
+            if energy_of[weapon] >= enemy.health:
+                return weapon
+        return weapons[0]
+
+
+class TablePolicy(Policy):
+    """
+    Weapon looked up in precomputed strategy table of the build pair.
+
+    Tables are optimal for the side moving second (the opponent),
+    for the player they are a near-optimal heuristic. With probability
+    given by difficulty the table is used, otherwise a random weapon.
+    """
+
+    def __init__(self, difficulty: Difficulty = Difficulty.HARD) -> None:
+        self.difficulty = difficulty
+        # Keyed by spec ids, specs are kept in the value so the ids stay unique.
+        self._tables: Dict[Tuple[int, int], Tuple[BuildSpec, BuildSpec, StrategyTable]] = {}
+
+    def choose(self, robot: Robot, enemy: Robot) -> str:
+        """Return table weapon, or random one by difficulty or if not affordable."""
+        weapons = robot.affordable_weapons()
+        if self.difficulty.value and robot.rng.random() < self.difficulty.value:
+            weapon = robot.weapons[self._table(robot, enemy).best_slot(
+                enemy.health, enemy.energy, robot.health, robot.energy)]
+            if weapon in weapons:
+                return weapon
+        return weapons[int(robot.rng.random() * len(weapons))]
+
+    async def prepare(self, robot: Robot, enemy: Robot) -> None:
+        """Resolve table of the build pair in a worker thread, not to stall other sessions."""
+        await asyncio.get_running_loop().run_in_executor(None, self._table, robot, enemy)
+
+    def _table(self, robot: Robot, enemy: Robot) -> StrategyTable:
+        """Return table of the build pair, resolved once per pair of specs."""
+        pair = (id(enemy.spec), id(robot.spec))
+        if pair not in self._tables:
+            self._tables[pair] = (enemy.spec, robot.spec,
+                                  get_table(enemy.get_init_data(), robot.get_init_data()))
+        return self._tables[pair][2]
+
+
+random_policy = RandomPolicy()
+
+POLICIES = {
+    'random': RandomPolicy,
+    'greedy': GreedyPolicy,
+    'conserving': EnergyConservingPolicy,
+    'table': TablePolicy,
+}
@@ -1,14 +1,16 @@
 from __future__ import annotations
 
+import asyncio
 import json
 import random
 import string
 from abc import ABC
+from dataclasses import dataclass, field
 from enum import Enum
-from time import sleep
 from typing import Dict, List, Optional, Tuple, Union
 
-from src.utils import clear_console
+from src import odds
+from src.utils import ask, clear_console, echo, pace
 
 PATH_TO_BUILDS = 'data/builds.json'
 
@@ -32,7 +34,55 @@ class Weapons(Enum):
         return cls[weapon.upper()].value
 
 
+BuildData = Dict[str, Union[str, int, List[str]]]
+
+
+@dataclass(frozen=True)
+class BuildSpec:
+    """
+    Immutable, precompiled robot build.
+
+    Weapon energies are resolved to ints once, together with the cheapest
+    weapon and weapons affordable at each energy level, so the fight
+    does no Enum lookups or scans.
+    """
+    build: str
+    desc: str
+    weapons: Tuple[str, ...]
+    health: int
+    energy: int
+    dodge_chance: int
+    miss_chance: int
+    cost: int
+    weapon_energy: Tuple[int, ...]
+    energy_needed: int
+    affordable: Tuple[Tuple[str, ...], ...]
+    energy_of: Dict[str, int] = field(compare=False, repr=False)
+    data: BuildData = field(compare=False, repr=False)
+
+    @classmethod
+    def compile(cls, data: BuildData) -> BuildSpec:
+        """Return spec compiled from build data (as in builds.json)."""
+        try:
+            weapons = tuple(data['weapons'])  # type: ignore
+            weapon_energy = tuple(Weapons.get_energy(weapon) for weapon in weapons)
+            energy = data['energy']
+            assert isinstance(energy, int), 'Internal error with robot init values.'
+            return cls(str(data['build']), str(data['desc']), weapons,
+                       int(data['health']), energy,  # type: ignore
+                       int(data['dodge_chance']), int(data['miss_chance']),  # type: ignore
+                       int(data['cost']), weapon_energy, min(weapon_energy),  # type: ignore
+                       tuple(tuple(weapon for weapon, cost in zip(weapons, weapon_energy)
+                                   if cost <= level)
+                             for level in range(energy + 1)),
+                       dict(zip(weapons, weapon_energy)),
+                       data)
+        except (KeyError, ValueError) as emsg:
+            raise ValueError(f'Invalid build data: {emsg}') from emsg
+
+
 class RobotBase(ABC):
+    __slots__ = ()
     name: str
     build: str
     health: int
@@ -41,15 +91,49 @@ class RobotBase(ABC):
     miss_chance: int
     desc: str
     cost: int
-    weapons: List[str]
+    weapons: Tuple[str, ...]
 
 class Robot(RobotBase):
+    """
+    Mutable fight state of a robot over its immutable BuildSpec.
 
-    def __init__(self, name, init_data: Dict[str, Union[str, int, List[str]]]) -> None:
+    Only name, health, energy and RNG live on the instance (slotted),
+    so robots are cheap to reset and copy.
+    """
+    __slots__ = ('name', 'spec', 'rng', 'health', 'energy')
+
+    def __init__(self, name, init_data: Union[BuildSpec, BuildData],
+                 rng: Optional[random.Random] = None) -> None:
         self.name = name
-        self._init_data = init_data
-        for attr, value in self._init_data.items():
-            setattr(self, attr, value)
+        self.spec = (init_data if isinstance(init_data, BuildSpec)
+                     else BuildSpec.compile(init_data))
+        self.rng = rng or random.Random()
+        self.health = self.spec.health
+        self.energy = self.spec.energy
+
+    @property
+    def build(self) -> str:  # type: ignore[override]
+        return self.spec.build
+
+    @property
+    def desc(self) -> str:  # type: ignore[override]
+        return self.spec.desc
+
+    @property
+    def weapons(self) -> Tuple[str, ...]:  # type: ignore[override]
+        return self.spec.weapons
+
+    @property
+    def dodge_chance(self) -> int:  # type: ignore[override]
+        return self.spec.dodge_chance
+
+    @property
+    def miss_chance(self) -> int:  # type: ignore[override]
+        return self.spec.miss_chance
+
+    @property
+    def cost(self) -> int:  # type: ignore[override]
+        return self.spec.cost
 
     def __str__(self) -> str:
         """
@@ -59,11 +143,9 @@ class Robot(RobotBase):
         """
         output = " " + 28*'_' + '\n'
         output += f'| {self.name.upper()}\n| {self.desc}\n'
-        output += f'| Equipped: {self.weapons}\n|\n'
-        for param, value in self.__dict__.items():
-            if param in ['name', 'desc', 'weapons'] or param.startswith('_'):
-                continue
-            value = str(value)
+        output += f'| Equipped: {list(self.weapons)}\n|\n'
+        for param in ('build', 'health', 'energy', 'dodge_chance', 'miss_chance', 'cost'):
+            value = str(getattr(self, param))
             if param in ['dodge_chance', 'miss_chance']:
                 value += ' %'
             elif param == 'cost':
@@ -71,24 +153,18 @@ class Robot(RobotBase):
             output += f'| {param.capitalize():<17}{value:>8} |\n'
         output += "|" + 27*'_' + "|" + '\n'
         return output
-    
+
+    def get_init_data(self) -> BuildData:
+        """Return build data the robot was created from."""
+        return self.spec.data
+
     def get_init_energy(self) -> int:
-        """
-        Return max energy.
-        Helper method for typing purposes.
-        """
-        value = self._init_data.get('energy', '')
-        assert isinstance(value, int), 'Internal error with robot init values.'
-        return value
+        """Return max energy."""
+        return self.spec.energy
 
     def get_init_health(self) -> int:
-        """
-        Return max health.
-        Helper method for typing purposes.
-        """
-        value = self._init_data.get('health', '')
-        assert isinstance(value, int), 'Internal error with robot init values.'
-        return value
+        """Return max health."""
+        return self.spec.health
 
     def take_damage(self, damage: int) -> bool:
         """
@@ -96,8 +172,8 @@ class Robot(RobotBase):
 
         Return False if dodged, else True.
         """
-        dodged_int = random.randint(1,100)
-        if dodged_int < self.dodge_chance:
+        dodged_int = int(self.rng.random() * 100) + 1
+        if dodged_int < self.spec.dodge_chance:
             return False
         self.health -= damage
         return True
@@ -108,75 +184,90 @@ class Robot(RobotBase):
 
         Return -1 if not enough energy, 0 if missed, else damage value.
         """
-        energy_cost = Weapons.get_energy(weapon)
+        energy_cost = self.spec.energy_of.get(weapon) or Weapons.get_energy(weapon)
         if self.energy < energy_cost:
             return -1
         self.energy -= energy_cost
-        miss_int = random.randint(1,100)
-        if miss_int < self.miss_chance:
+        miss_int = int(self.rng.random() * 100) + 1
+        if miss_int < self.spec.miss_chance:
             return 0
         return energy_cost
 
+    def affordable_weapons(self) -> Tuple[str, ...]:
+        """Return weapons robot has enough energy to use."""
+        return self.spec.affordable[self.energy]
+
     def is_exhausted(self) -> bool:
         """Return False if robot has no energy left for using any weapon."""
-        energy_needed=min([energy for energy in Weapons.values()
-                           if Weapons(energy).name.lower() in self.weapons])
-        if self.energy >= energy_needed:
-            return False
-        return True
+        return self.energy < self.spec.energy_needed
 
     def reset(self) -> None:
         """Reset the energy and health."""
-        assert isinstance(self._init_data['health'], int)
-        assert isinstance(self._init_data['energy'], int)
-        self.health = self._init_data['health']
-        self.energy = self._init_data['energy']
+        self.health = self.spec.health
+        self.energy = self.spec.energy
+
+    def copy(self) -> Robot:
+        """Return robot in the same state, sharing spec and RNG."""
+        clone = Robot.__new__(Robot)
+        clone.name, clone.spec, clone.rng = self.name, self.spec, self.rng
+        clone.health, clone.energy = self.health, self.energy
+        return clone
 
 
 class RobotManager:
     """Managing the actions around robots."""
 
-    def __init__(self) -> None:
+    def __init__(self, rng: Optional[random.Random] = None) -> None:
+        self.rng = rng or random.Random()
         with open(PATH_TO_BUILDS, 'r') as builds_file:
-            self.builds: Dict[str, Dict[str, Union[str, int, List[str]]]]
+            self.builds: Dict[str, BuildData]
             self.builds = json.load(builds_file)
+        self.specs = {name: BuildSpec.compile(data) for name, data in self.builds.items()}
 
     def get_all_build_names(self) -> Tuple[str,...]:
         """Return Dict of all robot builds with attributes."""
         return tuple(self.builds.keys())
 
-    def get_build_data(self, build_name: str) -> Dict[str, Union[str, int, List[str]]]:
-        """Return Dict of specific robot build attributes."""
+    def get_build_spec(self, build_name: str) -> BuildSpec:
+        """Return compiled spec of specific robot build, raise KeyError if there is none."""
+        try:
+            return self.specs[build_name]
+        except KeyError:
+            raise KeyError(f'Build name {build_name} not found!') from None
+
+    def get_build_data(self, build_name: str) -> BuildData:
+        """Return Dict of specific robot build attributes, raise KeyError if there is none."""
         try:
             return self.builds[build_name]
         except KeyError:
-            print('Failed to get build attributes.',
-            f'Build name {build_name} not found!',
-            sep='\n')
-            exit(1)
+            raise KeyError(f'Build name {build_name} not found!') from None
 
     def generate_robot(self) -> Robot:
         """Generate random robot from available builds."""
-        robot_build = random.choice(self.get_all_build_names())
+        robot_build = self.rng.choice(self.get_all_build_names())
         robot_name = self.generate_robot_name()
-        return Robot(robot_name, self.get_build_data(robot_build))
+        return Robot(robot_name, self.get_build_spec(robot_build), self.rng)
 
-    @staticmethod
-    def generate_robot_name() -> str:
+    def generate_robot_name(self) -> str:
         """Generate random name with 2 letters and 3 numbers in format XX-012."""
-        first = random.choice(string.ascii_letters)
-        second = random.choice(string.ascii_letters)
-        num = random.randint(100, 999)
+        first = self.rng.choice(string.ascii_letters)
+        second = self.rng.choice(string.ascii_letters)
+        num = self.rng.randint(100, 999)
         return f'{first}{second}-{num}'
 
     def showcase(self) -> str:
         """Return user-friendly list of all builds with all attributes listed."""
         showcase = ''
-        for build_data in self.builds.values():
-            build = Robot(build_data['build'], build_data)
+        for spec in self.specs.values():
+            build = Robot(spec.build, spec)
             showcase += str(build) + '\n'
         return showcase
 
+    def warm_up(self) -> None:
+        """Solve the odds shown in the shop ahead, so the first visit does not wait."""
+        for build in self.get_all_build_names():
+            odds.field_odds(self, build)
+
 
 
 class RobotShop:
@@ -184,7 +275,7 @@ class RobotShop:
         self.robot_manager = robot_manager
         self.balance = balance
 
-    def select_build(self) -> Optional[Dict[str, Union[str, int, List[str]]]]:
+    async def select_build(self) -> Optional[BuildData]:
         """
         Print shop display, available robot builds and prompt for selection.
 
@@ -192,35 +283,46 @@ class RobotShop:
         """
         while True:
             builds = self.robot_manager.get_all_build_names()
-            self._print_shop_display(self.balance, builds)
-            build_name = input('').capitalize()
+            # Odds are solved on a cache miss, in a worker thread not to stall other sessions.
+            odds_table = await asyncio.get_running_loop().run_in_executor(
+                None, self._get_odds_table, builds)
+            self._print_shop_display(self.balance, builds, odds_table)
+            build_name = (await ask('')).capitalize()
             if build_name == 'Cancel':
                 return None
             if build_name not in builds:
-                print(f'"{build_name}" is not valid robot build.')
-                sleep(2)
+                echo(f'"{build_name}" is not valid robot build.')
+                await pace(2)
                 continue
-            if self._affordable_robot(build_name, self.balance):
+            if await self._affordable_robot(build_name, self.balance):
                 return self.robot_manager.get_build_data(build_name)
 
-    def _print_shop_display(self, balance: int, builds: Tuple[str,...]) -> None:
+    def _print_shop_display(self, balance: int, builds: Tuple[str,...], odds_table: str) -> None:
         """Print the message when entering shop."""
         clear_console()
-        print('*** WELCOME TO TO ROBOT SHOP ***',
-              'Please, have a look at the finest selection.',
-              f'Your balance: {balance} BTC\n',
-              self.robot_manager.showcase(),
-              'Select a robot you wish to buy.',
-              builds,
-              '(type "cancel" to return to main menu)',
-              sep='\n')
-
-    def _affordable_robot(self, build_name: str, balance: int) -> bool:
+        echo('*** WELCOME TO TO ROBOT SHOP ***',
+             'Please, have a look at the finest selection.',
+             f'Your balance: {balance} BTC\n',
+             self.robot_manager.showcase(),
+             'Odds against a random opponent (random weapon picks):',
+             odds_table,
+             'Select a robot you wish to buy.',
+             builds,
+             '(type "cancel" to return to main menu)',
+             sep='\n')
+
+    def _get_odds_table(self, builds: Tuple[str,...]) -> str:
+        """Return exact odds of each build against random opponent build."""
+        width = max(len(build) for build in builds) + 2
+        return ''.join(f'  {build:<{width}}{odds.field_odds(self.robot_manager, build)}\n'
+                       for build in builds)
+
+    async def _affordable_robot(self, build_name: str, balance: int) -> bool:
         """Return True if build cost is lower than balance."""
         build_cost = self.robot_manager.get_build_data(build_name).get('cost')
         assert isinstance(build_cost, int), 'ERROR in configuration!'
         if  build_cost > balance:
-            print(f'You cannot afford "{build_name}".')
-            sleep(2)
+            echo(f'You cannot afford "{build_name}".')
+            await pace(2)
             return False
         return True
@@ -0,0 +1,55 @@
+import asyncio
+import contextlib
+import sys
+import traceback
+from typing import Awaitable, Callable
+
+from src.utils import SessionClosed, StreamConsole, set_console
+
+DEFAULT_HOST = '127.0.0.1'
+# Longest line a client may send, longer ones close the session.
+LINE_LIMIT = 1024
+
+
+class GameServer:
+    """
+    Game hosted over TCP for telnet-style clients.
+
+    Every connection is a session - an asyncio task running the game
+    flow on its own console, there is no thread per connection.
+    Services behind the flow (DB, build catalog, password hashing)
+    are shared by all the sessions.
+    """
+
+    def __init__(self, session: Callable[[], Awaitable[None]],
+                 host: str = DEFAULT_HOST, port: int = 2323) -> None:
+        self.session = session
+        self.host = host
+        self.port = port
+        self.sessions = 0
+
+    async def serve(self) -> None:
+        """Accept connections until cancelled."""
+        server = await asyncio.start_server(self.handle, self.host, self.port,
+                                            limit=LINE_LIMIT)
+        print(f'CyberPit serving on {self.host}:{self.port}, ctrl + c to stop.')
+        async with server:
+            await server.serve_forever()
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """Run the game session of a connection, in its own task."""
+        set_console(StreamConsole(reader, writer))
+        self.sessions += 1
+        try:
+            await self.session()
+        except (SessionClosed, ConnectionError):
+            pass
+        except Exception:
+            # Only this session ends, the others keep playing.
+            print('ERROR: Session crashed.', file=sys.stderr)
+            traceback.print_exc()
+        finally:
+            self.sessions -= 1
+            writer.close()
+            with contextlib.suppress(ConnectionError):
+                await writer.wait_closed()
@@ -0,0 +1,283 @@
+import argparse
+from dataclasses import dataclass
+from typing import Callable, Dict, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+from src import pit, policies, strategy
+from src.robots import Robot, RobotManager, Weapons
+
+# Cost of padding weapon slots, robot can never afford it.
+NO_WEAPON = np.iinfo(np.int32).max
+OUTCOMES = (pit.Outcome.WIN, pit.Outcome.DRAW, pit.Outcome.LOSS)
+
+
+class _Lanes(NamedTuple):
+    """Per-lane state of the side on turn, passed to vectorized policies."""
+    builds: np.ndarray
+    health: np.ndarray
+    energy: np.ndarray
+    enemies: np.ndarray
+    enemy_health: np.ndarray
+    enemy_energy: np.ndarray
+    weapon_energy: np.ndarray
+    affordable: np.ndarray
+
+
+@dataclass
+class OutcomeMatrix:
+    """
+    Outcome counts for every build pair.
+
+    counts[player, opponent] holds number of (wins, draws, losses)
+    from the player build point of view.
+    """
+    builds: Tuple[str, ...]
+    counts: np.ndarray
+
+    def rates(self) -> np.ndarray:
+        """Return counts normalized to win/draw/loss rates."""
+        totals = self.counts.sum(axis=2, keepdims=True)
+        return self.counts / np.maximum(totals, 1)
+
+    def __str__(self) -> str:
+        """Table of win/draw/loss percentages, player builds in rows."""
+        rates = self.rates() * 100
+        width = max(len(build) for build in self.builds) + 2
+        output = f'{"":<{width}}' + ''.join(f'{build:^20}' for build in self.builds) + '\n'
+        for row, build in enumerate(self.builds):
+            output += f'{build:<{width}}'
+            for col in range(len(self.builds)):
+                win, draw, loss = rates[row, col]
+                output += f'{f"{win:.1f}/{draw:.1f}/{loss:.1f}":^20}'
+            output += '\n'
+        return output
+
+
+class MatchupSimulator:
+    """
+    Batched Monte Carlo fights between builds.
+
+    Builds are loaded to arrays and every fight is one array lane,
+    all lanes are stepped round by round at once. Policies of both
+    sides are evaluated for all lanes at once too, see VECTORIZED.
+    """
+
+    def __init__(self, robot_manager: RobotManager,
+                 rng: Optional[np.random.Generator] = None,
+                 player_policy: policies.Policy = policies.random_policy,
+                 opponent_policy: policies.Policy = policies.random_policy) -> None:
+        for policy in (player_policy, opponent_policy):
+            if type(policy) not in VECTORIZED:
+                raise ValueError(f'Policy {type(policy).__name__} cannot be simulated in batches.')
+        self.builds = robot_manager.get_all_build_names()
+        self.rng = rng or np.random.default_rng()
+        self.player_policy = player_policy
+        self.opponent_policy = opponent_policy
+        self._build_data = build_data = [robot_manager.get_build_data(build)
+                                         for build in self.builds]
+        self._table_offsets: Optional[np.ndarray] = None
+        self._table_slots_flat = np.zeros(0, dtype=np.uint8)
+        slots = max(len(data['weapons']) for data in build_data)  # type: ignore
+        self.health = np.array([data['health'] for data in build_data], dtype=np.int32)
+        self.energy = np.array([data['energy'] for data in build_data], dtype=np.int32)
+        self.dodge_chance = np.array([data['dodge_chance'] for data in build_data], dtype=np.int32)
+        self.miss_chance = np.array([data['miss_chance'] for data in build_data], dtype=np.int32)
+        self.weapon_energy = np.full((len(self.builds), slots), NO_WEAPON, dtype=np.int32)
+        for idx, data in enumerate(build_data):
+            for slot, weapon in enumerate(data['weapons']):  # type: ignore
+                self.weapon_energy[idx, slot] = Weapons.get_energy(weapon)
+        self.energy_needed = self.weapon_energy.min(axis=1)
+
+    def outcome_matrix(self, fights: int, batch_size: int = 200_000) -> OutcomeMatrix:
+        """Run number of fights for every build pair and return outcome counts."""
+        count = len(self.builds)
+        pairs = np.arange(count * count)
+        lanes = np.repeat(pairs, fights)
+        counts = np.zeros((count * count, 3), dtype=np.int64)
+        for start in range(0, len(lanes), batch_size):
+            batch = lanes[start:start + batch_size]
+            outcome = self.simulate(batch // count, batch % count)
+            np.add.at(counts, (batch, outcome), 1)
+        return OutcomeMatrix(self.builds, counts.reshape(count, count, 3))
+
+    def simulate(self, player: np.ndarray, opponent: np.ndarray) -> np.ndarray:
+        """
+        Fight player builds against opponent builds, one lane per fight.
+
+        Return array of outcome indexes to OUTCOMES (0 win, 1 draw, 2 loss).
+        """
+        p_health, p_energy = self.health[player], self.energy[player]
+        o_health, o_energy = self.health[opponent], self.energy[opponent]
+        while True:
+            # Loop condition of FightEngine.run
+            active = ((p_health > 0) & (o_health > 0)
+                      & ~((p_energy < self.energy_needed[player])
+                          & (o_energy < self.energy_needed[opponent])))
+            if not active.any():
+                break
+            self._turn(active, self.player_policy, player, p_health, p_energy,
+                       opponent, o_health, o_energy)
+            self._turn(active, self.opponent_policy, opponent, o_health, o_energy,
+                       player, p_health, p_energy)
+        outcome = np.where(o_health > p_health, 2, 0)
+        outcome[(p_health > 0) & (o_health > 0)] = 1
+        return outcome
+
+    def _turn(self, active: np.ndarray, policy: policies.Policy,
+              attacking: np.ndarray, health: np.ndarray, energy: np.ndarray,
+              attacked: np.ndarray, attacked_health: np.ndarray,
+              attacked_energy: np.ndarray) -> None:
+        """
+        Turn of the attacking side in active lanes, arrays updated in place.
+
+        Mirrors FightEngine.play_turn with Robot.is_exhausted,
+        Robot.use_weapon and Robot.take_damage semantics.
+        """
+        lanes = np.flatnonzero(active & (energy >= self.energy_needed[attacking])
+                               & (health > 0))
+        if not lanes.size:
+            return
+        builds, enemies = attacking[lanes], attacked[lanes]
+        weapon_energy = self.weapon_energy[builds]
+        affordable = weapon_energy <= energy[lanes, None]
+        slot = VECTORIZED[type(policy)](
+            self, policy, _Lanes(builds, health[lanes], energy[lanes], enemies,
+                                 attacked_health[lanes], attacked_energy[lanes],
+                                 weapon_energy, affordable))
+        damage = weapon_energy[np.arange(lanes.size), slot]
+        energy[lanes] -= damage
+        # Rolls of 1..100 below the chance, as in Robot.use_weapon and take_damage.
+        missed = self._roll(lanes.size) < self.miss_chance[builds]
+        dodged = self._roll(lanes.size) < self.dodge_chance[enemies]
+        hit = ~missed & ~dodged
+        attacked_health[lanes[hit]] -= damage[hit]
+
+    def _random_slots(self, _policy: policies.Policy, lanes: _Lanes) -> np.ndarray:
+        """Uniform pick among affordable weapons, in arsenal order (RandomPolicy)."""
+        affordable = lanes.affordable
+        pick = (self.rng.random(len(affordable)) * affordable.sum(axis=1)).astype(np.int32)
+        rank = np.cumsum(affordable, axis=1) - 1
+        return np.argmax(affordable & (rank == pick[:, None]), axis=1)
+
+    def _greedy_slots(self, _policy: policies.Policy, lanes: _Lanes) -> np.ndarray:
+        """First most expensive affordable weapon (GreedyPolicy)."""
+        return np.argmax(np.where(lanes.affordable, lanes.weapon_energy, -1), axis=1)
+
+    def _conserving_slots(self, _policy: policies.Policy, lanes: _Lanes) -> np.ndarray:
+        """Cheapest weapon finishing the enemy, or cheapest one (EnergyConservingPolicy)."""
+        cheapest = np.argmin(np.where(lanes.affordable, lanes.weapon_energy, NO_WEAPON), axis=1)
+        finishing = lanes.affordable & (lanes.weapon_energy >= lanes.enemy_health[:, None])
+        cheapest_finishing = np.argmin(np.where(finishing, lanes.weapon_energy, NO_WEAPON), axis=1)
+        return np.where(finishing.any(axis=1), cheapest_finishing, cheapest)
+
+    def _table_slots(self, policy: policies.Policy, lanes: _Lanes) -> np.ndarray:
+        """Strategy table weapon by difficulty, random otherwise (TablePolicy)."""
+        assert isinstance(policy, policies.TablePolicy)
+        if self._table_offsets is None:
+            self._load_tables()
+        assert self._table_offsets is not None
+        enemy_energies = self.energy[lanes.enemies] + 1
+        healths = self.health[lanes.builds] + 1
+        energies = self.energy[lanes.builds] + 1
+        index = (self._table_offsets[lanes.enemies, lanes.builds]
+                 + ((np.maximum(lanes.enemy_health, 0) * enemy_energies + lanes.enemy_energy)
+                    * healths + np.maximum(lanes.health, 0)) * energies + lanes.energy)
+        table_slot = self._table_slots_flat[index]
+        usable = ((self.rng.random(len(index)) < policy.difficulty.value)
+                  & lanes.affordable[np.arange(len(index)), table_slot])
+        return np.where(usable, table_slot, self._random_slots(policy, lanes))
+
+    def _load_tables(self) -> None:
+        """Unpack strategy tables of all build pairs to one flat array of slots."""
+        count = len(self.builds)
+        offsets = np.zeros((count, count), dtype=np.int64)
+        unpacked = []
+        offset = 0
+        for enemy in range(count):
+            for robot in range(count):
+                table = strategy.get_table(self._build_data[enemy], self._build_data[robot])
+                packed = np.frombuffer(bytes(table.table), dtype=np.uint8)
+                slots = np.stack([(packed >> (shift * strategy.SLOT_BITS)) & strategy.SLOT_MASK
+                                  for shift in range(strategy.SLOTS_PER_BYTE)], axis=1).ravel()
+                offsets[enemy, robot] = offset
+                offset += len(slots)
+                unpacked.append(slots)
+        self._table_slots_flat = np.concatenate(unpacked)
+        self._table_offsets = offsets
+
+    def _roll(self, size: int) -> np.ndarray:
+        """Return array of uniform integer rolls 1..100."""
+        return self.rng.integers(1, 101, size=size, dtype=np.int32)
+
+
+# Batched weapon choice of each policy type, array equivalent of Policy.choose.
+VECTORIZED: Dict[type, Callable[[MatchupSimulator, policies.Policy, _Lanes], np.ndarray]] = {
+    policies.RandomPolicy: MatchupSimulator._random_slots,
+    policies.GreedyPolicy: MatchupSimulator._greedy_slots,
+    policies.EnergyConservingPolicy: MatchupSimulator._conserving_slots,
+    policies.TablePolicy: MatchupSimulator._table_slots,
+}
+
+
+def scalar_outcome_matrix(robot_manager: RobotManager, fights: int,
+                          player_policy: policies.Policy = policies.random_policy,
+                          opponent_policy: policies.Policy = policies.random_policy
+                          ) -> OutcomeMatrix:
+    """Run number of fights for every build pair with headless pit.FightEngine."""
+    builds = robot_manager.get_all_build_names()
+    counts = np.zeros((len(builds), len(builds), 3), dtype=np.int64)
+    for row, player_build in enumerate(builds):
+        for col, opponent_build in enumerate(builds):
+            outcomes = pit.simulate(Robot(player_build, robot_manager.get_build_data(player_build)),
+                                    Robot(opponent_build, robot_manager.get_build_data(opponent_build)),
+                                    fights, player_policy, opponent_policy)
+            counts[row, col] = [outcomes[outcome] for outcome in OUTCOMES]
+    return OutcomeMatrix(builds, counts)
+
+
+def cross_check(vectorized: OutcomeMatrix, scalar: OutcomeMatrix) -> float:
+    """
+    Return the largest z-score between vectorized and scalar outcome rates.
+
+    Values above ~5 mean the two engines drifted apart.
+    """
+    assert vectorized.builds == scalar.builds, 'Outcome matrices of different builds.'
+    n_vec = vectorized.counts.sum(axis=2, keepdims=True)
+    n_sca = scalar.counts.sum(axis=2, keepdims=True)
+    pooled = (vectorized.counts + scalar.counts) / (n_vec + n_sca)
+    std_err = np.sqrt(pooled * (1 - pooled) * (1 / n_vec + 1 / n_sca))
+    diff = np.abs(vectorized.rates() - scalar.rates())
+    z_scores = np.divide(diff, std_err, out=np.zeros_like(diff), where=std_err > 0)
+    return float(z_scores.max())
+
+
+def main() -> None:
+    """Print outcome matrix for all builds, optionally cross-checked."""
+    parser = argparse.ArgumentParser(description='Monte Carlo matchup simulator.')
+    parser.add_argument('--fights', type=int, default=100_000,
+                        help='number of fights per build pair')
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--check', type=int, default=0, metavar='FIGHTS',
+                        help='cross-check against scalar engine with FIGHTS per pair')
+    parser.add_argument('--player-policy', choices=policies.POLICIES, default='random')
+    parser.add_argument('--opponent-policy', choices=policies.POLICIES, default='random')
+    args = parser.parse_args()
+
+    robot_manager = RobotManager()
+    player_policy = policies.POLICIES[args.player_policy]()
+    opponent_policy = policies.POLICIES[args.opponent_policy]()
+    simulator = MatchupSimulator(robot_manager, np.random.default_rng(args.seed),
+                                 player_policy, opponent_policy)
+    matrix = simulator.outcome_matrix(args.fights)
+    print('Win/draw/loss % of row build against column build:\n')
+    print(matrix)
+    if args.check:
+        z_score = cross_check(simulator.outcome_matrix(args.check),
+                              scalar_outcome_matrix(robot_manager, args.check,
+                                                    player_policy, opponent_policy))
+        print(f'Max z-score against scalar engine: {z_score:.2f}')
+
+
+if __name__ == '__main__':
+    main()
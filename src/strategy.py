@@ -0,0 +1,164 @@
+import os
+import threading
+import zlib
+from enum import Enum
+from typing import Dict, Tuple
+
+from src.odds import BuildData, FightSide, cache_key
+
+PATH_TO_STRATEGY_CACHE = 'data/cache/strategy'
+
+# Weapon slot is stored in 2 bits, 4 states per byte.
+SLOT_BITS = 2
+SLOTS_PER_BYTE = 8 // SLOT_BITS
+SLOT_MASK = (1 << SLOT_BITS) - 1
+
+# Tables already loaded in this process, by build pair cache key.
+_tables: Dict[str, 'StrategyTable'] = {}
+# Tables are solved in worker threads of the sessions, a pair is solved once.
+_tables_lock = threading.Lock()
+
+
+class Difficulty(Enum):
+    """How often the opponent plays the optimal weapon instead of a random one."""
+    EASY = 0.0
+    NORMAL = 0.5
+    HARD = 1.0
+
+
+class StrategyTable:
+    """
+    Optimal weapon slot of the opponent for every fight state.
+
+    Computed by value iteration (backward induction, the fight state graph
+    is acyclic) maximizing opponent's expected score (+1 win, 0 draw,
+    -1 loss) against a player picking weapons at random. State is
+    (player health, player energy, opponent health, opponent energy)
+    when the opponent is on turn, weapon slot is packed in 2 bits of
+    a flat array, so the lookup is a single index computation.
+    """
+
+    def __init__(self, player: BuildData, opponent: BuildData,
+                 table: bytearray = bytearray()) -> None:
+        self.player = FightSide(player)
+        self.opponent = FightSide(opponent)
+        assert len(self.opponent.costs) <= SLOT_MASK + 1, 'Too many weapons for the table.'
+        self._dims = (self.player.health + 1, self.player.energy + 1,
+                      self.opponent.health + 1, self.opponent.energy + 1)
+        states = self._dims[0] * self._dims[1] * self._dims[2] * self._dims[3]
+        self.table = table or bytearray(-(-states // SLOTS_PER_BYTE))
+        self._round_memo: Dict[Tuple[int, int, int, int], float] = {}
+        self._turn_memo: Dict[Tuple[int, int, int, int], float] = {}
+
+    def best_slot(self, p_health: int, p_energy: int, o_health: int, o_energy: int) -> int:
+        """Return index of the best weapon of the opponent in given state."""
+        idx = self._index(p_health, p_energy, o_health, o_energy)
+        return (self.table[idx // SLOTS_PER_BYTE]
+                >> (idx % SLOTS_PER_BYTE * SLOT_BITS)) & SLOT_MASK
+
+    def compute(self) -> 'StrategyTable':
+        """Fill the table for all states reachable from the start of the fight."""
+        self._round_value(self.player.health, self.player.energy,
+                          self.opponent.health, self.opponent.energy)
+        self._round_memo.clear()
+        self._turn_memo.clear()
+        return self
+
+    def _index(self, p_health: int, p_energy: int, o_health: int, o_energy: int) -> int:
+        """Return flat index of the state."""
+        _, p_energies, o_healths, o_energies = self._dims
+        return ((max(p_health, 0) * p_energies + p_energy) * o_healths
+                + max(o_health, 0)) * o_energies + o_energy
+
+    def _store_slot(self, state: Tuple[int, int, int, int], slot: int) -> None:
+        """Write weapon slot of the state to the packed table."""
+        idx = self._index(*state)
+        shift = idx % SLOTS_PER_BYTE * SLOT_BITS
+        byte = self.table[idx // SLOTS_PER_BYTE] & ~(SLOT_MASK << shift)
+        self.table[idx // SLOTS_PER_BYTE] = byte | (slot << shift)
+
+    def _round_value(self, p_health: int, p_energy: int,
+                     o_health: int, o_energy: int) -> float:
+        """Return opponent's value at the round start, player on turn."""
+        if p_health <= 0:
+            return 1.0
+        if o_health <= 0:
+            return -1.0
+        p_exhausted = p_energy < self.player.energy_needed
+        if p_exhausted and o_energy < self.opponent.energy_needed:
+            return 0.0
+        state = (p_health, p_energy, o_health, o_energy)
+        if state in self._round_memo:
+            return self._round_memo[state]
+        if p_exhausted:
+            value = self._turn_value(p_health, p_energy, o_health, o_energy)
+        else:
+            affordable = [cost for cost in self.player.costs if cost <= p_energy]
+            hit = (1 - self.player.miss) * (1 - self.opponent.dodge)
+            value = 0.0
+            for cost in affordable:
+                value += (hit * self._turn_value(p_health, p_energy - cost,
+                                                 o_health - cost, o_energy)
+                          + (1 - hit) * self._turn_value(p_health, p_energy - cost,
+                                                         o_health, o_energy)
+                          ) / len(affordable)
+        self._round_memo[state] = value
+        return value
+
+    def _turn_value(self, p_health: int, p_energy: int,
+                    o_health: int, o_energy: int) -> float:
+        """Return opponent's value on its turn, storing the best weapon slot."""
+        if o_health <= 0 or o_energy < self.opponent.energy_needed:
+            return self._round_value(p_health, p_energy, max(o_health, 0), o_energy)
+        state = (p_health, p_energy, o_health, o_energy)
+        if state in self._turn_memo:
+            return self._turn_memo[state]
+        hit = (1 - self.opponent.miss) * (1 - self.player.dodge)
+        best_slot, best_value = 0, -2.0
+        for slot, cost in enumerate(self.opponent.costs):
+            if cost > o_energy:
+                continue
+            value = (hit * self._round_value(max(p_health - cost, 0), p_energy,
+                                             o_health, o_energy - cost)
+                     + (1 - hit) * self._round_value(p_health, p_energy,
+                                                     o_health, o_energy - cost))
+            if value > best_value:
+                best_slot, best_value = slot, value
+        self._store_slot(state, best_slot)
+        self._turn_memo[state] = best_value
+        return best_value
+
+
+def get_table(player: BuildData, opponent: BuildData) -> StrategyTable:
+    """
+    Return strategy table of the build pair.
+
+    Loaded lazily - from memory, disk cache, or computed and saved.
+    """
+    key = cache_key(player, opponent)
+    if key in _tables:
+        return _tables[key]
+    with _tables_lock:
+        if key not in _tables:
+            _tables[key] = _load_table(key, player, opponent)
+        return _tables[key]
+
+
+def _load_table(key: str, player: BuildData, opponent: BuildData) -> StrategyTable:
+    """Return table read from the disk cache, or computed and saved to it."""
+    path = os.path.join(PATH_TO_STRATEGY_CACHE, f'{key}.bin')
+    try:
+        with open(path, 'rb') as table_file:
+            table = StrategyTable(player, opponent,
+                                  bytearray(zlib.decompress(table_file.read())))
+    except (OSError, zlib.error):
+        table = StrategyTable(player, opponent).compute()
+        try:
+            os.makedirs(PATH_TO_STRATEGY_CACHE, exist_ok=True)
+            with open(path + '.tmp', 'wb') as table_file:
+                table_file.write(zlib.compress(bytes(table.table), 9))
+            os.replace(path + '.tmp', path)
+        except OSError:
+            pass
+    return table
+
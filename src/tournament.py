@@ -0,0 +1,195 @@
+import argparse
+import json
+import os
+import random
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from dataclasses import dataclass, field
+from typing import Dict, Iterator, List, Optional, Tuple, Union
+
+from src import pit, policies
+from src.robots import Robot, RobotManager
+
+BuildData = Dict[str, Union[str, int, List[str]]]
+Shard = Tuple[str, str, int, int]
+OUTCOMES = (pit.Outcome.WIN, pit.Outcome.DRAW, pit.Outcome.LOSS)
+CHECKPOINT_INTERVAL = 1.0
+
+# Build catalog of the worker process, set by _init_worker.
+_worker_builds: Dict[str, BuildData] = {}
+
+
+def shard_rng(seed: int, shard: Shard) -> random.Random:
+    """
+    Return independent, reproducible RNG stream for the shard.
+
+    Stream depends only on seed and shard identity, not on which
+    worker or in which order the shard runs.
+    """
+    player, opponent, index, _ = shard
+    return random.Random(f'{seed}:{player}:{opponent}:{index}')
+
+
+def _init_worker(builds: Dict[str, BuildData]) -> None:
+    """Store the build catalog once per worker process."""
+    global _worker_builds
+    _worker_builds = builds
+
+
+def play_shard(seed: int, shard: Shard, player_policy: str = 'random',
+               opponent_policy: str = 'random') -> Tuple[Shard, List[int]]:
+    """Play fights of one shard, return it with [wins, draws, losses]."""
+    player_build, opponent_build, _, fights = shard
+    rng = shard_rng(seed, shard)
+    outcomes = pit.simulate(Robot(player_build, _worker_builds[player_build], rng),
+                            Robot(opponent_build, _worker_builds[opponent_build], rng),
+                            fights,
+                            policies.POLICIES[player_policy](),
+                            policies.POLICIES[opponent_policy]())
+    return shard, [outcomes[outcome] for outcome in OUTCOMES]
+
+
+@dataclass
+class Tournament:
+    """
+    Round-robin tournament, every build fights every other build.
+
+    Each ordered build pair plays number of fights, split into shards
+    run on a process pool. Finished shards are merged to results and
+    saved to checkpoint file, so an interrupted tournament resumes
+    with the missing shards only.
+    """
+    builds: Dict[str, BuildData]
+    fights: int
+    seed: int = 0
+    shard_size: int = 10_000
+    checkpoint: Optional[str] = None
+    player_policy: str = 'random'
+    opponent_policy: str = 'random'
+    results: Dict[str, List[int]] = field(default_factory=dict)
+
+    def __post_init__(self) -> None:
+        if self.checkpoint and os.path.exists(self.checkpoint):
+            self._load_checkpoint()
+
+    def shards(self) -> Iterator[Shard]:
+        """Yield all shards of the tournament."""
+        for player in self.builds:
+            for opponent in self.builds:
+                if player == opponent:
+                    continue
+                for index, start in enumerate(range(0, self.fights, self.shard_size)):
+                    yield player, opponent, index, min(self.shard_size, self.fights - start)
+
+    def pending_shards(self) -> List[Shard]:
+        """Return shards without merged results."""
+        return [shard for shard in self.shards() if self._key(shard) not in self.results]
+
+    def run(self, workers: Optional[int] = None) -> None:
+        """Play all pending shards on process pool, merging results as they finish."""
+        pending = self.pending_shards()
+        if not pending:
+            return
+        last_save = time.monotonic()
+        executor = ProcessPoolExecutor(workers, initializer=_init_worker,
+                                       initargs=(self.builds,))
+        try:
+            futures = {executor.submit(play_shard, self.seed, shard,
+                                       self.player_policy, self.opponent_policy)
+                       for shard in pending}
+            while futures:
+                done, futures = wait(futures, return_when=FIRST_COMPLETED)
+                for future in done:
+                    shard, counts = future.result()
+                    self.results[self._key(shard)] = counts
+                if time.monotonic() - last_save > CHECKPOINT_INTERVAL:
+                    self._save_checkpoint()
+                    last_save = time.monotonic()
+        finally:
+            executor.shutdown(cancel_futures=True)
+            self._save_checkpoint()
+
+    def pair_counts(self) -> Dict[Tuple[str, str], List[int]]:
+        """Return merged [wins, draws, losses] per (player, opponent) pair."""
+        counts: Dict[Tuple[str, str], List[int]] = {}
+        for shard in self.shards():
+            if (result := self.results.get(self._key(shard))) is None:
+                continue
+            pair = counts.setdefault(shard[:2], [0, 0, 0])
+            for idx, value in enumerate(result):
+                pair[idx] += value
+        return counts
+
+    def standings(self) -> str:
+        """Return table of builds ordered by win rate over all their fights."""
+        totals = {build: [0, 0, 0] for build in self.builds}
+        for (player, opponent), (wins, draws, losses) in self.pair_counts().items():
+            for build, result in ((player, (wins, draws, losses)),
+                                  (opponent, (losses, draws, wins))):
+                for idx, value in enumerate(result):
+                    totals[build][idx] += value
+        output = f'{"BUILD":<12}{"WINS":>10}{"DRAWS":>10}{"LOSSES":>10}{"WIN %":>8}\n'
+        for build, (wins, draws, losses) in sorted(
+                totals.items(), key=lambda item: -item[1][0] / max(sum(item[1]), 1)):
+            rate = 100 * wins / max(wins + draws + losses, 1)
+            output += f'{build:<12}{wins:>10}{draws:>10}{losses:>10}{rate:>8.1f}\n'
+        return output
+
+    @staticmethod
+    def _key(shard: Shard) -> str:
+        """Return checkpoint key of the shard."""
+        return ':'.join(str(part) for part in shard)
+
+    def _settings(self) -> Dict[str, Union[int, str]]:
+        """Return settings which must match to resume from checkpoint."""
+        return {'fights': self.fights, 'seed': self.seed, 'shard_size': self.shard_size,
+                'player_policy': self.player_policy, 'opponent_policy': self.opponent_policy}
+
+    def _load_checkpoint(self) -> None:
+        """Load merged results of the previous run."""
+        assert self.checkpoint
+        with open(self.checkpoint, 'r') as checkpoint_file:
+            data = json.load(checkpoint_file)
+        if data['settings'] != self._settings():
+            raise ValueError(f'Checkpoint {self.checkpoint} belongs to a tournament '
+                             f'with different settings: {data["settings"]}')
+        self.results = data['results']
+
+    def _save_checkpoint(self) -> None:
+        """Atomically write merged results to checkpoint file."""
+        if not self.checkpoint:
+            return
+        tmp_file = self.checkpoint + '.tmp'
+        with open(tmp_file, 'w') as checkpoint_file:
+            json.dump({'settings': self._settings(), 'results': self.results},
+                      checkpoint_file)
+        os.replace(tmp_file, self.checkpoint)
+
+
+def main() -> None:
+    """Run the round-robin tournament of all builds and print standings."""
+    parser = argparse.ArgumentParser(description='Round-robin tournament of all builds.')
+    parser.add_argument('--fights', type=int, default=100_000,
+                        help='number of fights per ordered build pair')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--workers', type=int, default=None,
+                        help='number of worker processes (default all cores)')
+    parser.add_argument('--shard-size', type=int, default=10_000)
+    parser.add_argument('--checkpoint', default=None,
+                        help='file to store progress and resume from')
+    parser.add_argument('--player-policy', choices=policies.POLICIES, default='random')
+    parser.add_argument('--opponent-policy', choices=policies.POLICIES, default='random')
+    args = parser.parse_args()
+
+    tournament = Tournament(RobotManager().builds, args.fights, args.seed,
+                            args.shard_size, args.checkpoint,
+                            args.player_policy, args.opponent_policy)
+    try:
+        tournament.run(args.workers)
+    except KeyboardInterrupt:
+        print('\nTournament interrupted, progress saved to checkpoint.')
+    print(tournament.standings())
+
+
+if __name__ == '__main__':
+    main()
@@ -1,13 +1,55 @@
-from dataclasses import dataclass
-from getpass import getpass
-from time import sleep
-from typing import Dict, Optional
+import asyncio
+import math
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field, replace
+from typing import Any, Awaitable, Callable, Dict, Optional
 
 import bcrypt  # type: ignore
 
-from src.db import DBHandler
+from src.config import load_config, update_config
+from src.db import DBHandler, UserRecord
 from src.robots import Robot, RobotManager, RobotShop
-from src.utils import clear_console
+from src.utils import USERNAME_PROMPT, ask, ask_secret, clear_console, echo, pace
+
+# BTC granted to every new user.
+STARTING_GRANT = 300
+# Time one hash should take on this machine, bcrypt cost is calibrated to it.
+HASH_TARGET_SECONDS = 0.25
+MIN_HASH_COST = 10
+MAX_HASH_COST = 16
+CALIBRATION_COST = 8
+
+# Pool shared by all password managers, bcrypt releases the GIL while hashing.
+_hash_pool: Optional[ThreadPoolExecutor] = None
+
+
+def get_hash_pool() -> ThreadPoolExecutor:
+    """Return pool hashing passwords, with a worker per CPU."""
+    global _hash_pool
+    if _hash_pool is None:
+        _hash_pool = ThreadPoolExecutor(max_workers=os.cpu_count() or 1,
+                                        thread_name_prefix='bcrypt')
+    return _hash_pool
+
+
+def calibrate_cost(target: float = HASH_TARGET_SECONDS) -> int:
+    """Return bcrypt cost closest below target hashing time on this machine."""
+    salt = bcrypt.gensalt(CALIBRATION_COST)
+    seconds = float('inf')
+    for _ in range(3):
+        start = time.perf_counter()
+        bcrypt.hashpw(b'calibration', salt)
+        seconds = min(seconds, time.perf_counter() - start)
+    # Each cost step doubles the work.
+    cost = CALIBRATION_COST + math.floor(math.log2(target / seconds))
+    return min(max(cost, MIN_HASH_COST), MAX_HASH_COST)
+
+
+def hash_cost(pwd_hash: bytes) -> int:
+    """Return cost the hash ($2b$<cost>$...) was made with."""
+    return int(pwd_hash.split(b'$')[2])
 
 
 @dataclass
@@ -16,36 +58,40 @@ class User:
     db_handle: DBHandler
     robot: Optional[Robot]
     balance: int = 0
+    # Called with the user name and the columns after each write, to refresh cached records.
+    on_write: Optional[Callable[..., None]] = field(default=None, repr=False)
 
     @staticmethod
-    def init_from_dict(user_data: Dict[str, str], db_handle: DBHandler, robot: Robot) -> 'User':
-        """
-        Return User instance created from dictionary.
+    def init_from_record(record: UserRecord, db_handle: DBHandler, robot: Optional[Robot],
+                         on_write: Optional[Callable[..., None]] = None) -> 'User':
+        """Return User instance created from the record read from DB."""
+        return User(record.name, db_handle, robot, record.balance, on_write)
 
-        Read the dictionary (provided by DB) and instantiate a user
-        based on dict values.
+    async def set_balance(self, balance: int, show: bool = True) -> None:
         """
-        try:
-            return User(user_data['name'],
-                        db_handle,
-                        robot,
-                        int(user_data['balance']))
-        except KeyError:
-            print('Failed to initiate a user from dictionary')
-            exit(2)
+        Set user balance to provided value, as materialized in DB.
 
-    def set_balance(self, balance: int, show: bool = True) -> None:
-        """
-        Set user balance to provided value.
-        
-        Write to DB, call show_balance.
         - show argument set to True if show balance after set.
         """
         self.balance = balance
-        self.db_handle.update_balance(self.name, self.balance)
+        if self.on_write:
+            self.on_write(self.name, balance=balance)
         if show:
-            print(self.get_balance())
-        sleep(2)
+            echo(self.get_balance())
+        await pace(2)
+
+    async def change_balance(self, amount: int, reason: str, show: bool = True) -> bool:
+        """
+        Atomically add amount (negative to subtract) to balance in DB.
+
+        Return False if balance insufficient, nothing changes then.
+        """
+        balance = await self.db_handle.run(self.db_handle.add_to_balance,
+                                           self.name, amount, reason)
+        if balance is None:
+            return False
+        await self.set_balance(balance, show)
+        return True
 
     def get_balance_int(self) -> int:
         """Print user balance integer."""
@@ -62,86 +108,140 @@ class User:
             return f'$$$ Current balance: {self.balance} BTC.'
         return f'{self.balance} BTC'
 
-    def set_robot(self, robot: Robot) -> None:
+    async def set_robot(self, robot: Robot) -> None:
         """
         Assign robot to a user.
 
         Write to DB.
         """
         self.robot = robot
-        self.db_handle.update_robot(self.name, self.robot.build, self.robot.name)
+        await self.db_handle.run(self.db_handle.update_robot,
+                                 self.name, self.robot.build, self.robot.name)
+        if self.on_write:
+            self.on_write(self.name, robot=robot.build, robot_name=robot.name)
 
-    def get_btc(self, amount: int) -> None:
-        """Add provided amount to balance."""
-        print(f'$$$ {amount} BTC earned!')
-        sleep(2)
-        self.set_balance(self.balance + amount)
+    async def record_fight(self, outcome: str, reward: int = 0) -> None:
+        """
+        Record the fight outcome in user stats.
 
-    def pay_btc(self, amount: int) -> bool:
+        The reward is added to balance in the same DB transaction.
+        """
+        if reward:
+            echo(f'$$$ {reward} BTC earned!')
+            await pace(2)
+        balance = await self.db_handle.run(self.db_handle.record_fight,
+                                           self.name, outcome, reward)
+        if balance is not None:
+            await self.set_balance(balance)
+
+    async def pay_btc(self, amount: int) -> bool:
         """
         Subtract provided amount from balance.
 
         Return bool (False if balance insufficient).
         """
-        if amount > self.balance:
-            print('$$$ Insufficient funds :(')
-            sleep(1)
+        if not await self.change_balance(-amount, 'purchase', show=False):
+            echo('$$$ Insufficient funds :(')
+            await pace(1)
             return False
-        print(f'$$$ {amount} BTC paid.')
-        sleep(1)
-        self.set_balance(self.balance - amount)
+        echo(f'$$$ {amount} BTC paid.')
+        await pace(1)
+        echo(self.get_balance())
         return True
 
-    def buy_robot(self, robot_shop: RobotShop) -> None:
+    async def buy_robot(self, robot_shop: RobotShop) -> None:
         """
         Function for buying a new robot.
 
         Enter robot shop, evaluate selection,
         pay for the robot and set the robot to the user.
         """
-        robot_build_data = robot_shop.select_build()
+        robot_build_data = await robot_shop.select_build()
         if not robot_build_data:
             return
         while True:
-            name = str(input('Name your robot: '))
+            name = await ask('Name your robot: ')
             if len(name) not in range(1,16):
-                print('Name must be 1 to 15 characters long.\n')
-                sleep(.5)
+                echo('Name must be 1 to 15 characters long.\n')
+                await pace(.5)
                 continue
             break
 
         robot = Robot(name, robot_build_data)
-        self.pay_btc(robot.cost)
-        self.set_robot(robot)
-        sleep(2)
+        if await self.pay_btc(robot.cost):
+            await self.set_robot(robot)
+        await pace(2)
 
 
 class PwdManager:
-    def get_password(self) -> str:
+    """
+    Password hashing with bcrypt in the shared worker pool.
+
+    Cost is calibrated on first use and stored in the local config.
+    Hashing and checking are awaitable, the event loop is never blocked.
+    """
+
+    def __init__(self, cost: Optional[int] = None) -> None:
+        self._cost = cost
+
+    @property
+    def cost(self) -> int:
+        """Return bcrypt cost of new hashes."""
+        if self._cost is None:
+            self._cost = load_config().get('bcrypt_cost')
+            if self._cost is None:
+                self._cost = calibrate_cost()
+                update_config(bcrypt_cost=self._cost)
+        return self._cost
+
+    async def get_password(self) -> bytes:
         """
         Prompt for new password.
 
-        Using getpass. Return hashed pwd.
+        Typed without echo. Return hashed pwd.
         """
         while True:
-            pwd = str(getpass('Enter password for new user: '))
-            confirm = str(getpass('Confirm the password for new user: '))
+            pwd = await ask_secret('Enter password for new user: ')
+            confirm = await ask_secret('Confirm the password for new user: ')
             if pwd != confirm:
-                print('Passwords does not match!\n')
-                sleep(2)
+                echo('Passwords does not match!\n')
+                await pace(2)
                 continue
             break
-        return self._get_hash(pwd)
+        return await self.hash_password(pwd)
+
+    async def eval_match(self, pwd_hash: bytes,
+                         on_rehash: Optional[Callable[[bytes], Awaitable[None]]] = None
+                         ) -> bool:
+        """
+        Ask for pwd and return True if pwd match the hash from DB.
+
+        On match, a hash with outdated cost is rehashed and handed to on_rehash.
+        """
+        pwd = await ask_secret()
+        if not await self.check_password(pwd, pwd_hash):
+            return False
+        if on_rehash and self.needs_rehash(pwd_hash):
+            await on_rehash(await self.hash_password(pwd))
+        return True
 
-    def eval_match(self, username: str, db_handle: DBHandler) -> bool:
-        """Ask for pwd and return True if pwd match the one from DB."""
-        return bcrypt.checkpw(getpass().encode('utf-8'),
-                              db_handle.get_pwdhash(username))
+    def hash_password(self, pwd: str) -> 'asyncio.Future[bytes]':
+        """Return future of salted pwd hash."""
+        return asyncio.wrap_future(get_hash_pool().submit(self._get_hash, pwd))
 
-    def _get_hash(self, string: str) -> str:
-        """Return generated hash with salt."""
+    def check_password(self, pwd: str, pwd_hash: bytes) -> 'asyncio.Future[bool]':
+        """Return future of True if pwd match the hash."""
+        return asyncio.wrap_future(get_hash_pool().submit(bcrypt.checkpw,
+                                                          pwd.encode('utf-8'), pwd_hash))
+
+    def needs_rehash(self, pwd_hash: bytes) -> bool:
+        """Return True if the hash was made with lower than current cost."""
+        return hash_cost(pwd_hash) < self.cost
+
+    def _get_hash(self, string: str) -> bytes:
+        """Return generated hash with salt, run in the pool (calibrating if needed)."""
         bytes_string = string.encode('utf-8')
-        salt = bcrypt.gensalt()
+        salt = bcrypt.gensalt(self.cost)
         return bcrypt.hashpw(bytes_string, salt)
 
 
@@ -151,75 +251,106 @@ class UserManager:
         self.db_handle = db_handler
         self.pwd_manager = pwd_manager
         self.robot_manager = robot_manager
+        # Identity map of user records read from DB, by name.
+        self.records: Dict[str, UserRecord] = {}
+
+    async def get_record(self, username: str, fresh: bool = False) -> Optional[UserRecord]:
+        """
+        Return user record, from DB only if not cached yet or fresh one is asked for.
 
-    def read_username(self) -> User:
-        """Prompt for username and return User instance."""
+        Other processes sharing the DB write to users too, the record
+        is read fresh on login, so the session starts from the DB state.
+        """
+        if fresh or username not in self.records:
+            self.records.pop(username, None)
+            if not (record := await self.db_handle.run(self.db_handle.get_user, username)):
+                return None
+            self.records[username] = record
+        return self.records[username]
+
+    async def update_pwd(self, username: str, pwd_hash: bytes) -> None:
+        """Store new pwd hash of the user."""
+        await self.db_handle.run(self.db_handle.update_pwd, username, pwd_hash)
+        self.refresh(username, pwd=pwd_hash)
+
+    def refresh(self, username: str, **columns: Any) -> None:
+        """Update cached record of the user with the columns as written to DB."""
+        if username in self.records:
+            self.records[username] = replace(self.records[username], **columns)
+
+    async def read_username(self, username: Optional[str] = None) -> User:
+        """Prompt for username and return User instance, unless the first one is given."""
         while True:
-            if not (username := input('If you have a user, enter you username, '
-                            'otherwise press Enter to create a user:\n')):
-                self.current_user = self.create_new_user()
-                return self.current_user
-            if not self.db_handle.user_exists(username):
-                print(f'User with name "{username}" does not exist.\n')
-                sleep(.5)
+            if username is None:
+                username = await ask(USERNAME_PROMPT)
+            if not username:
+                return await self.create_new_user()
+            if not (record := await self.get_record(username, fresh=True)):
+                echo(f'User with name "{username}" does not exist.\n')
+                await pace(.5)
+                username = None
                 continue
 
-            self.current_user = self.load_existing_user(username)
-            return self.current_user
+            return await self.load_existing_user(record)
 
-    def create_new_user(self) -> User:
+    async def create_new_user(self) -> User:
         """Return a new user user instance."""
         while True:
-            if not (username := str(input('Enter username for new user: '))):
-                print('Username invalid.')
+            if not (username := await ask('Enter username for new user: ')):
+                echo('Username invalid.')
                 continue
-            if self.db_handle.user_exists(username):
-                print(f'User with name {username} already exists.')
+            if await self.get_record(username):
+                echo(f'User with name {username} already exists.')
                 continue
             break
 
-        password = self.pwd_manager.get_password()
-        self.db_handle.create_user(username, password)
-        user = User(username, self.db_handle, None)
-        self.new_user_procedure(user)
+        password = await self.pwd_manager.get_password()
+        await self.db_handle.run(self.db_handle.create_user, username, password)
+        user = User(username, self.db_handle, None, on_write=self.refresh)
+        await self.new_user_procedure(user)
         return user
 
-    def load_existing_user(self, username: str) -> User:
+    async def load_existing_user(self, record: UserRecord) -> User:
         """
         Return existing user instance.
 
         Authenticate existing user,
-        instantiate user object from dict.
+        instantiate user object from record.
         """
         access = False
         while not access:
-            if not (access := self.pwd_manager.eval_match(username, self.db_handle)):
-                print(':-(')
-
-        print('<-- ACCESS GRANTED -->')
-        sleep(1)
-        user_data = self.db_handle.get_user_data(username)
-        # TODO - fail to load when no robot at the start of game
-        return User.init_from_dict(user_data,
-            self.db_handle,
-            Robot(user_data['robot_name'],
-                  self.robot_manager.get_build_data(user_data['robot'])))
+            if not (access := await self.pwd_manager.eval_match(
+                    record.pwd, lambda pwd_hash: self.update_pwd(record.name, pwd_hash))):
+                echo(':-(')
+
+        echo('<-- ACCESS GRANTED -->')
+        await pace(1)
+        # Robot is missing if the user left the shop before buying the first one.
+        robot = (Robot(record.robot_name, self.robot_manager.get_build_spec(record.robot))
+                 if record.robot in self.robot_manager.specs else None)
+        user = User.init_from_record(record, self.db_handle, robot, self.refresh)
+        await self.buy_first_robot(user)
+        return user
 
-    def new_user_procedure(self, user: User) -> None:
+    async def new_user_procedure(self, user: User) -> None:
         """
         Sequence to start if user is new.
 
         Grant starting BTC to balance, calls purchase robot func.
         """
         clear_console()
-        print('It seems you are new here.')
-        sleep(1)
-        print('You were granted 300 bitcoins for a start, use them wisely!\n')
-        user.set_balance(300, show=False)
-        sleep(2)
+        echo('It seems you are new here.')
+        await pace(1)
+        echo(f'You were granted {STARTING_GRANT} bitcoins for a start, use them wisely!\n')
+        await user.change_balance(STARTING_GRANT, 'starting grant', show=False)
+        await pace(2)
+        await self.buy_first_robot(user)
+
+    async def buy_first_robot(self, user: User) -> None:
+        """Keep the user in the robot shop until they own a robot."""
         while not user.robot:
-            user.buy_robot(RobotShop(self.robot_manager, user.get_balance_int()))
+            await user.buy_robot(RobotShop(self.robot_manager, user.get_balance_int()))
             if not user.robot:
                 clear_console()
-                print('You have to buy your first robot!')
-                sleep(3)
+                echo('You have to buy your first robot!')
+                await pace(3)
@@ -1,7 +1,14 @@
+import asyncio
 import os
-from dataclasses import dataclass
-from time import sleep
-from typing import Any, List, Tuple
+import re
+import shutil
+import sys
+import threading
+from abc import ABC, abstractmethod
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from getpass import getpass
+from typing import Any, Awaitable, Callable, Iterable, List, Optional, Tuple, TypeVar
 
 THEME_TITLE: Tuple = (
 '##########################################################\n',
@@ -25,38 +32,375 @@ THEME_TITLE: Tuple = (
 '                                               by PyKovacs'
 )
 
+USERNAME_PROMPT = ('If you have a user, enter you username, '
+                   'otherwise press Enter to create a user:\n')
+
+Result = TypeVar('Result')
+
+
+class PacingClock:
+    """
+    Clock pacing the game, every dramatic pause goes through it.
+
+    Factor 1 is real time, other positive factor scales the pauses,
+    0 is virtual time - nothing waits, paused time is only counted.
+    """
+
+    def __init__(self, factor: float = 1.0) -> None:
+        self.factor = factor
+        self.elapsed = 0.0
+
+    @property
+    def virtual(self) -> bool:
+        """Return True if the clock never waits."""
+        return not self.factor
+
+    async def sleep(self, seconds: float) -> None:
+        """Pause for seconds scaled by factor, count them as elapsed."""
+        self.elapsed += seconds
+        if self.factor:
+            await asyncio.sleep(seconds * self.factor)
+
+
+_clock = PacingClock()
+
+
+def get_clock() -> PacingClock:
+    """Return the pacing clock in use."""
+    return _clock
+
+
+def set_clock(clock: PacingClock) -> None:
+    """Inject pacing clock used by the whole game."""
+    global _clock
+    _clock = clock
+
+
+# Seconds between checks for a key where the terminal cannot be watched.
+KEY_POLL_INTERVAL = 0.05
+
+# ANSI control sequences of the fight screen.
+CLEAR_SCREEN = '\033[2J\033[H'
+CLEAR_LINE = '\033[2K'
+SAVE_CURSOR = '\0337'
+RESTORE_CURSOR = '\0338'
+RESET_SCROLL_REGION = '\033[r'
+
+
+class SessionClosed(Exception):
+    """Player left the game - quit, or the input was closed."""
+
+
+class Console(ABC):
+    """
+    Terminal of one game session, all the game I/O goes through it.
+
+    The console of the running session is kept in a context variable,
+    so every asyncio task (session) has its own. Pauses go through
+    its clock, the global pacing clock unless one is given.
+    """
+    ansi = False
+
+    def __init__(self, clock: Optional[PacingClock] = None) -> None:
+        self._clock = clock
+
+    @property
+    def clock(self) -> PacingClock:
+        return self._clock or _clock
+
+    @property
+    def rows(self) -> int:
+        """Return height of the terminal."""
+        return 24
+
+    @abstractmethod
+    def write(self, text: str) -> None:
+        """Write the text without waiting."""
+
+    def write_wire(self, data: bytes) -> None:
+        """Write text already encoded for telnet, UTF-8 with CRLF line ends."""
+        self.write(data.decode('utf-8').replace('\r\n', '\n'))
+
+    @abstractmethod
+    async def read_line(self, prompt: str = '') -> str:
+        """Write the prompt and return line typed, raise SessionClosed on end of input."""
+
+    async def read_secret(self, prompt: str = 'Password: ') -> str:
+        """Return line typed without echo."""
+        return await self.read_line(prompt)
+
+    async def drain(self) -> None:
+        """Wait until written output is sent."""
+
+    async def wait_key(self) -> None:
+        """Return when a key is pressed, the key is consumed. Never if keys cannot be told."""
+        await asyncio.get_running_loop().create_future()
+
+    def clear(self) -> None:
+        """Clear the screen."""
+        if self.ansi:
+            self.write(CLEAR_SCREEN)
+
+
+class StdioConsole(Console):
+    """Local terminal, input is read by a daemon thread not to block the event loop."""
+
+    @property
+    def ansi(self) -> bool:  # type: ignore[override]
+        return os.name == 'posix' and sys.stdout.isatty()
+
+    @property
+    def rows(self) -> int:
+        return shutil.get_terminal_size().lines
+
+    def write(self, text: str) -> None:
+        sys.stdout.write(text)
+        sys.stdout.flush()
+
+    async def read_line(self, prompt: str = '') -> str:
+        return await self._read(input, prompt)
+
+    async def read_secret(self, prompt: str = 'Password: ') -> str:
+        return await self._read(getpass, prompt)
+
+    async def wait_key(self) -> None:
+        """Watch the terminal for a key, unbuffered (cbreak) meanwhile."""
+        if not sys.stdin.isatty():
+            await super().wait_key()
+        elif os.name == 'nt':
+            import msvcrt
+            while not msvcrt.kbhit():
+                await asyncio.sleep(KEY_POLL_INTERVAL)
+            msvcrt.getwch()
+        else:
+            import termios
+            import tty
+            fd = sys.stdin.fileno()
+            attributes = termios.tcgetattr(fd)
+            loop = asyncio.get_running_loop()
+            pressed: asyncio.Future = loop.create_future()
+            tty.setcbreak(fd)
+            loop.add_reader(fd, lambda: pressed.done() or pressed.set_result(None))
+            try:
+                await pressed
+                os.read(fd, 64)
+            finally:
+                loop.remove_reader(fd)
+                termios.tcsetattr(fd, termios.TCSADRAIN, attributes)
+
+    def clear(self) -> None:
+        if os.name == 'nt':
+            os.system('cls')
+        else:
+            super().clear()
+
+    @staticmethod
+    async def _read(read: Callable[[str], str], prompt: str) -> str:
+        """Return result of blocking read run in a daemon thread."""
+        loop = asyncio.get_running_loop()
+        future: asyncio.Future = loop.create_future()
+
+        def deliver(line: Optional[str]) -> None:
+            if future.done():
+                return
+            if line is None:
+                future.set_exception(SessionClosed())
+            else:
+                future.set_result(line)
+
+        def reader() -> None:
+            try:
+                line: Optional[str] = read(prompt)
+            except EOFError:
+                line = None
+            loop.call_soon_threadsafe(deliver, line)
+
+        threading.Thread(target=reader, daemon=True).start()
+        return await future
+
+
+# Telnet: IAC WILL/WONT ECHO - server echoes (nothing), client stops local echo.
+TELNET_ECHO_OFF = b'\xff\xfb\x01'
+TELNET_ECHO_ON = b'\xff\xfc\x01'
+TELNET_COMMAND = re.compile(rb'\xff[\xfb-\xfe].|\xff[\xf0-\xfa]')
+
+
+class StreamConsole(Console):
+    """Remote telnet-style terminal over asyncio streams."""
+    ansi = True
+
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter,
+                 clock: Optional[PacingClock] = None) -> None:
+        super().__init__(clock)
+        self.reader = reader
+        self.writer = writer
+
+    def write(self, text: str) -> None:
+        if not self.writer.is_closing():
+            self.writer.write(text.replace('\n', '\r\n').encode('utf-8'))
+
+    def write_wire(self, data: bytes) -> None:
+        if not self.writer.is_closing():
+            self.writer.write(data)
+
+    async def read_line(self, prompt: str = '') -> str:
+        self.write(prompt)
+        await self.drain()
+        try:
+            line = await self.reader.readline()
+        except (ValueError, ConnectionError) as emsg:
+            raise SessionClosed() from emsg
+        if not line:
+            raise SessionClosed()
+        return TELNET_COMMAND.sub(b'', line).decode('utf-8', 'ignore').strip('\r\n')
+
+    async def read_secret(self, prompt: str = 'Password: ') -> str:
+        self.writer.write(TELNET_ECHO_OFF)
+        try:
+            return await self.read_line(prompt)
+        finally:
+            self.writer.write(TELNET_ECHO_ON)
+            self.write('\n')
+
+    async def wait_key(self) -> None:
+        """Return when a line is sent, telnet clients in line mode send keys on Enter."""
+        try:
+            await self.reader.readline()
+        except (ValueError, ConnectionError):
+            pass
+
+    async def drain(self) -> None:
+        try:
+            await self.writer.drain()
+        except ConnectionError as emsg:
+            raise SessionClosed() from emsg
+
+
+class ScriptedConsole(Console):
+    """Console typing scripted lines and capturing the output, for bots and tests."""
+
+    def __init__(self, lines: Iterable[str] = (),
+                 clock: Optional[PacingClock] = None) -> None:
+        super().__init__(clock)
+        self.lines = iter(lines)
+        self.output: List[str] = []
+
+    def write(self, text: str) -> None:
+        self.output.append(text)
+
+    async def read_line(self, prompt: str = '') -> str:
+        self.write(prompt)
+        try:
+            return next(self.lines)
+        except StopIteration:
+            raise SessionClosed() from None
+
+    def text(self) -> str:
+        """Return everything written so far."""
+        return ''.join(self.output)
+
+
+_console: ContextVar[Console] = ContextVar('console', default=StdioConsole())
+
+
+def get_console() -> Console:
+    """Return console of the current session."""
+    return _console.get()
+
+
+def set_console(console: Console) -> None:
+    """Use the console for the current session (asyncio task)."""
+    _console.set(console)
+
+
+async def with_console(console: Console, session: Awaitable[Result]) -> Result:
+    """Await the session (coroutine) running on the console."""
+    set_console(console)
+    return await session
+
+
+def echo(*values: Any, sep: str = ' ', end: str = '\n') -> None:
+    """Print the values to the console of the current session."""
+    _console.get().write(sep.join(map(str, values)) + end)
+
+
+async def ask(prompt: str = '') -> str:
+    """Return line typed to the console of the current session."""
+    return await _console.get().read_line(prompt)
+
+
+async def ask_secret(prompt: str = 'Password: ') -> str:
+    """Return line typed without echo to the console of the current session."""
+    return await _console.get().read_secret(prompt)
+
+
+async def pace(seconds: float) -> None:
+    """Pause the game for seconds on the session clock, output is sent meanwhile."""
+    console = _console.get()
+    await console.drain()
+    await console.clock.sleep(seconds)
+
+
 def clear_console() -> None:
     """Clear the console."""
-    if os.name == 'posix':
-        os.system('clear')
-    elif os.name == 'nt':
-        os.system('cls')
+    _console.get().clear()
+
 
-def drama_print(text: str, delay: float = 0.05) -> None:
-    """Print the text with sleep between characters."""
+async def drama_print(text: str, delay: float = 0.05) -> None:
+    """Print the text with pause between characters."""
+    console = _console.get()
+    if console.clock.virtual:
+        console.write(text + '\n')
+        await console.clock.sleep(delay * len(text))
+        return
     for char in text:
-        print(char, end="", flush=True)
-        sleep(delay)
-    print()
-  
-def theme() -> None:
-    """Theme show at the beginning of the game."""
+        console.write(char)
+        await pace(delay)
+    console.write('\n')
+
+
+async def skippable(show: Awaitable[None]) -> bool:
+    """Run the show until it ends or a key is pressed, return True if skipped."""
+    console = _console.get()
+    show_task = asyncio.ensure_future(show)
+    key = asyncio.ensure_future(console.wait_key())
+    await asyncio.wait((show_task, key), return_when=asyncio.FIRST_COMPLETED)
+    show_task.cancel()
+    key.cancel()
+    # Cancelled tasks are awaited, so the terminal is restored before going on.
+    for result in await asyncio.gather(show_task, key, return_exceptions=True):
+        if isinstance(result, Exception):
+            raise result
+    return key.done() and not key.cancelled()
+
+
+async def _animate_title(console: Console) -> None:
+    """Type the title out, slowing down towards the signature."""
+    pause = 0.008
+    for line in THEME_TITLE:
+        for char in line:
+            if char == 'b':
+                await pace(0.5)
+                pause = 0.1
+            console.write(char)
+            await pace(pause)
+        pause /= 1.15
+    console.write('\n')
+    await pace(3)
+
+
+async def theme() -> None:
+    """Theme show at the beginning of the game, any key skips it."""
+    console = _console.get()
     clear_console()
-    try:
-        sleep_time = 0.008
-        for line in THEME_TITLE:
-            for char in line:
-                if char == 'b':
-                    sleep(0.5)
-                    sleep_time = 0.1
-                print(char, end="", flush=True)
-                sleep(sleep_time)
-            sleep_time /= 1.15
-        sleep(3)
-    except KeyboardInterrupt:
-        pass
+    if console.clock.virtual:
+        console.write(''.join(THEME_TITLE) + '\n')
+        await pace(3)
+    else:
+        await skippable(_animate_title(console))
     clear_console()
 
+
 def safe_get(lst: List, idx: int, default: Any = '') -> Any:
     """
     Similar to dict .get func, return item from list,
@@ -69,14 +413,47 @@ def safe_get(lst: List, idx: int, default: Any = '') -> Any:
 
 
 @dataclass
-class FightRecorder:
-    records: str = ''
+class FightScreen:
+    """
+    Fight screen redrawn by diffs instead of clearing the console.
+
+    The banner is pinned at the top, the log scrolls below it in
+    a terminal scroll region. The last banner frame is kept and only
+    changed lines are rewritten in place, log lines are printed once
+    as they are recorded - so the redraw cost of a turn does not grow
+    with the fight. Without ANSI terminal the changed banner is printed.
+    """
+    console: Console = field(default_factory=get_console)
+    frame: List[str] = field(default_factory=list)
+
+    def draw(self, banner: str, records: Iterable[str] = ()) -> None:
+        """
+        Show the banner, rewriting only lines changed since the last frame.
 
-    def record_event(self, text: str, delay: float = 0.05) -> None:
-        """Print the text with delayed typing and record the text."""
-        self.records += text + '\n'
-        drama_print(text, delay)
+        Log lines recorded before the first frame are printed under it,
+        later ones are expected on the screen already, so records
+        are only consumed on the first frame.
+        """
+        lines = banner.rstrip('\n').split('\n')
+        if not self.console.ansi:
+            if lines != self.frame:
+                self.console.write(banner + '\n')
+        elif len(lines) != len(self.frame):
+            top = len(lines) + 2
+            rows = self.console.rows
+            self.console.write(f'{CLEAR_SCREEN}{banner}\n\033[{top};{rows}r'
+                               f'\033[{top};1H' + ''.join(line + '\n' for line in records))
+        else:
+            self.console.write(SAVE_CURSOR
+                               + ''.join(f'\033[{row};1H{CLEAR_LINE}{line}'
+                                         for row, (line, last)
+                                         in enumerate(zip(lines, self.frame), 1)
+                                         if line != last)
+                               + RESTORE_CURSOR)
+        self.frame = lines
 
-    def get_records(self) -> str:
-        """Display all the records from recorder."""
-        return self.records
+    def close(self) -> None:
+        """Release the scroll region, leaving the cursor under the log."""
+        if self.console.ansi and self.frame:
+            self.console.write(f'{RESET_SCROLL_REGION}\033[{self.console.rows};1H\n')
+        self.frame = []
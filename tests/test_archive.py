@@ -0,0 +1,51 @@
+import time
+
+from src import pit
+from src.archive import FightArchive
+from src.db import MEMORY_DB, DBHandler
+from src.events import FightLog
+from src.robots import Robot, RobotManager
+
+
+def _fight_log() -> FightLog:
+    robot_manager = RobotManager()
+    player = Robot('player', robot_manager.get_build_data('Heavy'))
+    opponent = Robot('opponent', robot_manager.get_build_data('Light'))
+    log = FightLog(('player', 'opponent'), (player.weapons, opponent.weapons))
+    pit.FightEngine(player, opponent, observer=pit.EventRecorder(player, opponent, log)).run()
+    return log
+
+
+def test_archive_batches_and_restores_fights() -> None:
+    """Test fights are written in batches and replayed event for event."""
+    archive = FightArchive(DBHandler(MEMORY_DB), batch_size=3)
+    conn = archive.conn
+    log = _fight_log()
+    archive.save('bob', 'Heavy', 'Light', 'win', log, played=1)
+    archive.save('bob', 'Heavy', 'Agile', 'loss', log, played=2)
+    assert conn.execute('SELECT COUNT(*) FROM fights').fetchone()[0] == 0
+
+    archive.save('ann', 'Heavy', 'Light', 'draw', log, played=3)
+    assert conn.execute('SELECT COUNT(*) FROM fights').fetchone()[0] == 3
+
+    archive.save('bob', 'Light', 'Light', 'win', log, played=4)
+    recent = archive.recent('bob')
+    assert [fight.played for fight in recent] == [4, 2, 1]
+    assert [fight.user for fight in archive.by_builds('Heavy', 'Light')] == ['ann', 'bob']
+
+    restored = archive.load(recent[0].fight_id)
+    assert restored and list(restored) == list(log)
+    assert restored.text() == log.text()
+    assert archive.load(999) is None
+
+
+def test_archive_flushed_after_interval() -> None:
+    """Test a fight short of the batch is written once the flush interval passes."""
+    archive = FightArchive(DBHandler(MEMORY_DB), batch_size=20, flush_interval=0.05)
+    archive.save('bob', 'Heavy', 'Light', 'win', _fight_log(), played=1)
+    deadline = time.monotonic() + 5
+    while archive.pending and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+    assert not archive.pending
+    assert archive.conn.execute('SELECT COUNT(*) FROM fights').fetchone()[0] == 1
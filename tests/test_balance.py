@@ -0,0 +1,40 @@
+import random
+
+from src import balance
+from src.robots import RobotManager
+
+
+def test_evaluation_stops_early_when_clearly_worse() -> None:
+    """Test candidate is cut short against a best loss it cannot reach."""
+    builds = RobotManager().builds
+    full = balance.evaluate(builds, 400, 100)
+    stopped = balance.evaluate(builds, 400, 100, best=0.0)
+
+    assert not full.stopped and sum(map(sum, full.counts.values())) == 2 * 20 * 400
+    assert stopped.stopped and sum(map(sum, stopped.counts.values())) == 2 * 20 * 100
+    assert full.loss(builds, balance.Z_SCORE) <= full.loss(builds)
+
+
+def test_mutation_keeps_attributes_in_bounds() -> None:
+    """Test mutated builds stay within limits and leave the original intact."""
+    builds = RobotManager().builds
+    rng = random.Random(3)
+    for _ in range(200):
+        candidate = balance.mutate(builds, rng, changes=5)
+        for data in candidate.values():
+            for attribute, (low, high, _) in balance.PARAMETERS.items():
+                assert low <= data[attribute] <= high
+    assert builds == RobotManager().builds
+
+
+def test_optimizer_caches_evaluations(tmp_path) -> None:
+    """Test rerun with the same seed reads every candidate from cache."""
+    builds = RobotManager().builds
+    cache_file = str(tmp_path / 'balance.json')
+    first = balance.BalanceOptimizer(builds, 200, 100, seed=1, cache_file=cache_file)
+    proposed, evaluation = first.optimize(generations=2, population=2, workers=2)
+    assert evaluation.loss(proposed) <= first.evaluate([builds])[0].loss(builds)
+
+    rerun = balance.BalanceOptimizer(builds, 200, 100, seed=1, cache_file=cache_file)
+    assert rerun.optimize(generations=2, population=2, workers=2)[0] == proposed
+    assert rerun.evaluated == 0
@@ -0,0 +1,35 @@
+from src import bench
+
+
+def test_failures_over_budget_and_regressed() -> None:
+    """Test runs fail over budget or slower than the baseline beyond tolerance."""
+    before = bench.BenchRun({'render.banner': 1e-5, 'db.get_user@10000': 1e-5})
+    run = bench.BenchRun({'render.banner': 1.2e-5, 'db.get_user@10000': 1e-3})
+
+    failed = run.failures(before)
+    assert len(failed) == 2
+    assert all(message.startswith('db.get_user@10000') for message in failed)
+    assert run.failures(before, tolerance=0.1)[0].startswith('render.banner')
+    assert 'BEFORE' in run.report(before) and '+20.0%' in run.report(before)
+
+
+def test_history_baseline_is_median(tmp_path) -> None:
+    """Test stored runs load back and the baseline is their median."""
+    history = str(tmp_path / 'history.jsonl')
+    for value in (1.0, 5.0, 2.0):
+        bench.save_run(bench.BenchRun({'startup.cold': value}, revision='abc'), history)
+
+    runs = bench.load_history(history)
+    assert [run.results['startup.cold'] for run in runs] == [1.0, 5.0, 2.0]
+    assert bench.baseline(runs).results == {'startup.cold': 2.0}  # type: ignore
+    assert bench.baseline([]) is None
+
+
+def test_benchmarks_measure_per_operation() -> None:
+    """Test a scaled down run covers every benchmark of the groups."""
+    run = bench.run_suite(['robot', 'render', 'db'], scale=0.001, sizes=[100])
+    assert set(run.results) == {'robot.use_weapon', 'robot.take_damage',
+                                'robot.affordable_weapons', 'robot.is_exhausted',
+                                'robot.reset', 'render.banner', 'render.showcase',
+                                'db.get_user@100', 'db.add_to_balance@100'}
+    assert all(value > 0 for value in run.results.values())
@@ -0,0 +1,45 @@
+import asyncio
+
+from src import pit
+from src.broadcast import FINAL_EVENTS, BroadcastSink, LiveFights, Overflow
+from src.events import FightLog
+from src.robots import Robot, RobotManager
+
+
+def test_fight_fanned_out_to_spectators() -> None:
+    """Test every spectator gets the same serialized events, slow ones skip or drop."""
+    robot_manager = RobotManager()
+    player = Robot('player', robot_manager.get_build_data('Heavy'))
+    opponent = Robot('opponent', robot_manager.get_build_data('Light'))
+    live_fights = LiveFights()
+    broadcast = live_fights.open('player vs opponent')
+
+    async def watch() -> None:
+        viewers = [broadcast.subscribe() for _ in range(2000)]
+        skipping = broadcast.subscribe(maxsize=4)
+        dropped = broadcast.subscribe(maxsize=4, overflow=Overflow.DISCONNECT)
+        log = FightLog(('player', 'opponent'), (player.weapons, opponent.weapons),
+                       [BroadcastSink(broadcast)])
+        pit.FightEngine(player, opponent,
+                        observer=pit.EventRecorder(player, opponent, log)).run()
+        live_fights.close(broadcast)
+
+        assert len(broadcast.history) == len(log) > 8
+        received = [data async for data in _events(viewers[-1])]
+        assert received == broadcast.history
+        assert all(data is sent for data, sent in zip(received, broadcast.history))
+        assert b''.join(received).decode('utf-8') == log.text().replace('\n', '\r\n')
+        late = [data async for data in _events(skipping)]
+        skipped = len(log) - 4 - FINAL_EVENTS
+        assert late[:4] == broadcast.history[:4]
+        assert late[4] == f'  ... {skipped} events skipped ...\r\n'.encode('utf-8')
+        assert late[5:] == broadcast.history[-FINAL_EVENTS:]
+        assert dropped.dropped and await dropped.get() is None
+        assert live_fights.get(broadcast.fight_id) is None
+
+    asyncio.run(watch())
+
+
+async def _events(subscriber):  # type: ignore
+    while (data := await subscriber.get()) is not None:
+        yield data
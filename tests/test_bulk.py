@@ -0,0 +1,68 @@
+import io
+
+import bcrypt  # type: ignore
+import pytest
+
+from src import bulk
+from src.db import MEMORY_DB, DBHandler
+
+BUILDS = ('Heavy', 'Light')
+HASH = bcrypt.hashpw(b'secret', bcrypt.gensalt(4)).decode()
+
+
+def test_import_batches_hashes_and_reports_invalid_rows() -> None:
+    """Test valid rows land in batches, plaintext is hashed and bad rows are counted."""
+    db_handler = DBHandler(MEMORY_DB)
+    rows = [{'name': f'user{idx}', 'pwd': HASH, 'robot': 'Heavy', 'robot_name': 'Tank',
+             'balance': idx} for idx in range(5)]
+    rows += [{'name': 'plain', 'password': 'hunter2'},
+             {'name': 'user0', 'pwd': HASH, 'balance': 99},
+             {'name': 'nopwd'}, {'name': 'bad', 'pwd': HASH, 'robot': 'Tank'}]
+    user_import = bulk.UserImport(db_handler, BUILDS, cost=4, workers=1, batch_size=2)
+    stats = user_import.run(rows)
+
+    assert (stats.read, stats.written, stats.hashed, stats.invalid) == (9, 6, 1, 2)
+    assert stats.errors == ['row 8: neither pwd nor password given',
+                            'row 9: unknown robot build Tank']
+    assert bcrypt.checkpw(b'hunter2', db_handler.get_pwdhash('plain'))
+    assert db_handler.get_user_data('user0')['balance'] == 0
+    assert db_handler.get_ledger_balance('user4') == 4
+
+
+def test_replace_records_balance_change_in_ledger() -> None:
+    """Test reimport overwrites users and the ledger still sums to the balance."""
+    db_handler = DBHandler(MEMORY_DB)
+    db_handler.create_user('bob', HASH)
+    db_handler.add_to_balance('bob', 300, 'grant')
+    bulk.UserImport(db_handler, BUILDS, replace=True).run(
+        [{'name': 'bob', 'pwd': HASH, 'robot': 'Light', 'balance': 120}])
+    assert db_handler.get_user_data('bob') == {'name': 'bob', 'robot': 'Light',
+                                               'robot_name': '', 'balance': 120}
+    assert db_handler.get_ledger_balance('bob') == 120
+
+
+def test_export_round_trip_in_both_formats() -> None:
+    """Test exported users import back unchanged."""
+    db_handler = DBHandler(MEMORY_DB)
+    bulk.UserImport(db_handler, BUILDS).run(
+        [{'name': 'bob', 'pwd': HASH, 'robot': 'Heavy', 'robot_name': 'Tank', 'balance': 7},
+         {'name': 'ann, "the" 2nd', 'pwd': HASH}])
+    for fmt in bulk.FORMATS:
+        exported = io.StringIO()
+        assert bulk.export_users(db_handler, exported, fmt) == 2
+        copy = DBHandler(MEMORY_DB)
+        exported.seek(0)
+        bulk.UserImport(copy, BUILDS).run(bulk.read_rows(exported, fmt))
+        assert list(copy.iter_users()) == list(db_handler.iter_users())
+
+
+def test_rows_before_malformed_line_are_written() -> None:
+    """Test a broken line ends the import with every row parsed before it written."""
+    db_handler = DBHandler(MEMORY_DB)
+    lines = [f'{{"name": "user{idx}", "pwd": "{HASH}"}}\n' for idx in range(30)]
+    source = io.StringIO(''.join(lines) + '{"name": "broken\n')
+    user_import = bulk.UserImport(db_handler, BUILDS, batch_size=20)
+    with pytest.raises(ValueError):
+        user_import.run(bulk.read_rows(source, 'jsonl'))
+    assert (user_import.stats.read, user_import.stats.written) == (30, 30)
+    assert db_handler.user_exists('user29')
@@ -0,0 +1,101 @@
+import multiprocessing
+
+from src.db import MEMORY_DB, RANKED_FIGHTS, DBHandler
+
+
+def test_db_handler_round_trip() -> None:
+    """Test user writes and reads on in-memory database."""
+    db_handler = DBHandler(MEMORY_DB)
+    db_handler.create_user('bob', 'hash')
+    db_handler.update_robot('bob', 'Heavy', 'Tank')
+    db_handler.add_to_balance('bob', 42, 'grant')
+
+    assert db_handler.user_exists('bob')
+    assert not db_handler.user_exists("bob' OR '1'='1")
+    assert db_handler.get_pwdhash('bob') == 'hash'
+    assert db_handler.get_user_data('bob') == {'name': 'bob', 'robot': 'Heavy',
+                                               'robot_name': 'Tank', 'balance': 42}
+
+
+def test_db_handler_file_uses_wal(tmp_path) -> None:
+    """Test file database is switched to WAL journal."""
+    db_handler = DBHandler(str(tmp_path / 'main.db'))
+    assert db_handler.conn.execute('PRAGMA journal_mode').fetchone()[0] == 'wal'
+
+
+def test_balance_never_negative() -> None:
+    """Test debit over the balance is refused and not recorded."""
+    db_handler = DBHandler(MEMORY_DB)
+    db_handler.create_user('bob', 'hash')
+    assert db_handler.add_to_balance('bob', 300, 'grant') == 300
+    assert db_handler.add_to_balance('bob', -301, 'purchase') is None
+    assert db_handler.add_to_balance('bob', -300, 'purchase') == 0
+    assert db_handler.get_ledger_balance('bob') == 0
+
+
+def test_fight_stats_and_reward_recorded() -> None:
+    """Test outcomes update stats and streaks, the reward lands in balance and ledger."""
+    db_handler = DBHandler(MEMORY_DB)
+    db_handler.create_user('bob', 'hash')
+    for outcome in ('win', 'win', 'loss', 'draw', 'win', 'win', 'win'):
+        db_handler.record_fight('bob', outcome, 10 if outcome == 'win' else 0)
+
+    stats = db_handler.get_stats('bob')
+    assert (stats.fights, stats.wins, stats.losses, stats.draws) == (7, 5, 1, 1)
+    assert (stats.streak, stats.best_streak, stats.earned) == (3, 3, 50)
+    assert db_handler.get_user_data('bob')['balance'] == db_handler.get_ledger_balance('bob') == 50
+    assert db_handler.get_stats('alice').fights == 0
+
+
+def test_reward_to_missing_user_not_paid() -> None:
+    """Test fight of a user missing from the users table pays and records no reward."""
+    db_handler = DBHandler(MEMORY_DB)
+    assert db_handler.record_fight('ghost', 'win', 10) is None
+    assert db_handler.get_ledger_balance('ghost') == 0
+    assert db_handler.get_stats('ghost').earned == 0
+
+
+def test_leaderboards_paged_by_keyset() -> None:
+    """Test pages follow each other in rank order without gaps or repeats."""
+    db_handler = DBHandler(MEMORY_DB)
+    for idx in range(25):
+        db_handler.create_user(f'user{idx}', 'hash')
+        db_handler.add_to_balance(f'user{idx}', idx % 7, 'grant')
+        for fight in range(RANKED_FIGHTS + idx % 3):
+            db_handler.record_fight(f'user{idx}', 'win' if fight < idx % 5 else 'loss')
+
+    ranked, after = [], None
+    while page := db_handler.top_by_balance(4, after):
+        ranked += page
+        after = (page[-1][1], page[-1][0])
+    assert ranked == sorted(ranked, key=lambda row: (row[1], row[0]), reverse=True)
+    assert len(ranked) == 25
+
+    stats, after = [], None
+    while stats_page := db_handler.top_by_win_rate(4, after):
+        stats += stats_page
+        after = (stats_page[-1].win_rate, stats_page[-1].user)
+    assert [entry.win_rate for entry in stats] == sorted(entry.win_rate for entry in stats)[::-1]
+    assert len({entry.user for entry in stats}) == 25
+
+
+def _earn(db_file: str, times: int) -> None:
+    db_handler = DBHandler(db_file)
+    for _ in range(times):
+        db_handler.add_to_balance('bob', 1, 'fight reward')
+
+
+def test_concurrent_writers_lose_no_update(tmp_path) -> None:
+    """Test processes sharing the db file increment balance without lost updates."""
+    db_file = str(tmp_path / 'main.db')
+    DBHandler(db_file).create_user('bob', 'hash')
+    workers = [multiprocessing.Process(target=_earn, args=(db_file, 50)) for _ in range(8)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+    db_handler = DBHandler(db_file)
+    assert all(worker.exitcode == 0 for worker in workers)
+    assert db_handler.get_user_data('bob')['balance'] == 400
+    assert db_handler.get_ledger_balance('bob') == 400
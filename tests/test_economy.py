@@ -0,0 +1,49 @@
+import numpy as np
+
+from src import economy
+from src.robots import RobotManager
+
+
+def make_economy(win_rate: float) -> economy.Economy:
+    """Return economy of three builds, every fight won with the same probability."""
+    costs = np.array([100, 200, 300])
+    return economy.Economy(['Cheap', 'Middle', 'Dear'], costs, costs // 5,
+                           np.full((3, 3), win_rate), grant=100)
+
+
+def test_simulated_economy_uses_payout_model() -> None:
+    """Test rewards follow the pit payout and odds are probabilities by build pair."""
+    robot_manager = RobotManager()
+    simulated = economy.Economy.simulated(robot_manager, fights=200, seed=1)
+    for build, cost, reward in zip(simulated.builds, simulated.costs, simulated.rewards):
+        assert cost == robot_manager.get_build_data(build)['cost']
+        assert reward == int((cost / 10) * 2)
+    assert simulated.win_rates.shape == (len(simulated.builds),) * 2
+    assert ((simulated.win_rates >= 0) & (simulated.win_rates <= 1)).all()
+
+
+def test_shops_buy_by_policy() -> None:
+    """Test what each shop buys with the balances given."""
+    cheap = make_economy(0.5)
+    balance = np.array([50, 150, 350, 350])
+    current = np.array([-1, -1, -1, 0])
+    assert economy.frugal_shop(cheap, balance, current).tolist() == [-1, 0, 0, 0]
+    assert economy.upgrading_shop(cheap, balance, current).tolist() == [-1, 0, 2, 2]
+    assert economy.saving_shop(cheap, balance, current).tolist() == [-1, 0, 2, 2]
+    assert economy.saving_shop(cheap, np.array([250]), np.array([0])).tolist() == [0]
+
+
+def test_careers_deterministic_and_sharded() -> None:
+    """Test careers follow the payouts and shards match for the same seed."""
+    always = economy.simulate_careers(make_economy(1.0), 50, 20, 'upgrade', seed=3)
+    assert (always.first_upgrade >= 0).all() and (always.top_build >= 0).all()
+    assert (always.final_build == 2).all()
+    never = economy.simulate_careers(make_economy(0.0), 50, 20, 'upgrade', seed=3)
+    assert (never.first_upgrade == -1).all() and (never.wealth[-1] == 0).all()
+
+    odds = make_economy(0.4)
+    first = economy.run_careers(odds, 100, 30, 'value', seed=5, shards=3, workers=2)
+    again = economy.run_careers(odds, 100, 30, 'value', seed=5, shards=3, workers=2)
+    assert first.wealth.shape == (economy.CHECKPOINTS + 1, 100)
+    assert (first.wealth == again.wealth).all()
+    assert 'first upgrade' in economy.report(odds, first, 30)
@@ -0,0 +1,42 @@
+import io
+
+from src import pit
+from src.events import (EventKind, FightLog, FileSink, OPPONENT, PLAYER,
+                        RingBufferSink)
+from src.robots import Robot, RobotManager
+
+
+def test_headless_fight_recorded_and_rendered() -> None:
+    """Test engine events are recorded in order and rendered lazily."""
+    robot_manager = RobotManager()
+    player = Robot('player', robot_manager.get_build_data('Heavy'))
+    opponent = Robot('opponent', robot_manager.get_build_data('Light'))
+    log = FightLog(('player', 'opponent'), (player.weapons, opponent.weapons))
+    result = pit.FightEngine(player, opponent,
+                             observer=pit.EventRecorder(player, opponent, log)).run()
+
+    events = list(log)
+    assert events[0] == (EventKind.ROUND_STARTED, PLAYER, 1)
+    assert sum(event.kind is EventKind.ROUND_STARTED for event in events) == result.rounds
+    assert events[1].kind in (EventKind.WEAPON_FIRED, EventKind.OUT_OF_ENERGY)
+    damage = sum(event.value for event in events
+                 if event.kind is EventKind.DAMAGED and event.side == OPPONENT)
+    assert damage == opponent.get_init_health() - opponent.health
+    assert log.text().startswith('-------- ROUND 1 --------\n')
+
+
+def test_sinks_stream_events() -> None:
+    """Test file and ring buffer sinks receive rendered events."""
+    out = io.StringIO()
+    ring = RingBufferSink(2)
+    log = FightLog(('A', 'B'), (('saw', 'laser'), ('spike',)), [FileSink(out), ring])
+    log.append(EventKind.ROUND_STARTED, PLAYER, 1)
+    log.append(EventKind.WEAPON_FIRED, PLAYER, 1)
+    log.append(EventKind.DAMAGED, OPPONENT, 6)
+    log.close()
+
+    assert out.getvalue() == ('-------- ROUND 1 --------\n'
+                              ' -> A loading laser ...\n'
+                              '  -> B took 6 points of damage !!!\n')
+    assert list(ring.lines()) == [' -> A loading laser ...',
+                                  '  -> B took 6 points of damage !!!']
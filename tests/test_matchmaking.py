@@ -0,0 +1,56 @@
+import random
+import sqlite3
+
+from src import matchmaking
+from src.matchmaking import BUILD, INITIAL_RATING, USER, Matchmaker, RatingIndex
+from src.robots import RobotManager
+
+
+def test_rating_index_stays_ordered(monkeypatch) -> None:
+    """Test moved ghosts keep the index sorted and picks stay in the window."""
+    monkeypatch.setattr(matchmaking, 'BLOCK_SIZE', 4)
+    rng = random.Random(7)
+    index = RatingIndex((float(rng.randrange(20)), ghost_id) for ghost_id in range(100))
+    ratings = {ghost_id: rating for rating, ghost_id in index}
+    for _ in range(2000):
+        ghost_id, new_rating = rng.randrange(100), float(rng.randrange(20))
+        index.move(ratings[ghost_id], new_rating, ghost_id)
+        ratings[ghost_id] = new_rating
+        assert abs(ratings[index.pick(10.0, rng, 1.0)] - 10.0) <= 1.0  # type: ignore
+
+    assert list(index) == sorted((rating, ghost_id) for ghost_id, rating in ratings.items())
+    assert len(index) == 100
+    assert index.pick(100.0, rng, 1.0) in ratings
+
+
+def test_ratings_updated_after_fight() -> None:
+    """Test win moves user and build ratings up, the ghost down, in db and index."""
+    matchmaker = Matchmaker(sqlite3.connect(':memory:'), RobotManager(random.Random(1)),
+                            ghosts=50)
+    ghost = matchmaker.find_opponent('bob')
+    assert len(matchmaker.load()) == 50
+
+    assert matchmaker.record('bob', 'Heavy', ghost, 1.0) > INITIAL_RATING
+    rating = matchmaker.ghost(ghost.ghost_id).rating
+    assert rating < ghost.rating
+    assert (rating, ghost.ghost_id) in list(matchmaker.load())
+    assert matchmaker.rating(USER, 'bob')[1] == 1
+    if ghost.build != 'Heavy':
+        assert matchmaker.rating(BUILD, 'Heavy')[0] > INITIAL_RATING
+        assert matchmaker.rating(BUILD, ghost.build)[0] < INITIAL_RATING
+
+
+def test_index_of_ghost_rated_by_another_process_read_again(tmp_path) -> None:
+    """Test ghost rated through another connection does not corrupt the stale index."""
+    db_file = str(tmp_path / 'main.db')
+    matchmaker = Matchmaker(sqlite3.connect(db_file), RobotManager(random.Random(1)), ghosts=50)
+    ghost = matchmaker.find_opponent('bob')
+    other = Matchmaker(sqlite3.connect(db_file), RobotManager(random.Random(2)), ghosts=50)
+    other.record('alice', 'Light', ghost, 1.0)
+
+    index = list(matchmaker.load())
+    assert not matchmaker.load().remove(ghost.rating, ghost.ghost_id + 1)
+    assert list(matchmaker.load()) == index
+    matchmaker.record('bob', 'Heavy', ghost, 1.0)
+    assert list(matchmaker.load()) == sorted(
+        matchmaker.conn.execute(f'SELECT rating, id FROM {matchmaking.GHOST_TABLE}'))
@@ -0,0 +1,80 @@
+import asyncio
+import time
+
+from src import metrics
+from src.db import MEMORY_DB, DBHandler
+
+
+def test_hot_paths_timed_only_when_enabled(monkeypatch) -> None:
+    """Test instrumented calls land in the registry and disable restores the originals."""
+    monkeypatch.setattr(metrics, 'registry', metrics.MetricsRegistry())
+    original = DBHandler.get_user
+    db_handler = DBHandler(MEMORY_DB)
+    metrics.enable()
+    try:
+        db_handler.create_user('bob', 'hash')
+        db_handler.get_user('bob')
+        db_handler.get_user('alice')
+    finally:
+        metrics.disable()
+    db_handler.get_user('bob')
+
+    assert DBHandler.get_user is original and not metrics.enabled()
+    assert metrics.registry.histograms['db', 'DBHandler.get_user'].count == 2
+    text = metrics.registry.to_prometheus()
+    assert '# TYPE cyberpit_db_seconds histogram' in text
+    assert 'cyberpit_db_seconds_bucket{op="DBHandler.get_user",le="+Inf"} 2' in text
+    assert 'cyberpit_db_seconds_count{op="DBHandler.create_user"} 1' in text
+
+
+def test_metrics_scraped_over_http(monkeypatch) -> None:
+    """Test the endpoint returns the registry in text format."""
+    monkeypatch.setattr(metrics, 'registry', metrics.MetricsRegistry())
+    metrics.registry.observe('turn', 'FightEngine.play_turn', 0.002)
+
+    async def scrape() -> bytes:
+        server = await metrics.serve_metrics('127.0.0.1', 0)
+        port = server.sockets[0].getsockname()[1]
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        writer.write(b'GET /metrics HTTP/1.0\r\n\r\n')
+        response = await reader.read()
+        writer.close()
+        server.close()
+        return response
+
+    response = asyncio.run(scrape())
+    assert response.startswith(b'HTTP/1.0 200 OK')
+    assert b'cyberpit_turn_seconds_bucket{op="FightEngine.play_turn",le="0.005"} 1' in response
+
+
+def test_profiler_samples_only_profiled_session() -> None:
+    """Test stacks are sampled while the session which turned profiling on runs."""
+    profiler = metrics.SamplingProfiler(interval=0.001)
+
+    def busy(seconds: float) -> None:
+        end = time.perf_counter() + seconds
+        while time.perf_counter() < end:
+            pass
+
+    def profiled_work() -> None:
+        busy(0.2)
+
+    def other_work() -> None:
+        busy(0.2)
+
+    async def profiled_session() -> None:
+        assert profiler.toggle()
+        await asyncio.sleep(0)
+        profiled_work()
+
+    async def other_session() -> None:
+        await asyncio.sleep(0)
+        other_work()
+
+    async def sessions() -> None:
+        await asyncio.gather(other_session(), profiled_session())
+
+    asyncio.run(sessions())
+    assert sum(profiler.samples.values()) > 10
+    assert 'test_metrics.py:profiled_work;test_metrics.py:busy' in profiler.folded()
+    assert 'other_work' not in profiler.folded()
@@ -0,0 +1,32 @@
+import numpy as np
+
+from src import odds, simulation
+from src.robots import RobotManager
+
+
+def test_solver_matches_simulation() -> None:
+    """Test exact odds agree with Monte Carlo rates of the same matchup."""
+    robot_manager = RobotManager()
+    simulator = simulation.MatchupSimulator(robot_manager, np.random.default_rng(2))
+    rates = simulator.outcome_matrix(50_000).rates()
+    builds = robot_manager.get_all_build_names()
+
+    for player, opponent in [('Heavy', 'Light'), ('Agile', 'Armed'), ('Focused', 'Focused')]:
+        exact = odds.MatchupSolver(robot_manager.get_build_data(player),
+                                   robot_manager.get_build_data(opponent)).solve()
+        row, col = builds.index(player), builds.index(opponent)
+        assert abs(exact.win + exact.draw + exact.loss - 1) < 1e-9
+        assert np.allclose(rates[row, col], [exact.win, exact.draw, exact.loss], atol=0.01)
+
+
+def test_get_odds_uses_disk_cache(tmp_path, monkeypatch) -> None:
+    """Test odds are stored to disk cache and read back from it."""
+    monkeypatch.setattr(odds, 'PATH_TO_ODDS_CACHE', str(tmp_path / 'odds.json'))
+    monkeypatch.setattr(odds, '_odds_cache', None)
+    robot_manager = RobotManager()
+    heavy, light = robot_manager.get_build_data('Heavy'), robot_manager.get_build_data('Light')
+    first = odds.get_odds(heavy, light)
+
+    monkeypatch.setattr(odds, '_odds_cache', None)
+    monkeypatch.setattr(odds.MatchupSolver, 'solve', None)
+    assert odds.get_odds(heavy, light) == first
@@ -0,0 +1,74 @@
+import asyncio
+import threading
+
+import pytest
+
+from src import odds, pit
+from src.robots import Robot, RobotManager, RobotShop
+from src.utils import PacingClock, ScriptedConsole, with_console
+
+
+@pytest.fixture
+def robot_manager() -> RobotManager:
+    return RobotManager()
+
+
+def test_fight_engine_result(robot_manager: RobotManager) -> None:
+    """Test headless fight ends with consistent structured result."""
+    player = Robot('player', robot_manager.get_build_data('Heavy'))
+    opponent = Robot('opponent', robot_manager.get_build_data('Light'))
+    result = pit.FightEngine(player, opponent).run()
+
+    assert result.rounds > 0
+    assert result.player_health == player.health
+    assert result.opponent_energy == opponent.energy
+    if result.outcome is pit.Outcome.DRAW:
+        assert player.is_exhausted() and opponent.is_exhausted()
+    else:
+        assert min(player.health, opponent.health) <= 0
+
+
+def test_fight_engine_rejects_unaffordable_weapon(robot_manager: RobotManager) -> None:
+    """Test policy picking a weapon without enough energy fails loudly."""
+    player = Robot('player', robot_manager.get_build_data('Heavy'))
+    opponent = Robot('opponent', robot_manager.get_build_data('Light'))
+    player.energy = 6
+
+    with pytest.raises(ValueError):
+        pit.FightEngine(player, opponent, lambda robot, enemy: 'flipper').run()
+
+
+def test_simulate_resets_robots(robot_manager: RobotManager) -> None:
+    """Test simulate counts every fight and leaves robots fresh."""
+    player = Robot('player', robot_manager.get_build_data('Focused'))
+    opponent = Robot('opponent', robot_manager.get_build_data('Agile'))
+    outcomes = pit.simulate(player, opponent, 100)
+
+    assert sum(outcomes.values()) == 100
+    assert player.health == player.get_init_health()
+    assert opponent.energy == opponent.get_init_energy()
+
+
+def test_odds_solved_off_event_loop(robot_manager: RobotManager, monkeypatch) -> None:
+    """Test odds shown before the fight and in the shop are solved in worker threads."""
+    threads = []
+
+    def get_odds(player, opponent):
+        threads.append(threading.current_thread())
+        return odds.MatchupOdds(0.5, 0.0, 0.5, 3.0)
+
+    monkeypatch.setattr(odds, 'get_odds', get_odds)
+    player = Robot('player', robot_manager.get_build_spec('Heavy'))
+    opponent = Robot('opponent', robot_manager.get_build_spec('Light'))
+    fight = pit.Fight(player, opponent, pit.RoundRunner())
+    shop = RobotShop(robot_manager, 0)
+    console = ScriptedConsole(['flee', 'cancel'], PacingClock(0))
+
+    async def session() -> None:
+        assert not await fight.accepted()
+        assert await shop.select_build() is None
+
+    asyncio.run(with_console(console, session()))
+    assert 'win 50.0%' in console.text()
+    assert len(threads) == 1 + len(robot_manager.get_all_build_names()) ** 2
+    assert threading.main_thread() not in threads
@@ -0,0 +1,58 @@
+import asyncio
+import threading
+
+import pytest
+
+from src import policies, strategy
+from src.robots import Robot, RobotManager
+from src.strategy import Difficulty
+from src.utils import PacingClock, ScriptedConsole, with_console
+
+
+@pytest.fixture
+def robot_manager() -> RobotManager:
+    return RobotManager()
+
+
+def test_greedy_and_conserving_choices(robot_manager: RobotManager) -> None:
+    """Test greedy picks the most damaging and conserving the cheapest weapon."""
+    robot = Robot('robot', robot_manager.get_build_spec('Heavy'))
+    enemy = Robot('enemy', robot_manager.get_build_spec('Light'))
+
+    assert policies.GreedyPolicy()(robot, enemy) == 'flipper'
+    assert policies.EnergyConservingPolicy()(robot, enemy) == 'bumper'
+    enemy.health = 5
+    assert policies.EnergyConservingPolicy()(robot, enemy) == 'laser'
+    robot.energy = 6
+    assert policies.GreedyPolicy()(robot, enemy) == 'laser'
+
+
+def test_human_policy_reprompts(robot_manager: RobotManager) -> None:
+    """Test human policy skips unknown and unaffordable weapons."""
+    robot = Robot('robot', robot_manager.get_build_spec('Heavy'))
+    robot.energy = 6
+    console = ScriptedConsole(['nonsense', 'flipper', 'Laser'], PacingClock(0))
+
+    assert asyncio.run(with_console(console, policies.HumanPolicy()(robot, robot))) == 'laser'
+    assert console.text().count('not enough energy') == 1
+
+
+def test_table_prepared_off_event_loop(robot_manager: RobotManager, tmp_path,
+                                       monkeypatch) -> None:
+    """Test table policy resolves the table in a worker thread, once per build pair."""
+    monkeypatch.setattr(strategy, 'PATH_TO_STRATEGY_CACHE', str(tmp_path))
+    threads = []
+
+    def get_table(player, opponent):
+        threads.append(threading.current_thread())
+        return real_get_table(player, opponent)
+
+    real_get_table = policies.get_table
+    monkeypatch.setattr(policies, 'get_table', get_table)
+    policy = policies.TablePolicy(Difficulty.HARD)
+    robot = Robot('robot', robot_manager.get_build_spec('Heavy'))
+    enemy = Robot('enemy', robot_manager.get_build_spec('Light'))
+    asyncio.run(policy.prepare(robot, enemy))
+
+    assert policy(robot, enemy) in robot.affordable_weapons()
+    assert len(threads) == 1 and threads[0] is not threading.main_thread()
@@ -16,3 +16,26 @@ def test_weapons_get_energy() -> None:
     with pytest.raises(AttributeError):
         assert robots.Weapons.get_energy(5)
         assert robots.Weapons.get_energy([0,1])
+
+
+def test_build_spec_compiles_weapon_energy() -> None:
+    """Test build spec resolves weapon energies once."""
+    spec = robots.RobotManager().get_build_spec('Heavy')
+
+    assert spec.weapon_energy == (6, 3, 7)
+    assert spec.energy_needed == 3
+    assert spec.affordable[5] == ('bumper',)
+    assert spec.affordable[spec.energy] == spec.weapons
+
+
+def test_robot_copy_is_independent() -> None:
+    """Test robot state is slotted and copies do not share health or energy."""
+    robot = robots.Robot('original', robots.RobotManager().get_build_spec('Light'))
+    clone = robot.copy()
+    clone.health -= 5
+    clone.use_weapon('spike')
+
+    assert not hasattr(robot, '__dict__')
+    assert robot.health == robot.get_init_health()
+    assert robot.energy == robot.get_init_energy()
+    assert clone.spec is robot.spec
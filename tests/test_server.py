@@ -0,0 +1,73 @@
+import asyncio
+
+from game import Game
+from src import config, odds, utils
+from src.db import MEMORY_DB
+from src.server import GameServer
+from src.users import PwdManager
+
+
+def test_concurrent_sessions(tmp_path, monkeypatch) -> None:
+    """Test telnet sessions play side by side on the shared game services."""
+    # Warm-up writes the hashing cost and the shop odds, keep them off the real data.
+    monkeypatch.setattr(config, 'PATH_TO_CONFIG', str(tmp_path / 'config.json'))
+    monkeypatch.setattr(odds, 'PATH_TO_ODDS_CACHE', str(tmp_path / 'odds.json'))
+    monkeypatch.setattr(odds, '_odds_cache', None)
+    game = Game(MEMORY_DB)
+    game.load()
+    # Cheap hashing set before the warm-up, so it does not calibrate bcrypt.
+    game.pwd_manager = game.user_manager.pwd_manager = PwdManager(cost=4)
+    previous = utils.get_clock()
+    utils.set_clock(utils.PacingClock(0))
+
+    async def client(port: int, name: str) -> str:
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        writer.write(f'\n{name}\npw\npw\nheavy\nTank\nquit\n'.encode())
+        output = await reader.read()
+        writer.close()
+        return output.decode('utf-8', 'ignore')
+
+    async def serve() -> list:
+        server = GameServer(game.play, port=0)
+        tcp_server = await asyncio.start_server(server.handle, '127.0.0.1', 0)
+        port = tcp_server.sockets[0].getsockname()[1]
+        async with tcp_server:
+            outputs = await asyncio.gather(*(client(port, f'player{idx}') for idx in range(5)))
+        assert server.sessions == 0
+        return outputs
+
+    try:
+        outputs = asyncio.run(serve())
+    finally:
+        utils.set_clock(previous)
+        game._warm_up.join()
+
+    assert all('300 BTC paid.' in output and 'MAIN MENU' in output for output in outputs)
+    for idx in range(5):
+        assert game.db_handler.get_user_data(f'player{idx}')['robot_name'] == 'Tank'
+
+
+def test_crashed_session_ends_alone(capsys) -> None:
+    """Test an error in one session is reported and closes only its connection."""
+    async def session() -> None:
+        if await utils.ask('') == 'crash':
+            raise RuntimeError('session bug')
+        utils.echo('still serving')
+
+    async def client(port: int, line: str) -> str:
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        writer.write(f'{line}\n'.encode())
+        output = await reader.read()
+        writer.close()
+        return output.decode()
+
+    async def serve() -> list:
+        server = GameServer(session, port=0)
+        tcp_server = await asyncio.start_server(server.handle, '127.0.0.1', 0)
+        port = tcp_server.sockets[0].getsockname()[1]
+        async with tcp_server:
+            return await asyncio.gather(client(port, 'crash'), client(port, 'play'))
+
+    crashed, served = asyncio.run(serve())
+    assert 'still serving' not in crashed and 'still serving' in served
+    assert 'RuntimeError: session bug' in capsys.readouterr().err
@@ -0,0 +1,37 @@
+import numpy as np
+
+from src import policies, simulation
+from src.robots import RobotManager
+
+
+def test_outcome_matrix_counts() -> None:
+    """Test every build pair gets the requested number of fights."""
+    simulator = simulation.MatchupSimulator(RobotManager(), np.random.default_rng(0))
+    matrix = simulator.outcome_matrix(50, batch_size=333)
+
+    assert matrix.counts.shape == (len(simulator.builds), len(simulator.builds), 3)
+    assert (matrix.counts.sum(axis=2) == 50).all()
+    assert np.allclose(matrix.rates().sum(axis=2), 1)
+
+
+def test_vectorized_matches_scalar_engine() -> None:
+    """Test vectorized simulator does not drift from headless pit engine."""
+    robot_manager = RobotManager()
+    simulator = simulation.MatchupSimulator(robot_manager, np.random.default_rng(1))
+    vectorized = simulator.outcome_matrix(20_000)
+    scalar = simulation.scalar_outcome_matrix(robot_manager, 2_000)
+
+    assert simulation.cross_check(vectorized, scalar) < 5
+
+
+def test_vectorized_policies_match_scalar_engine() -> None:
+    """Test batched policy choices do not drift from Policy.choose."""
+    robot_manager = RobotManager()
+    player_policy, opponent_policy = policies.GreedyPolicy(), policies.EnergyConservingPolicy()
+    simulator = simulation.MatchupSimulator(robot_manager, np.random.default_rng(3),
+                                            player_policy, opponent_policy)
+    vectorized = simulator.outcome_matrix(20_000)
+    scalar = simulation.scalar_outcome_matrix(robot_manager, 1_000,
+                                              player_policy, opponent_policy)
+
+    assert simulation.cross_check(vectorized, scalar) < 5
@@ -0,0 +1,32 @@
+import random
+
+from src import pit, policies, strategy
+from src.robots import Robot, RobotManager
+
+
+def test_hard_opponent_beats_random_opponent(tmp_path, monkeypatch) -> None:
+    """Test optimal strategy wins more often than random weapon picks."""
+    monkeypatch.setattr(strategy, 'PATH_TO_STRATEGY_CACHE', str(tmp_path))
+    robot_manager = RobotManager()
+    player = Robot('player', robot_manager.get_build_data('Agile'), random.Random(1))
+    opponent = Robot('opponent', robot_manager.get_build_data('Heavy'), random.Random(2))
+    easy = pit.simulate(player, opponent, 5000)
+    hard = pit.simulate(player, opponent, 5000,
+                        opponent_policy=policies.TablePolicy(strategy.Difficulty.HARD))
+
+    assert hard[pit.Outcome.LOSS] > easy[pit.Outcome.LOSS] + 500
+
+
+def test_table_is_cached_on_disk(tmp_path, monkeypatch) -> None:
+    """Test strategy table is saved compressed and loaded back unchanged."""
+    monkeypatch.setattr(strategy, 'PATH_TO_STRATEGY_CACHE', str(tmp_path))
+    monkeypatch.setattr(strategy, '_tables', {})
+    robot_manager = RobotManager()
+    light, armed = robot_manager.get_build_data('Light'), robot_manager.get_build_data('Armed')
+    computed = strategy.get_table(light, armed)
+
+    monkeypatch.setattr(strategy, '_tables', {})
+    loaded = strategy.get_table(light, armed)
+    assert loaded is not computed
+    assert loaded.table == computed.table
+    assert loaded.best_slot(15, 25, 15, 30) in range(3)
@@ -0,0 +1,24 @@
+from src import tournament
+from src.robots import RobotManager
+
+
+def test_shard_is_reproducible() -> None:
+    """Test shard result depends only on seed and shard."""
+    tournament._init_worker(RobotManager().builds)
+    shard = ('Heavy', 'Agile', 3, 500)
+
+    assert tournament.play_shard(7, shard) == tournament.play_shard(7, shard)
+    assert sum(tournament.play_shard(7, shard)[1]) == 500
+
+
+def test_tournament_resumes_from_checkpoint(tmp_path) -> None:
+    """Test finished tournament is loaded from checkpoint without pending shards."""
+    checkpoint = str(tmp_path / 'tournament.json')
+    builds = RobotManager().builds
+    first = tournament.Tournament(builds, 300, seed=1, shard_size=200, checkpoint=checkpoint)
+    first.run(workers=2)
+
+    resumed = tournament.Tournament(builds, 300, seed=1, shard_size=200, checkpoint=checkpoint)
+    assert not resumed.pending_shards()
+    assert resumed.pair_counts() == first.pair_counts()
+    assert all(sum(counts) == 300 for counts in resumed.pair_counts().values())
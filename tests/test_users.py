@@ -0,0 +1,101 @@
+import asyncio
+
+import pytest
+
+from src import users
+from src.db import MEMORY_DB, DBHandler
+from src.robots import Robot, RobotManager
+from src.users import PwdManager, User, UserManager
+from src.utils import PacingClock, ScriptedConsole, with_console
+
+
+@pytest.fixture
+def user_manager() -> UserManager:
+    db_handler = DBHandler(MEMORY_DB)
+    db_handler.create_user('bob', b'hash')
+    db_handler.update_robot('bob', 'Heavy', 'Tank')
+    return UserManager(db_handler, PwdManager(), RobotManager())
+
+
+def test_user_record_cached_until_written(user_manager: UserManager) -> None:
+    """Test repeated lookups skip DB and writes of the user drop the cached record."""
+    async def session() -> None:
+        record = await user_manager.get_record('bob')
+        assert record and record.pwd == b'hash' and record.robot == 'Heavy'
+        assert await user_manager.get_record('bob') is record
+        assert await user_manager.get_record('nobody') is None
+
+        user = User.init_from_record(record, user_manager.db_handle, None,  # type: ignore
+                                     user_manager.refresh)
+        await user.set_robot(Robot('Speedy',
+                                   user_manager.robot_manager.get_build_spec('Light')))
+        assert (await user_manager.get_record('bob')).robot == 'Light'  # type: ignore
+
+        await user.change_balance(300, 'grant', show=False)
+        assert (await user_manager.get_record('bob')).balance == 300  # type: ignore
+        assert (await user_manager.get_record('bob')).robot_name == 'Speedy'  # type: ignore
+
+    asyncio.run(with_console(ScriptedConsole(clock=PacingClock(0)), session()))
+
+
+def test_outdated_hash_rehashed_on_login() -> None:
+    """Test matching pwd with lower cost hash is rehashed with current cost."""
+    async def session() -> None:
+        old_hash = await PwdManager(cost=4).hash_password('secret')
+        pwd_manager = PwdManager(cost=5)
+        rehashed = []
+
+        async def on_rehash(pwd_hash: bytes) -> None:
+            rehashed.append(pwd_hash)
+
+        assert await pwd_manager.eval_match(old_hash, on_rehash)
+        assert users.hash_cost(rehashed[0]) == 5
+        assert await pwd_manager.check_password('secret', rehashed[0])
+        assert not pwd_manager.needs_rehash(rehashed[0])
+
+        assert not await pwd_manager.eval_match(old_hash, on_rehash)
+        assert len(rehashed) == 1
+
+    asyncio.run(with_console(ScriptedConsole(['secret', 'wrong']), session()))
+
+
+def test_calibrated_cost_in_bounds() -> None:
+    """Test calibration stays within allowed costs."""
+    assert users.calibrate_cost(0.0001) == users.MIN_HASH_COST
+    assert users.MIN_HASH_COST <= users.calibrate_cost() <= users.MAX_HASH_COST
+
+
+def test_user_without_robot_sent_to_shop_on_login(monkeypatch) -> None:
+    """Test user who left the shop before buying the first robot has to buy it on login."""
+    monkeypatch.setattr(users.RobotShop, '_get_odds_table', lambda self, builds: '')
+    db_handler = DBHandler(MEMORY_DB)
+    user_manager = UserManager(db_handler, PwdManager(cost=4), RobotManager())
+
+    async def session() -> User:
+        db_handler.create_user('eve', await user_manager.pwd_manager.hash_password('pw'))
+        db_handler.add_to_balance('eve', users.STARTING_GRANT, 'starting grant')
+        return await user_manager.read_username('eve')
+
+    console = ScriptedConsole(['pw', 'heavy', 'Tank'], PacingClock(0))
+    user = asyncio.run(with_console(console, session()))
+    assert user.robot and user.robot.build == 'Heavy'
+    assert db_handler.get_user_data('eve')['robot_name'] == 'Tank'
+
+
+def test_login_sees_writes_of_other_processes(tmp_path) -> None:
+    """Test user cached before another process wrote to it logs in with the DB state."""
+    db_file = str(tmp_path / 'main.db')
+    user_manager = UserManager(DBHandler(db_file), PwdManager(cost=4), RobotManager())
+    other = DBHandler(db_file)
+
+    async def session() -> User:
+        other.create_user('bob', await user_manager.pwd_manager.hash_password('pw'))
+        other.update_robot('bob', 'Heavy', 'Tank')
+        assert (await user_manager.get_record('bob')).balance == 0  # type: ignore
+        other.add_to_balance('bob', 500, 'import')
+        other.update_robot('bob', 'Light', 'Speedy')
+        return await user_manager.read_username('bob')
+
+    user = asyncio.run(with_console(ScriptedConsole(['pw'], PacingClock(0)), session()))
+    assert user.balance == 500 and user.robot and user.robot.name == 'Speedy'
+    assert user_manager.records['bob'].balance == 500
@@ -0,0 +1,71 @@
+import asyncio
+import time
+
+import pytest
+
+from src import utils
+
+
+@pytest.fixture
+def virtual_clock():
+    """Inject virtual pacing clock for the test."""
+    previous = utils.get_clock()
+    clock = utils.PacingClock(0)
+    utils.set_clock(clock)
+    yield clock
+    utils.set_clock(previous)
+
+
+def test_virtual_clock_counts_without_waiting(virtual_clock, capsys) -> None:
+    """Test virtual clock does not wait but keeps the paced time."""
+    async def show() -> None:
+        await utils.pace(3)
+        await utils.drama_print('LET THE SHOW BEGIN', 0.1)
+        await utils.theme()
+
+    start = time.perf_counter()
+    asyncio.run(show())
+
+    assert time.perf_counter() - start < 0.5
+    assert virtual_clock.elapsed == pytest.approx(3 + 1.8 + 3, abs=0.1)
+    assert 'LET THE SHOW BEGIN\n' in capsys.readouterr().out
+
+
+def test_theme_skipped_on_key() -> None:
+    """Test real time title animation ends as soon as a key is pressed."""
+    class KeyConsole(utils.ScriptedConsole):
+        async def wait_key(self) -> None:
+            await asyncio.sleep(0.05)
+
+    console = KeyConsole(clock=utils.PacingClock(1))
+    start = time.perf_counter()
+    asyncio.run(utils.with_console(console, utils.theme()))
+
+    assert time.perf_counter() - start < 1
+    assert 0 < len(console.text()) < len(''.join(utils.THEME_TITLE))
+
+
+def test_scaled_clock() -> None:
+    """Test scaled clock waits fraction of the paced time."""
+    clock = utils.PacingClock(0.01)
+    start = time.perf_counter()
+    asyncio.run(clock.sleep(2))
+
+    assert 0.015 < time.perf_counter() - start < 1
+    assert clock.elapsed == 2
+
+
+def test_fight_screen_rewrites_only_changed_lines() -> None:
+    """Test fight screen redraws changed banner lines in place, not the log."""
+    console = utils.ScriptedConsole()
+    console.ansi = True
+    screen = utils.FightScreen(console)
+    screen.draw('| A  B |\n| HP-[##] |\n', ['-- ROUND 1 --'])
+    first = console.text()
+    assert first.startswith(utils.CLEAR_SCREEN) and '-- ROUND 1 --' in first
+
+    console.output.clear()
+    screen.draw('| A  B |\n| HP-[#-] |\n', ['-- ROUND 1 --', 'long log'])
+    redraw = console.text()
+    assert redraw == (utils.SAVE_CURSOR + '\033[2;1H' + utils.CLEAR_LINE
+                      + '| HP-[#-] |' + utils.RESTORE_CURSOR)